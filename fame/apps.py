@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FameConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "fame"
+
+    def ready(self):
+        # connects the signals invalidating the cached reference tables:
+        from fame import reference_tables  # noqa: F401
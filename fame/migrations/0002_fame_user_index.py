@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fame',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
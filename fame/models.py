@@ -51,11 +51,9 @@ class FameLevels(models.Model):
     numeric_value = models.IntegerField(null=False)
 
     def get_next_lower_fame_level(self):
-        next_lower_fame = (
-            FameLevels.objects.filter(numeric_value__lt=self.numeric_value)
-            .order_by("-numeric_value")
-            .first()
-        )
+        from fame.reference_tables import fame_levels
+
+        next_lower_fame = fame_levels.next_lower(self.numeric_value)
         if next_lower_fame:
             return next_lower_fame
         else:
@@ -64,11 +62,9 @@ class FameLevels(models.Model):
             )
 
     def get_next_higher_fame_level(self):
-        next_higher_fame = (
-            FameLevels.objects.filter(numeric_value__gt=self.numeric_value)
-            .order_by("numeric_value")
-            .first()
-        )
+        from fame.reference_tables import fame_levels
+
+        next_higher_fame = fame_levels.next_higher(self.numeric_value)
         if next_higher_fame:
             return next_higher_fame
         else:
@@ -88,7 +84,8 @@ class Fame(models.Model):
     intermediary table between FameUsers and ExpertiseAreas.
     """
 
-    user = models.ForeignKey(FameUsers, on_delete=models.CASCADE)
+    # indexed by the unique index on (user, expertise_area):
+    user = models.ForeignKey(FameUsers, on_delete=models.CASCADE, db_index=False)
     expertise_area = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE)
     fame_level = models.ForeignKey(FameLevels, on_delete=models.CASCADE)
 
@@ -0,0 +1,134 @@
+"""In-process caches of small, rarely changing reference tables (fame levels, expertise areas, truth ratings).
+
+A table is loaded with a single query on first use and kept in memory until a row is saved or deleted through the
+ORM (including loaddata), which invalidates it and increments its version. As other processes cannot signal their
+changes, a cached table is also reloaded after settings.REFERENCE_TABLES_TTL seconds.
+Queryset update()/delete() and raw SQL bypass the signals: call invalidate() afterwards. Looking up a missing row by
+id reloads the table once before raising DoesNotExist.
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from fame.models import ExpertiseAreas, FameLevels
+
+
+class ReferenceTable:
+    """All rows of a model, ordered by the given fields."""
+
+    def __init__(self, model, ordering=("id",)):
+        self.model = model
+        self.ordering = ordering
+        self.version = 0
+        # (rows, rows by id, lookups of the subclass (see _lookups), load time), replaced as a whole:
+        self._loaded = None
+        post_save.connect(self.invalidate, sender=model, weak=False)
+        post_delete.connect(self.invalidate, sender=model, weak=False)
+
+    def invalidate(self, **kwargs):
+        self._loaded = None
+        self.version += 1
+
+    def _lookups(self, rows):
+        """Hook for subclasses to build additional lookup structures from the rows."""
+        return None
+
+    def _load(self, reload: bool = False):
+        """Get the loaded tuple, loads the table if it is not loaded, expired or reload is set. The tuple is built
+        completely before it replaces the previous one, so concurrent readers never mix the rows of two loads."""
+        loaded = self._loaded
+        if reload or loaded is None or time.monotonic() - loaded[3] > settings.REFERENCE_TABLES_TTL:
+            version = self.version
+            rows = tuple(self.model.objects.order_by(*self.ordering))
+            loaded = (rows, {row.id: row for row in rows}, self._lookups(rows), time.monotonic())
+            # not if invalidated while loading:
+            if self.version == version:
+                self._loaded = loaded
+        return loaded
+
+    def all(self):
+        """Get all rows as a tuple of model instances."""
+        return self._load()[0]
+
+    def get(self, id):
+        """Get the row with the given id, raises model.DoesNotExist like QuerySet.get. A missing row may have been
+        created by another process since the table was loaded, so the table is reloaded once before raising."""
+        row = self._load()[1].get(id)
+        if row is None:
+            row = self._load(reload=True)[1].get(id)
+        if row is None:
+            raise self.model.DoesNotExist(f"{self.model.__name__} with id {id} does not exist")
+        return row
+
+
+class FameLevelsTable(ReferenceTable):
+    """Fame levels as a ladder ordered by numeric value."""
+
+    def __init__(self):
+        super().__init__(FameLevels, ordering=("numeric_value", "id"))
+
+    def _lookups(self, rows):
+        # numeric values of the rows (for bisection), rows by name:
+        return [row.numeric_value for row in rows], {row.name: row for row in rows}
+
+    def get_by_name(self, name):
+        """Get the level with the given name, reloads the table once before raising FameLevels.DoesNotExist."""
+        level = self._load()[2][1].get(name)
+        if level is None:
+            level = self._load(reload=True)[2][1].get(name)
+        if level is None:
+            raise FameLevels.DoesNotExist(f"FameLevels with name {name} does not exist")
+        return level
+
+    def next_lower(self, numeric_value):
+        """Get the highest fame level below numeric_value, None if there is none."""
+        rows, _, (numeric_values, _), _ = self._load()
+        i = bisect_left(numeric_values, numeric_value)
+        return rows[i - 1] if i > 0 else None
+
+    def next_higher(self, numeric_value):
+        """Get the lowest fame level above numeric_value, None if there is none."""
+        rows, _, (numeric_values, _), _ = self._load()
+        i = bisect_right(numeric_values, numeric_value)
+        return rows[i] if i < len(rows) else None
+
+
+class ExpertiseAreasTable(ReferenceTable):
+    """Expertise areas with their paths in the hierarchy."""
+
+    def __init__(self):
+        super().__init__(ExpertiseAreas)
+
+    def _lookups(self, rows):
+        # paths by area id, each built from the path of the parent:
+        by_id = {row.id: row for row in rows}
+        paths = {}
+        for row in rows:
+            # the areas up to one whose path is known (or the root):
+            chain = []
+            area = row
+            while area is not None and area.id not in paths and area not in chain:
+                chain.append(area)
+                area = by_id.get(area.parent_expertise_area_id)
+            path = paths.get(area.id, []) if area is not None else []
+            for area in reversed(chain):
+                path = [(area.id, area.label), *path]
+                paths[area.id] = path
+        return paths
+
+    def path(self, id):
+        """Get the path [(id, label) of the area, its parent, ..., the root area] of the area with the given id, reloads
+        the table once before raising ExpertiseAreas.DoesNotExist."""
+        path = self._load()[2].get(id)
+        if path is None:
+            path = self._load(reload=True)[2].get(id)
+        if path is None:
+            raise ExpertiseAreas.DoesNotExist(f"ExpertiseAreas with id {id} does not exist")
+        return path
+
+
+fame_levels = FameLevelsTable()
+expertise_areas = ExpertiseAreasTable()
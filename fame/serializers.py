@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
 from fame.models import ExpertiseAreas, FameUsers, Fame
+from fame.reference_tables import expertise_areas
+from famesocialnetwork.profiling import ProfiledSerializerMixin
 
 
-class FameUsersSerializer(serializers.ModelSerializer):
+class FameUsersSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     fame = serializers.SerializerMethodField()
 
     class Meta:
@@ -15,21 +17,41 @@ class FameUsersSerializer(serializers.ModelSerializer):
         return ret
 
 
-class ExpertiseAreasSerializer(serializers.ModelSerializer):
+class ExpertiseAreasSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     parent_expertise_area = serializers.SerializerMethodField()
+    path = serializers.SerializerMethodField()
 
     class Meta:
         model = ExpertiseAreas
-        fields = ["label", "parent_expertise_area"]
+        fields = ["label", "parent_expertise_area", "path"]
+
+    def _path(self, expertise_area: ExpertiseAreas):
+        # the paths of all areas are built with the cached expertise areas (see fame/reference_tables.py):
+        try:
+            return expertise_areas.path(expertise_area.id)
+        except ExpertiseAreas.DoesNotExist:
+            return [(expertise_area.id, expertise_area.label)]
 
     def get_parent_expertise_area(self, expertise_area: ExpertiseAreas):
-        if expertise_area.parent_expertise_area is None:
-            return None
-        # recursion up to the root expertise area:
-        return ExpertiseAreasSerializer(expertise_area.parent_expertise_area).data
+        # nested up to the root expertise area:
+        return _nested_path(self._path(expertise_area)[1:])
+
+    def get_path(self, expertise_area: ExpertiseAreas):
+        """Labels of the area, its parent, ..., the root area."""
+        return [label for _, label in self._path(expertise_area)]
+
+
+def _nested_path(path):
+    if not path:
+        return None
+    return {
+        "label": path[0][1],
+        "parent_expertise_area": _nested_path(path[1:]),
+        "path": [label for _, label in path],
+    }
 
 
-class FameSerializer(serializers.ModelSerializer):
+class FameSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
 
     expertise_area = ExpertiseAreasSerializer()
     score = serializers.SerializerMethodField()
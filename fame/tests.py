@@ -3,7 +3,11 @@ from django.urls import reverse
 from rest_framework.utils import json
 
 from fame.models import ExpertiseAreas, Fame, FameLevels
-from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
+from fame.reference_tables import fame_levels
+from famesocialnetwork.library import (
+    test_paths_for_allowed_and_forbidden_users,
+    test_paths_within_query_budgets,
+)
 
 
 # Create your tests here.
@@ -38,6 +42,21 @@ class ViewExistsTests(TestCase):
         )
 
 
+class QueryBudgetTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_pages_within_budget(self):
+        test_paths_within_query_budgets(
+            self,
+            {
+                "/fame/api/expertise_areas": 4,
+                "/fame/api/users": 3,
+                "/fame/api/fame": 6,
+                "/fame/html/fame": 6,
+            },
+        )
+
+
 class ModelTests(TestCase):
     fixtures = ["database_dump.json"]
 
@@ -74,3 +93,41 @@ class ModelTests(TestCase):
             fl = FameLevels.objects.get(
                 name="Dangerous Bullshitter"
             ).get_next_lower_fame_level()
+
+
+class ReferenceTablesTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_cached_ladder_matches_database(self):
+        fame_levels.all()
+        with self.assertNumQueries(0):
+            for name in ["Jedi", "Newbie", "Confuser", "Dangerous Bullshitter"]:
+                level = fame_levels.get_by_name(name)
+                lower = fame_levels.next_lower(level.numeric_value)
+                higher = fame_levels.next_higher(level.numeric_value)
+                self.assertEqual(level.name, name)
+                self.assertTrue(lower is None or lower.numeric_value < level.numeric_value)
+                self.assertTrue(higher is None or higher.numeric_value > level.numeric_value)
+
+    def test_invalidated_on_save_and_delete(self):
+        version = fame_levels.version
+        level = FameLevels.objects.create(name="Grand Master", numeric_value=2000)
+        self.assertGreater(fame_levels.version, version)
+        self.assertEqual(
+            FameLevels.objects.get(name="Jedi").get_next_higher_fame_level(), level
+        )
+        level.delete()
+        with self.assertRaises(FameLevels.DoesNotExist):
+            fame_levels.get_by_name("Grand Master")
+
+    def test_get_reloads_on_miss(self):
+        fame_levels.all()
+        # created by another process, without invalidating the cache of this one:
+        self.addCleanup(fame_levels.invalidate)
+        FameLevels.objects.bulk_create([FameLevels(name="Grand Master", numeric_value=2000)])
+        level = FameLevels.objects.get(name="Grand Master")
+        with self.assertNumQueries(1):
+            self.assertEqual(fame_levels.get(level.id), level)
+        self.assertEqual(fame_levels.next_higher(FameLevels.objects.get(name="Jedi").numeric_value), level)
+        with self.assertNumQueries(1), self.assertRaises(FameLevels.DoesNotExist):
+            fame_levels.get(-1)
@@ -8,6 +8,7 @@ from fame.serializers import (
     ExpertiseAreasSerializer,
     FameSerializer,
 )
+from famesocialnetwork.db.routers import replica_reads
 from socialnetwork import api
 from socialnetwork.api import _get_social_network_user
 
@@ -16,6 +17,7 @@ class ExpertiseAreasApiView(APIView):
     # add permission to check if user is authenticated
     permission_classes = [permissions.IsAuthenticated]
 
+    @replica_reads
     def get(self, request, *args, **kwargs):
         posts = ExpertiseAreas.objects.all()
         serializer = ExpertiseAreasSerializer(posts, many=True)
@@ -39,6 +41,7 @@ class FameUsersApiView(APIView):
     # add permission to check if user is authenticated
     permission_classes = [permissions.IsAuthenticated]
 
+    @replica_reads
     def get(self, request, *args, **kwargs):
         posts = FameUsers.objects.all()
         serializer = FameUsersSerializer(posts, many=True)
@@ -53,6 +56,7 @@ class FameListApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     # 1. List all
+    @replica_reads
     def get(self, request, *args, **kwargs):
         user, _fame = api.fame(_get_social_network_user(request.user))
         serializer = FameSerializer(_fame, many=True)
@@ -0,0 +1,17 @@
+"""Bulk loading of generated data, shared by the fake data generator and the benchmarks."""
+
+from django.db import connection
+
+
+def bulk_insert(model, rows, fields, batch_size: int = 5000):
+    """Insert rows (tuples of values for the given field names) with plain INSERT statements, bypassing
+    auto_now_add and the restriction of bulk_create on multi-table inherited models."""
+    columns = [model._meta.get_field(field).column for field in fields]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(model._meta.db_table),
+        ", ".join(connection.ops.quote_name(column) for column in columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i : i + batch_size])
@@ -0,0 +1,9 @@
+"""The PostgreSQL backend of Django, with connections from a pool (see famesocialnetwork/db/pool.py)."""
+
+from django.db.backends.postgresql import base
+
+from famesocialnetwork.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
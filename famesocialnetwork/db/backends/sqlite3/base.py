@@ -0,0 +1,9 @@
+"""The SQLite backend of Django, with connections from a pool (see famesocialnetwork/db/pool.py)."""
+
+from django.db.backends.sqlite3 import base
+
+from famesocialnetwork.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
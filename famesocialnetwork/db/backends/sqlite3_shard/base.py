@@ -0,0 +1,17 @@
+"""The SQLite backend of Django for shards (see socialnetwork/sharding.py), without foreign key constraints: the rows
+on a shard reference users, expertise areas and posts stored on other databases."""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        connection.execute("PRAGMA foreign_keys = OFF")
+        return connection
+
+    def enable_constraint_checking(self):
+        pass
+
+    def check_constraints(self, table_names=None):
+        pass
@@ -0,0 +1,180 @@
+"""Connection pools for the database backends in famesocialnetwork/db/backends.
+
+Django opens a new database connection for every request (unless CONN_MAX_AGE keeps it for the next request of the
+same thread). With a pooled backend, closing a connection returns it to a pool shared by all threads of the process
+and connecting takes an idle connection from the pool, skipping the connection setup. A pool holds at most MAX_SIZE
+connections (in use or idle); connecting waits up to TIMEOUT seconds for a connection to be returned when all are in
+use. A connection idle for more than HEALTH_CHECK_AFTER seconds is checked with a query before it is handed out.
+The options are read from the POOL dictionary of the database settings, see DEFAULT_OPTIONS.
+"""
+
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from django.db import OperationalError
+
+from famesocialnetwork import metrics
+
+DEFAULT_OPTIONS = {"MAX_SIZE": 10, "TIMEOUT": 5.0, "HEALTH_CHECK_AFTER": 30.0}
+
+WAIT_TIME = metrics.histogram(
+    "db_pool_wait_seconds",
+    "Time to get a connection from the pool, including waiting for a free connection and connecting.",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+CONNECTIONS = metrics.counter(
+    "db_pool_connections_total",
+    "Connections handed out by the pool by outcome: reused, created, or discarded as broken or in excess.",
+    ["pool", "outcome"],
+)
+
+
+class ConnectionPool:
+    def __init__(self, name: str, max_size: int, timeout: float, health_check_after: float):
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._condition = threading.Condition()
+        # idle connections with the time they were returned, the most recently returned last:
+        self._idle = deque()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Number of open connections, in use or idle."""
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def acquire(self, connect):
+        """Get an idle connection or, if there is none and the pool is not full, a new one from connect()."""
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                with self._condition:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise OperationalError(
+                                f"Connection pool {self.name} exhausted: {self.max_size} connections in use"
+                            )
+                        self._condition.wait(remaining)
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                    else:
+                        connection, returned_at = None, None
+                        # reserve the place of the new connection, connecting happens outside the lock:
+                        self._size += 1
+                if connection is None:
+                    try:
+                        connection = connect()
+                    except BaseException:
+                        self._discard(None)
+                        raise
+                    CONNECTIONS.inc(pool=self.name, outcome="created")
+                    return connection
+                if time.monotonic() - returned_at <= self.health_check_after or self._is_healthy(connection):
+                    CONNECTIONS.inc(pool=self.name, outcome="reused")
+                    return connection
+                self._discard(connection)
+        finally:
+            WAIT_TIME.observe(time.perf_counter() - started, pool=self.name)
+
+    def release(self, connection):
+        """Return a connection that is not in a transaction to the pool."""
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def _discard(self, connection):
+        """Close a connection taken from the pool (or free the place reserved for a connection that failed)."""
+        if connection is not None:
+            CONNECTIONS.inc(pool=self.name, outcome="discarded")
+            try:
+                connection.close()
+            except Exception:
+                pass
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def discard(self, connection):
+        self._discard(connection)
+
+    @staticmethod
+    def _is_healthy(connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def close_idle(self):
+        """Close all idle connections, e.g. before the database file is deleted."""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(wrapper, conn_params) -> ConnectionPool:
+    """Get the pool of the database connection wrapper, connections with different parameters are kept apart."""
+    key = (wrapper.alias, wrapper.vendor, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**DEFAULT_OPTIONS, **wrapper.settings_dict.get("POOL", {})}
+            pool = _pools[key] = ConnectionPool(
+                wrapper.alias, options["MAX_SIZE"], options["TIMEOUT"], options["HEALTH_CHECK_AFTER"]
+            )
+        return pool
+
+
+def close_idle_connections():
+    """Close the idle connections of all pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapperMixin:
+    """Takes connections from a pool and returns them instead of closing them. Mixed into the DatabaseWrapper of a
+    Django database backend."""
+
+    def get_new_connection(self, conn_params):
+        self._pool = get_pool(self, conn_params)
+        return self._pool.acquire(partial(super().get_new_connection, conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = getattr(self, "_pool", None)
+        if pool is None:
+            return super()._close()
+        # a connection closed within a transaction or after an error is not trusted to be reusable:
+        if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+            pool.discard(self.connection)
+            return
+        try:
+            with self.wrap_database_errors:
+                self.connection.rollback()
+        except Exception:
+            pool.discard(self.connection)
+            return
+        pool.release(self.connection)
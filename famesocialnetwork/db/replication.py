@@ -0,0 +1,36 @@
+"""Replication shim for SQLite read replicas (see famesocialnetwork/db/routers.py), for testing replicas locally.
+
+SQLite has no replication: replicate() copies the primary database file to the replica files with SQLite's online
+backup API, run it periodically with `manage.py replicate_sqlite`. A copy replaces the whole replica at once, readers
+of the replica see either the old or the new state. Replicas lag behind the primary by up to the replication interval,
+keep settings.REPLICA_STICKY_SECONDS above it.
+"""
+
+import sqlite3
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# seconds to wait for readers of a replica (or a writer of the primary) to release their locks:
+LOCK_TIMEOUT = 5.0
+
+
+def copy_database(source, replica):
+    """Copy the SQLite database file source to the file replica."""
+    with closing(sqlite3.connect(source, timeout=LOCK_TIMEOUT)) as source_connection:
+        with closing(sqlite3.connect(replica, timeout=LOCK_TIMEOUT)) as replica_connection:
+            source_connection.backup(replica_connection)
+
+
+def replicate(replicas=None, source: str = DEFAULT_DB_ALIAS) -> list:
+    """Copy the database source to the replicas (default: settings.REPLICA_DATABASES), returns the aliases of the
+    replicas."""
+    if replicas is None:
+        replicas = settings.REPLICA_DATABASES
+    for alias in [source, *replicas]:
+        if connections[alias].vendor != "sqlite":
+            raise ValueError(f"The database {alias} is not SQLite, replicate it with the database's own replication")
+    for alias in replicas:
+        copy_database(connections[source].settings_dict["NAME"], connections[alias].settings_dict["NAME"])
+    return list(replicas)
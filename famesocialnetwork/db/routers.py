@@ -0,0 +1,129 @@
+"""Read replicas: reads of functions decorated with replica_reads go to a replica, all other queries to the primary
+database ("default").
+
+A function decorated with replica_reads picks one of the settings.REPLICA_DATABASES for every call. Its queries, and
+the queries of a QuerySet it returns (also within a tuple), read from that replica. Reads go to the primary instead
+while the thread is pinned, i.e. for settings.REPLICA_STICKY_SECONDS after it wrote anything (read-your-writes),
+and within transactions. ReplicaStickinessMiddleware carries the pin over to the next requests of the client, which
+may be served by other threads or processes. Replicas lag behind the primary, for SQLite replicas see
+famesocialnetwork/db/replication.py.
+"""
+
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import QuerySet
+
+# cookie with the time until which the reads of a client go to the primary:
+COOKIE = "db_pinned_until"
+
+_local = threading.local()
+
+
+def _replicas():
+    return getattr(settings, "REPLICA_DATABASES", [])
+
+
+def pinned_until() -> float:
+    return getattr(_local, "pinned_until", 0.0)
+
+
+def pin_to_primary(seconds: float = None):
+    """Read from the primary in this thread for the given number of seconds (default:
+    settings.REPLICA_STICKY_SECONDS)."""
+    if seconds is None:
+        seconds = getattr(settings, "REPLICA_STICKY_SECONDS", 5.0)
+    _local.pinned_until = max(pinned_until(), time.time() + seconds)
+
+
+def unpin():
+    _local.pinned_until = 0.0
+
+
+def read_database() -> str:
+    """The database the reads of a replica_reads function called now would go to."""
+    replicas = _replicas()
+    if not replicas or time.time() < pinned_until() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    current = getattr(_local, "read_alias", None)
+    # nested calls read from the replica of the outermost call:
+    return current if current is not None else random.choice(replicas)
+
+
+def _bind(result, alias: str):
+    if isinstance(result, QuerySet) and result._db is None:
+        return result.using(alias)
+    if isinstance(result, tuple):
+        return tuple(_bind(item, alias) for item in result)
+    return result
+
+
+def replica_reads(function):
+    """Decorator sending the reads of a read-only function to a replica, see the module documentation."""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        alias = read_database()
+        if alias == DEFAULT_DB_ALIAS:
+            return function(*args, **kwargs)
+        outer = getattr(_local, "read_alias", None)
+        _local.read_alias = alias
+        try:
+            return _bind(function(*args, **kwargs), alias)
+        finally:
+            _local.read_alias = outer
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """Routes the reads of replica_reads functions to their replica and all writes to the primary. Writing pins the
+    thread to the primary."""
+
+    def db_for_read(self, model, **hints):
+        # None: the database of a related instance, or the primary
+        return getattr(_local, "read_alias", None)
+
+    def db_for_write(self, model, **hints):
+        if _replicas():
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas are copies of the primary, including its schema:
+        return db not in _replicas()
+
+
+class ReplicaStickinessMiddleware:
+    """Pins the reads of a client to the primary for settings.REPLICA_STICKY_SECONDS after a request of the client
+    wrote, so that the client reads its own writes. The time is kept in a cookie rather than in the session, which
+    would cost a write of the session."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            before = float(request.COOKIES.get(COOKIE, 0.0)) if _replicas() else 0.0
+        except ValueError:
+            before = 0.0
+        _local.pinned_until = before
+        try:
+            response = self.get_response(request)
+            if pinned_until() > before:
+                response.set_cookie(
+                    COOKIE, str(pinned_until()), max_age=max(1, int(pinned_until() - time.time()) + 1), httponly=True
+                )
+        finally:
+            unpin()
+        return response
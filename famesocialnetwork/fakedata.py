@@ -1,51 +1,89 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
 from faker import Faker
 import random as rnd
-import time
 
-from fame.models import Fame, FameLevels
-from socialnetwork import api
-from socialnetwork.models import TruthRatings, SocialNetworkUsers, Posts, ExpertiseAreas
+from fame.models import Fame, FameLevels, FameUsers
+from famesocialnetwork.bulk import bulk_insert
+from socialnetwork import api, bullshitters
+from socialnetwork.magic_AI import classify_many
+from socialnetwork.models import TruthRatings, SocialNetworkUsers, Posts, ExpertiseAreas, TimelineEntries, UserRatings
+from socialnetwork.search import get_search_backend
+from socialnetwork.similarity import deferred_indexing, fame_matrix, rebuild_index
+
+FOLLOWS_PER_USER = 7
+FAME_ENTRIES_PER_USER = 15
+
+
+def _random_post(post_ids):
+    # the same draw as rnd.choice(Posts.objects.all()), which is ordered by -submitted (post_ids are oldest first):
+    return post_ids[-1 - rnd.choice(range(len(post_ids)))]
 
 
-def create_fake_data():
+def create_fake_data(users: int = 20, posts: int = 400, ratings_per_post: int = 3, batch_size: int = 1000):
+    """Create users random users plus the user a@b.de, their follows, fame profiles and communities, posts (submitted
+    as through api.submit_post) and ratings_per_post ratings of every post.
+
+    Rows are written with bulk inserts and committed every batch_size rows, posts are classified batch_size at a time.
+    The random draws are the same as creating everything one by one, so the defaults reproduce database_dump.json.
+    """
     # make fake data generation deterministic:
     rnd.seed(42)
     fake = Faker()
     fake.seed_instance(420)
 
-    # Create users:
-    for _ in range(20):
-        time.sleep(0.001)
+    # Create users (hashing the password once, hashing it per user takes longer than everything else):
+    people = []
+    emails = set()
+    for i in range(users):
         first_name = fake.first_name()
         last_name = fake.last_name()
         email = f"{first_name.lower()}.{last_name.lower()}@example.com"
+        if email in emails:
+            # names repeat in large datasets:
+            email = f"{first_name.lower()}.{last_name.lower()}.{i}@example.com"
+        emails.add(email)
+        people.append((first_name, last_name, email))
+    people.append(("Tom", "Petersson", "a@b.de"))
+    password = make_password("test")
+    now = timezone.now()
+    first_id = (FameUsers.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    for start in range(0, len(people), batch_size):
+        rows = [
+            # joined a millisecond apart, in creation order:
+            (user_id, password, False, first_name, last_name, email, False, True,
+             now - timedelta(milliseconds=len(people) - i))
+            for i, (first_name, last_name, email) in enumerate(people[start:start + batch_size], start)
+            for user_id in [first_id + i]
+        ]
+        with transaction.atomic():
+            bulk_insert(
+                FameUsers,
+                rows,
+                ["id", "password", "is_superuser", "first_name", "last_name", "email", "is_staff", "is_active",
+                 "date_joined"],
+            )
+            bulk_insert(
+                SocialNetworkUsers,
+                [(row[0], False, 0, 0) for row in rows],
+                ["fameusers_ptr", "is_banned", "follows_count", "followers_count"],
+            )
 
-        user = SocialNetworkUsers.objects.create(
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-        )
-        user.set_password("test")
-        user.save()
-
-    user = SocialNetworkUsers.objects.create(
-        email="a@b.de",
-        first_name="Tom",
-        last_name="Petersson",
-    )
-    user.set_password("test")
-    user.save()
-
-    users = SocialNetworkUsers.objects.all().order_by('id')
+    user_ids = list(SocialNetworkUsers.objects.order_by("id").values_list("id", flat=True))
 
     # create followers:
-    for user in users:
-        # create followers for this user:
-        sample = rnd.sample(
-            list(users.exclude(id=user.id)), 7
-        )
-        for u in sample:
-            user.follows.add(u)
+    follows = []
+    for i, user_id in enumerate(user_ids):
+        # the same draw as sampling from all other users ordered by id:
+        for j in rnd.sample(range(len(user_ids) - 1), FOLLOWS_PER_USER):
+            follows.append((user_id, user_ids[j if j < i else j + 1]))
+    with transaction.atomic():
+        bulk_insert(SocialNetworkUsers.follows.through, follows, ["from_socialnetworkusers", "to_socialnetworkusers"])
+        api.recompute_follow_counts()
 
     # Create expertise areas:
     ExpertiseAreas.objects.create(label="Computer Science")
@@ -127,59 +165,95 @@ def create_fake_data():
     FameLevels.objects.create(name="Serious Bullshitter", numeric_value=-300)
     FameLevels.objects.create(name="Dangerous Bullshitter", numeric_value=-1000)
 
-    expertise_areas = ExpertiseAreas.objects.all().order_by('id')
+    area_ids = list(ExpertiseAreas.objects.order_by("id").values_list("id", flat=True))
+    level_ids = list(FameLevels.objects.filter(numeric_value__gte=-50).values_list("id", flat=True))
 
     # Create fame:
-    for user in users:
-        for expertise in rnd.sample(list(expertise_areas), 15):
-            Fame.objects.create(
-                user=user,
-                expertise_area=expertise,
-                fame_level=rnd.choice(
-                    FameLevels.objects.filter(numeric_value__gte=-50)
-                ),
-            )
+    fame = [
+        (user_id, area_ids[j], rnd.choice(level_ids))
+        for user_id in user_ids
+        for j in rnd.sample(range(len(area_ids)), FAME_ENTRIES_PER_USER)
+    ]
+    with transaction.atomic():
+        bulk_insert(Fame, fame, ["user", "expertise_area", "fame_level"])
+        # the fame entries were inserted without signals:
+        bullshitters.rebuild()
+        rebuild_index()
+    fame_matrix.invalidate()
+
+    members = SocialNetworkUsers.objects.in_bulk(user_ids)
 
     # join communities through API:
     qualified_fame_entries = Fame.objects.filter(
         fame_level__numeric_value__gte=100
     ).select_related('user', 'expertise_area')
-    for fame in qualified_fame_entries:
+    for fame in qualified_fame_entries.iterator(chunk_size=batch_size):
         if rnd.random() < 0.8:
-            user = SocialNetworkUsers.objects.get(id=fame.user.id)
-            community = fame.expertise_area
-            api.join_community(user, community)
+            api.join_community(members[fame.user_id], fame.expertise_area)
 
     # make sure that at least one user is not member of any community for testing purposes
-    user = rnd.choice(list(users))
-    for community in list(expertise_areas):
+    user = members[rnd.choice(user_ids)]
+    for community in ExpertiseAreas.objects.all().order_by('id'):
         api.leave_community(user, community)
 
-    # submit posts through API:
-    for _ in range(400):
-        # call the API:
-        api.submit_post(
-            user=rnd.choice(users),
-            content=fake.text().strip(),
-            cites=(
-                rnd.choice(Posts.objects.all())
-                if Posts.objects.all().count() > 0
-                else None
-            ),
-            replies_to=(
-                rnd.choice(Posts.objects.all())
-                if Posts.objects.all().count() > 0 and rnd.randint(0, 5) == 0
-                else None
-            ),
-        )
-
-    # Create ratings:
-    for post in Posts.objects.all():
-        for user in rnd.sample(list(users), 3):
-            post.user_ratings.add(
-                user,
-                through_defaults={
-                    "type": rnd.choice(["A", "L", "D"]),
-                    "score": rnd.randint(0, 15),
-                },
-            )
+    # submit posts, batch_size at a time:
+    post_ids = list(Posts.objects.order_by("submitted", "id").values_list("id", flat=True))
+    next_id = (max(post_ids) if post_ids else 0) + 1
+    followers = defaultdict(list)
+    for follower_id, followee_id in SocialNetworkUsers.follows.through.objects.values_list(
+        "from_socialnetworkusers", "to_socialnetworkusers"
+    ):
+        followers[followee_id].append(follower_id)
+    search_backend = get_search_backend()
+    # posts change the fame of their authors, update the projections of the changed fame entries once at the end:
+    with deferred_indexing(), bullshitters.deferred_updates():
+        for start in range(0, posts, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, posts)):
+                author = members[rnd.choice(user_ids)]
+                content = fake.text().strip()
+                cites_id = _random_post(post_ids) if post_ids else None
+                replies_to_id = _random_post(post_ids) if post_ids and rnd.randint(0, 5) == 0 else None
+                # a second apart, ending now:
+                post = Posts(
+                    id=next_id, content=content, author=author, submitted=now - timedelta(seconds=posts - i),
+                    cites_id=cites_id, replies_to_id=replies_to_id,
+                )
+                post._state.adding = False
+                batch.append(post)
+                post_ids.append(next_id)
+                next_id += 1
+
+            with transaction.atomic():
+                bulk_insert(
+                    Posts,
+                    [(post.id, post.content, post.author_id, post.submitted, post.cites_id, post.replies_to_id, False,
+                      0, 0, 0, 0, 0, 0, 0, 0) for post in batch],
+                    ["id", "content", "author", "submitted", "cites", "replies_to", "published", "citations_count",
+                     "replies_count", "approval_score", "like_score", "dislike_score", "approval_count", "like_count",
+                     "dislike_count"],
+                )
+                api.classify_and_publish_many(batch, classify_many([post.content for post in batch]))
+                bulk_insert(
+                    TimelineEntries,
+                    [
+                        (owner_id, post.id, post.author_id, post.submitted, post.published)
+                        for post in batch
+                        for owner_id in [post.author_id, *followers[post.author_id]]
+                    ],
+                    ["owner", "post", "author", "submitted", "published"],
+                )
+                search_backend.index_posts(batch)
+
+    # Create ratings, newest posts first:
+    for start in range(len(post_ids), 0, -batch_size):
+        ratings = [
+            (user_ids[j], post_id, rnd.choice(["A", "L", "D"]), rnd.randint(0, 15), now)
+            for post_id in reversed(post_ids[max(0, start - batch_size):start])
+            for j in rnd.sample(range(len(user_ids)), ratings_per_post)
+        ]
+        with transaction.atomic():
+            bulk_insert(UserRatings, ratings, ["user", "post", "type", "score", "created"])
+
+    # posts and ratings were inserted directly, bring the engagement counters of the posts up to date:
+    api.recompute_post_stats()
@@ -1,4 +1,8 @@
+from contextlib import contextmanager
+
 from django.contrib.auth import get_user
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
 from termcolor import colored
 
 user_mapping = {
@@ -84,3 +88,48 @@ def test_paths_for_allowed_and_forbidden_users(
 
             if not no_login:
                 logout = self.client.logout()
+
+
+@contextmanager
+def query_budget(max_queries: int, using: str = DEFAULT_DB_ALIAS):
+    """
+    fails with an AssertionError listing the executed SQL if the block (or, used as a decorator, the function)
+    executes more than max_queries database queries
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > max_queries:
+        raise AssertionError(
+            f"{len(context)} queries executed, the budget is {max_queries}:\n"
+            + "\n".join(
+                f"{i}. {query['sql']}" for i, query in enumerate(context.captured_queries, start=1)
+            )
+        )
+
+
+def test_paths_within_query_budgets(self, budgets, user="P", method="get", data=None):
+    """
+    requests every path of budgets as the given test_*-user and checks that it succeeds with at most the budgeted
+    number of database queries (including session and authentication)
+    budgets: dictionary mapping paths to their maximal number of queries
+    method, data: HTTP method and request data used for all paths
+    """
+    email = user_mapping[user]
+    if email != "unauthenticated":
+        self.client.login(email=email, password="test")
+
+    for path, max_queries in budgets.items():
+        try:
+            with query_budget(max_queries):
+                response = getattr(self.client, method)(path, data or {})
+        except AssertionError as e:
+            print()
+            print(colored("query budget exceeded", "red"))
+            print(colored("user: " + str(email), "red"))
+            print(colored(method.upper() + " " + str(path), "red"))
+            print(colored(str(e), "red"))
+            raise
+        self.assertIn(response.status_code, [200, 302], f"{method.upper()} {path}")
+
+    if email != "unauthenticated":
+        self.client.logout()
@@ -0,0 +1,237 @@
+"""Prometheus-style metrics: counters and histograms, served in the Prometheus text format at /metrics.
+
+Metrics are registered at import time with counter() and histogram() and recorded in memory. Under a server with
+several worker processes (e.g. gunicorn), set settings.METRICS_MULTIPROCESS_DIR: every process then also writes its
+values to its own file in that directory (at most every settings.METRICS_FLUSH_INTERVAL seconds and at exit), and
+/metrics adds up the files of all processes, so it does not matter which process serves the scrape. Empty the
+directory when the server is restarted, as the counters of the previous processes would be counted again.
+MetricsMiddleware records the latency of every request by named URL.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._pid = os.getpid()
+        self._last_flush = time.monotonic()
+        # counter values and histogram states ([bucket counts..., sum, count]) by metric name and label values:
+        self._values = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _record(self, name, labels, update):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # a forked worker starts from zero, its parent's values are already counted in the parent's file:
+                self._pid = os.getpid()
+                self._values = {}
+            update(self._values, (name, labels))
+            directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+            if directory and time.monotonic() - self._last_flush >= getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0):
+                self._write(directory)
+
+    def _write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{self._pid}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump([[name, list(labels), value] for (name, labels), value in self._values.items()], file)
+        # readers never see a partially written file:
+        os.replace(f"{path}.tmp", path)
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Write the values of this process to its file, if there is a multi-process directory."""
+        directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+        if directory:
+            with self._lock:
+                self._write(directory)
+
+    def value(self, name, labels=()):
+        """Get the value (counters) or state (histograms) of a metric in this process, None if never recorded."""
+        with self._lock:
+            value = self._values.get((name, tuple(labels)))
+        return list(value) if isinstance(value, list) else value
+
+    def collect(self):
+        """Get the values of all processes (see module documentation) keyed by metric name and label values."""
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+            own_file = f"metrics-{self._pid}.json"
+        directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+        for path in sorted(glob.glob(os.path.join(directory, "metrics-*.json"))) if directory else []:
+            if os.path.basename(path) == own_file:
+                continue
+            try:
+                with open(path) as file:
+                    entries = json.load(file)
+            except (OSError, ValueError):
+                # the process wrote its first file just now
+                continue
+            for name, labels, value in entries:
+                key = (name, tuple(labels))
+                if key not in values:
+                    values[key] = value
+                elif isinstance(value, list):
+                    values[key] = [a + b for a, b in zip(values[key], value)]
+                else:
+                    values[key] += value
+        return values
+
+    def render(self) -> str:
+        """Get the metrics of all processes in the Prometheus text format."""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for (value_name, labels), value in sorted(values.items()):
+                if value_name == name:
+                    lines.extend(metric.samples(dict(zip(metric.labelnames, labels)), value))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels: dict):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} has the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+
+        def update(values, key):
+            values[key] = values.get(key, 0) + amount
+
+        registry._record(self.name, self._labels(labels), update)
+
+    def value(self, **labels):
+        """Get the value in this process."""
+        return registry.value(self.name, self._labels(labels)) or 0
+
+    def samples(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        def update(values, key):
+            state = values.get(key)
+            if state is None:
+                # a count per bucket (not cumulative), the sum and the count:
+                state = values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+        registry._record(self.name, self._labels(labels), update)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block (or, used as a decorator, of the function) in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        """Get the number of observations in this process."""
+        state = registry.value(self.name, self._labels(labels))
+        return state[-1] if state else 0
+
+    def samples(self, labels, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': repr(float(bound))})} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {state[-1]}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state[-2])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {state[-1]}")
+        return lines
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by named URL.", ["view", "method"]
+)
+REQUESTS = counter("http_requests_total", "HTTP requests by named URL and status code.", ["view", "method", "status"])
+
+
+class MetricsMiddleware:
+    """Records the latency and status code of every request by the name of its URL pattern."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match is not None else "<unresolved>"
+        REQUEST_DURATION.observe(time.perf_counter() - started, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        return response
@@ -0,0 +1,225 @@
+"""Per-request profiling: wall time, number and time of SQL queries, serializer time and template render time.
+
+Enabled with settings.PROFILING_ENABLED, ProfilingMiddleware profiles a settings.PROFILING_SAMPLE_RATE fraction of
+the requests and aggregates the measurements per view in memory (per process), see the report at /profiling/ (staff
+only). Serializers time themselves with ProfiledSerializerMixin and templates with the ProfiledDjangoTemplates
+backend. If settings.PROFILING_CPROFILE_DIR is set, sampled requests also run under cProfile and the profiles of the
+settings.PROFILING_CPROFILE_SLOWEST slowest requests are kept in that directory (open them with pstats or snakeviz).
+"""
+
+import cProfile
+import heapq
+import os
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# number of recent requests per view the percentiles are computed from:
+RECENT_REQUESTS = 1000
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """Measurements of a single request, times in seconds."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.sections = defaultdict(float)
+        self._active = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+
+@contextmanager
+def timed(section: str):
+    """Add the time spent in the block to the given section of the profile of the current request, if it is profiled.
+    Nested blocks of the same section are counted once."""
+    profile = getattr(_local, "profile", None)
+    if profile is None or section in profile._active:
+        yield
+        return
+    profile._active.add(section)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[section] += time.perf_counter() - started
+        profile._active.discard(section)
+
+
+class ProfiledSerializerMixin:
+    """Counts the time spent serializing into the "serializer" section of the request profile."""
+
+    def to_representation(self, instance):
+        with timed("serializer"):
+            return super().to_representation(instance)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return super().render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, counting the render time into the "template" section of the request profile."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ProfileRegistry:
+    """Aggregated measurements per view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = defaultdict(
+                lambda: {
+                    "requests": 0,
+                    "wall": 0.0,
+                    "sql_count": 0,
+                    "sql": 0.0,
+                    "serializer": 0.0,
+                    "template": 0.0,
+                    "recent": deque(maxlen=RECENT_REQUESTS),
+                }
+            )
+
+    def record(self, view: str, wall: float, profile: RequestProfile):
+        with self._lock:
+            totals = self._views[view]
+            totals["requests"] += 1
+            totals["wall"] += wall
+            totals["sql_count"] += profile.sql_count
+            totals["sql"] += profile.sql_time
+            totals["serializer"] += profile.sections["serializer"]
+            totals["template"] += profile.sections["template"]
+            totals["recent"].append(wall)
+
+    def report(self):
+        """Get the mean time per request in milliseconds (and the mean number of queries) of every view, with the
+        median, 95th percentile and maximum of the wall time of its recent requests."""
+        with self._lock:
+            views = {view: {**totals, "recent": sorted(totals["recent"])} for view, totals in self._views.items()}
+        report = {}
+        for view, totals in sorted(views.items()):
+            requests, recent = totals["requests"], totals["recent"]
+            report[view] = {
+                "requests": requests,
+                "wall_ms": totals["wall"] / requests * 1000,
+                "wall_p50_ms": statistics.median(recent) * 1000,
+                "wall_p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000,
+                "wall_max_ms": recent[-1] * 1000,
+                "sql_queries": totals["sql_count"] / requests,
+                "sql_ms": totals["sql"] / requests * 1000,
+                "serializer_ms": totals["serializer"] / requests * 1000,
+                "template_ms": totals["template"] / requests * 1000,
+            }
+        return report
+
+
+registry = ProfileRegistry()
+
+
+class SlowestProfiles:
+    """Keeps the cProfile dumps of the slowest requests of this process in a directory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+
+    def offer(self, directory: str, keep: int, wall: float, view: str, profiler: cProfile.Profile):
+        with self._lock:
+            if len(self._heap) >= keep and wall <= self._heap[0][0]:
+                return
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(
+                directory, f"{wall * 1000:010.1f}ms-{view.replace(':', '-')}-{os.getpid()}-{time.time_ns()}.prof"
+            )
+            profiler.dump_stats(path)
+            heapq.heappush(self._heap, (wall, path))
+            while len(self._heap) > keep:
+                _, evicted = heapq.heappop(self._heap)
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+
+
+slowest_profiles = SlowestProfiles()
+
+
+class ProfilingMiddleware:
+    """Profiles sampled requests, see the module documentation. Also reports the breakdown in a Server-Timing
+    header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "PROFILING_ENABLED", False) or random.random() >= getattr(
+            settings, "PROFILING_SAMPLE_RATE", 1.0
+        ):
+            return self.get_response(request)
+
+        profile_directory = getattr(settings, "PROFILING_CPROFILE_DIR", None)
+        profile = _local.profile = RequestProfile()
+        profiler = cProfile.Profile() if profile_directory else None
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(profile.record_query))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _local.profile = None
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else "<unresolved>"
+        registry.record(view, wall, profile)
+        if profiler is not None:
+            slowest_profiles.offer(
+                str(profile_directory), getattr(settings, "PROFILING_CPROFILE_SLOWEST", 10), wall, view, profiler
+            )
+        response["Server-Timing"] = ", ".join(
+            [
+                f"total;dur={wall * 1000:.1f}",
+                f'sql;dur={profile.sql_time * 1000:.1f};desc="{profile.sql_count} queries"',
+                f"serializer;dur={profile.sections['serializer'] * 1000:.1f}",
+                f"template;dur={profile.sections['template'] * 1000:.1f}",
+            ]
+        )
+        return response
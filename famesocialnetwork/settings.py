@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 import pathlib as _pathlib
 from pathlib import Path
 
@@ -44,11 +45,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that the profile covers all other middleware:
+    "famesocialnetwork.profiling.ProfilingMiddleware",
+    "famesocialnetwork.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "famesocialnetwork.db.routers.ReplicaStickinessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -65,7 +70,8 @@ REST_FRAMEWORK = {
 MASTER_BASE_DIR = _pathlib.Path(__file__).parent
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # the Django backend, measuring the render time for the request profiling:
+        "BACKEND": "famesocialnetwork.profiling.ProfiledDjangoTemplates",
         "DIRS": [MASTER_BASE_DIR.joinpath("templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -84,13 +90,90 @@ WSGI_APPLICATION = "famesocialnetwork.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite profile for concurrent requests, enabled with the environment variable FAMESOCIALNETWORK_SQLITE_PROFILE=production:
+# in WAL mode readers do not block behind a writer, transactions take the write lock when they begin instead of failing
+# to upgrade a read lock, and a busy connection waits up to 5 seconds for the lock (see also socialnetwork/writes.py)
+SQLITE_PRODUCTION_OPTIONS = {
+    "init_command": (
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA cache_size=-65536;"  # 64 MiB
+        "PRAGMA mmap_size=268435456;"  # 256 MiB
+        "PRAGMA busy_timeout=5000;"
+        "PRAGMA temp_store=MEMORY;"
+    ),
+    "transaction_mode": "IMMEDIATE",
+    "timeout": 5,
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": (
+            SQLITE_PRODUCTION_OPTIONS if os.environ.get("FAMESOCIALNETWORK_SQLITE_PROFILE") == "production" else {}
+        ),
     }
 }
 
+# PostgreSQL instead of SQLite with FAMESOCIALNETWORK_DB_ENGINE=postgresql, connecting with the environment variables
+# POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST and POSTGRES_PORT (needs psycopg)
+if os.environ.get("FAMESOCIALNETWORK_DB_ENGINE") == "postgresql":
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("POSTGRES_DB", "famesocialnetwork"),
+        "USER": os.environ.get("POSTGRES_USER", "postgres"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+    }
+
+# Connection reuse, configured with environment variables. FAMESOCIALNETWORK_CONN_MAX_AGE keeps the connection of a
+# thread open for that many seconds (None: forever) for its next requests, checked before reuse if
+# FAMESOCIALNETWORK_CONN_HEALTH_CHECKS=1. With FAMESOCIALNETWORK_DB_POOL=1 connections are instead returned to a pool
+# shared by all threads of the process at the end of a request (see famesocialnetwork/db/pool.py) of at most
+# FAMESOCIALNETWORK_DB_POOL_SIZE connections, waiting up to FAMESOCIALNETWORK_DB_POOL_TIMEOUT seconds for a free one
+_conn_max_age = os.environ.get("FAMESOCIALNETWORK_CONN_MAX_AGE", "0")
+DATABASES["default"]["CONN_MAX_AGE"] = None if _conn_max_age.lower() == "none" else int(_conn_max_age)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = os.environ.get("FAMESOCIALNETWORK_CONN_HEALTH_CHECKS") == "1"
+if os.environ.get("FAMESOCIALNETWORK_DB_POOL") == "1":
+    DATABASES["default"]["ENGINE"] = DATABASES["default"]["ENGINE"].replace(
+        "django.db.backends.", "famesocialnetwork.db.backends."
+    )
+    DATABASES["default"]["POOL"] = {
+        "MAX_SIZE": int(os.environ.get("FAMESOCIALNETWORK_DB_POOL_SIZE", "10")),
+        "TIMEOUT": float(os.environ.get("FAMESOCIALNETWORK_DB_POOL_TIMEOUT", "5")),
+        # seconds a connection may be idle before it is checked with a query when taken from the pool:
+        "HEALTH_CHECK_AFTER": 30.0,
+    }
+
+# Read replicas (see famesocialnetwork/db/routers.py): FAMESOCIALNETWORK_DB_REPLICAS=n adds the databases replica1 to
+# replican. SQLite replicas are the files db.replica<i>.sqlite3, kept in sync by manage.py replicate_sqlite;
+# PostgreSQL replicas are on the hosts POSTGRES_REPLICA<i>_HOST. The reads of a session go to the primary for
+# REPLICA_STICKY_SECONDS after it wrote
+DATABASE_ROUTERS = ["socialnetwork.sharding.ShardRouter", "famesocialnetwork.db.routers.ReplicaRouter"]
+REPLICA_DATABASES = []
+REPLICA_STICKY_SECONDS = 5.0
+for _i in range(1, int(os.environ.get("FAMESOCIALNETWORK_DB_REPLICAS", "0")) + 1):
+    _replica = DATABASES[f"replica{_i}"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+    if _replica["ENGINE"].endswith("sqlite3"):
+        _replica["NAME"] = BASE_DIR / f"db.replica{_i}.sqlite3"
+    else:
+        _replica["HOST"] = os.environ.get(f"POSTGRES_REPLICA{_i}_HOST", _replica["HOST"])
+    REPLICA_DATABASES.append(f"replica{_i}")
+
+# Sharding of the posts and their ratings by author id (see socialnetwork/sharding.py): FAMESOCIALNETWORK_DB_SHARDS=n
+# stores them on the SQLite databases shard0 to shard<n-1>, the files db.shard<i>.sqlite3. Create the tables with
+# manage.py migrate --database shard<i> and move existing posts with manage.py reshard
+SHARD_DATABASES = []
+for _i in range(int(os.environ.get("FAMESOCIALNETWORK_DB_SHARDS", "0"))):
+    DATABASES[f"shard{_i}"] = {
+        "ENGINE": "famesocialnetwork.db.backends.sqlite3_shard",
+        "NAME": BASE_DIR / f"db.shard{_i}.sqlite3",
+        "OPTIONS": DATABASES["default"].get("OPTIONS", {}),
+    }
+    SHARD_DATABASES.append(f"shard{_i}")
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -141,3 +224,34 @@ STATICFILES_DIRS = [BASE_DIR / "assets"]
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "fame.FameUsers"
+
+# Seconds after which the in-process caches of reference tables (see fame/reference_tables.py) are reloaded,
+# bounds the staleness of changes made by other processes
+REFERENCE_TABLES_TTL = 60
+
+# Classify submitted posts in the background (manage.py run_classification_worker) instead of during the request
+SOCIALNETWORK_ASYNC_CLASSIFICATION = False
+
+# Seconds after which the in-memory fame matrix of api.similar_users is reloaded,
+# bounds the staleness of fame changes made by other processes
+SIMILAR_USERS_TTL = 300
+
+# Request profiling (see famesocialnetwork/profiling.py): profile a PROFILING_SAMPLE_RATE fraction of the requests,
+# report at /profiling/. If PROFILING_CPROFILE_DIR is set, keep the cProfile dumps of the PROFILING_CPROFILE_SLOWEST
+# slowest requests there
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 1.0
+PROFILING_CPROFILE_DIR = None
+PROFILING_CPROFILE_SLOWEST = 10
+
+# Metrics served at /metrics (see famesocialnetwork/metrics.py). With several server processes, set
+# METRICS_MULTIPROCESS_DIR to a directory shared by them, each process writes its metrics there at most every
+# METRICS_FLUSH_INTERVAL seconds
+METRICS_MULTIPROCESS_DIR = None
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Serialize the writes of a process's threads on SQLite and retry a write that found the database locked (see
+# socialnetwork/writes.py), the n-th retry waits about SQLITE_WRITE_BACKOFF * 2 ** n seconds
+SQLITE_SERIALIZE_WRITES = True
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_BACKOFF = 0.05
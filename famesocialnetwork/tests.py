@@ -1,14 +1,28 @@
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
 from django.db.models import F
+import os
+from io import StringIO
+import pstats
 import random as rnd
+import sqlite3
+import tempfile
+from contextlib import closing
 from collections import defaultdict  # Ensure defaultdict is imported
 
-from socialnetwork import api
+from socialnetwork import api, magic_AI
 
 # make tests deterministic:
 rnd.seed(42)
 
-from fame.models import Fame, ExpertiseAreas, FameLevels
+from fame.models import Fame, ExpertiseAreas, FameLevels, FameUsers
+from famesocialnetwork import metrics, profiling
+from famesocialnetwork.db import pool, replication, routers
+from famesocialnetwork.db.backends.sqlite3.base import DatabaseWrapper as PooledDatabaseWrapper
 from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
 from socialnetwork.models import (
     Posts,
@@ -554,3 +568,268 @@ class StudentTasksTests(TestCase):
                              0.4375, 0.4375, 0.4375, 0.4375, 0.375, 0.375, 0.3125]
         self.assertTrue(user_ids == true_user_ids)
         self.assertTrue(similarities == true_similarities)
+
+
+class ProfilingTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        call_command("rebuild_timelines", stdout=StringIO())
+        profiling.registry.reset()
+        self.client.login(email="a@b.de", password="test")
+
+    def test_disabled_by_default(self):
+        response = self.client.get("/sn/html/timeline")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(profiling.registry.report(), {})
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_breakdown_per_view(self):
+        response = self.client.get("/sn/html/timeline")
+        self.assertIn("sql;dur=", response["Server-Timing"])
+        self.client.get("/sn/html/timeline")
+        self.client.get("/sn/api/posts")
+
+        report = profiling.registry.report()
+        self.assertEqual(report["sn:timeline"]["requests"], 2)
+        self.assertGreater(report["sn:timeline"]["sql_queries"], 0)
+        self.assertGreater(report["sn:timeline"]["template_ms"], 0)
+        self.assertGreater(report["sn:timeline"]["serializer_ms"], 0)
+        self.assertGreater(report["sn:posts_fulllist"]["serializer_ms"], 0)
+        self.assertEqual(report["sn:posts_fulllist"]["template_ms"], 0)
+        for view in report.values():
+            self.assertLessEqual(view["sql_ms"] + view["serializer_ms"] + view["template_ms"], view["wall_max_ms"])
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0)
+    def test_sampling(self):
+        self.client.get("/sn/html/timeline")
+        self.assertEqual(profiling.registry.report(), {})
+
+    def test_keeps_slowest_cprofile_dumps(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                PROFILING_ENABLED=True, PROFILING_CPROFILE_DIR=directory, PROFILING_CPROFILE_SLOWEST=2
+            ):
+                for _ in range(4):
+                    self.client.get("/sn/html/timeline")
+            dumps = sorted(os.listdir(directory))
+            self.assertEqual(len(dumps), 2)
+            pstats.Stats(os.path.join(directory, dumps[0]))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_report_staff_only(self):
+        self.client.get("/sn/html/timeline")
+        self.assertEqual(self.client.get("/profiling/").status_code, 403)
+        FameUsers.objects.filter(email="a@b.de").update(is_staff=True)
+        response = self.client.get("/profiling/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("sn:timeline", response.json())
+        self.assertEqual(self.client.delete("/profiling/").status_code, 204)
+        self.assertNotIn("sn:timeline", profiling.registry.report())
+
+
+class MetricsTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_request_latency_by_named_url(self):
+        self.client.login(email="a@b.de", password="test")
+        count = metrics.REQUEST_DURATION.count(view="sn:timeline", method="GET")
+        self.client.get("/sn/html/timeline")
+        self.assertEqual(metrics.REQUEST_DURATION.count(view="sn:timeline", method="GET"), count + 1)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn(
+            f'http_request_duration_seconds_bucket{{view="sn:timeline",method="GET",le="+Inf"}} {count + 1}', text
+        )
+        self.assertIn('http_requests_total{view="sn:timeline",method="GET",status="200"}', text)
+
+    def test_post_counters(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        before = [
+            api.POSTS_SUBMITTED.value(mode="synchronous"),
+            api.POSTS_PUBLISHED.value() + api.POSTS_UNPUBLISHED.value(reason="classification"),
+            magic_AI.CLASSIFIED_CONTENTS.value(),
+            api.API_DURATION.count(function="submit_post"),
+        ]
+        api.submit_post(user, "Metrics are fun.", asynchronous=False)
+        after = [
+            api.POSTS_SUBMITTED.value(mode="synchronous"),
+            api.POSTS_PUBLISHED.value() + api.POSTS_UNPUBLISHED.value(reason="classification"),
+            magic_AI.CLASSIFIED_CONTENTS.value(),
+            api.API_DURATION.count(function="submit_post"),
+        ]
+        self.assertEqual(after, [value + 1 for value in before])
+
+    def test_ban_counters(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        published = user.posts_set.filter(published=True).count()
+        bans, unpublished = api.BANS.value(), api.POSTS_UNPUBLISHED.value(reason="ban")
+        api.ban_user(user)
+        self.assertEqual(api.BANS.value(), bans + 1)
+        self.assertEqual(api.POSTS_UNPUBLISHED.value(reason="ban"), unpublished + published)
+
+    def test_aggregates_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            pid = os.fork()
+            if pid == 0:
+                # a worker process starts from zero:
+                api.BANS.inc(3)
+                metrics.registry.flush()
+                os._exit(0)
+            os.waitpid(pid, 0)
+            self.assertEqual(os.listdir(directory), [f"metrics-{pid}.json"])
+            self.assertIn(f"\nsocialnetwork_bans_total {api.BANS.value() + 3}\n", metrics.registry.render())
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = os.path.join(directory.name, "db.sqlite3")
+        self.addCleanup(pool.close_idle_connections)
+
+    def wrapper(self, **options):
+        wrapper = PooledDatabaseWrapper(
+            {**connection.settings_dict, "NAME": self.name, "POOL": {**pool.DEFAULT_OPTIONS, **options}},
+            alias="pooled",
+        )
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_closed_connections_are_reused(self):
+        created = pool.CONNECTIONS.value(pool="pooled", outcome="created")
+        reused = pool.CONNECTIONS.value(pool="pooled", outcome="reused")
+        waits = pool.WAIT_TIME.count(pool="pooled")
+        first, second = self.wrapper(), self.wrapper()
+        first.ensure_connection()
+        database_connection = first.connection
+        first.close()
+        second.ensure_connection()
+        self.assertIs(second.connection, database_connection)
+        with second.cursor() as cursor:
+            self.assertEqual(cursor.execute("SELECT 1").fetchone(), (1,))
+        self.assertEqual(pool.CONNECTIONS.value(pool="pooled", outcome="created"), created + 1)
+        self.assertEqual(pool.CONNECTIONS.value(pool="pooled", outcome="reused"), reused + 1)
+        self.assertEqual(pool.WAIT_TIME.count(pool="pooled"), waits + 2)
+
+    def test_waits_for_a_free_connection_up_to_the_timeout(self):
+        first, second = self.wrapper(MAX_SIZE=1, TIMEOUT=0.05), self.wrapper(MAX_SIZE=1, TIMEOUT=0.05)
+        first.ensure_connection()
+        with self.assertRaisesMessage(OperationalError, "exhausted"):
+            second.ensure_connection()
+        first.close()
+        second.ensure_connection()
+        self.assertEqual(first._pool.size, 1)
+
+    def test_broken_idle_connections_are_discarded(self):
+        first, second = self.wrapper(HEALTH_CHECK_AFTER=0), self.wrapper(HEALTH_CHECK_AFTER=0)
+        first.ensure_connection()
+        database_connection = first.connection
+        first.close()
+        database_connection.close()
+        discarded = pool.CONNECTIONS.value(pool="pooled", outcome="discarded")
+        second.ensure_connection()
+        self.assertIsNot(second.connection, database_connection)
+        self.assertEqual(pool.CONNECTIONS.value(pool="pooled", outcome="discarded"), discarded + 1)
+        self.assertEqual(second._pool.size, 1)
+
+    def test_connections_closed_in_a_transaction_are_not_reused(self):
+        first, second = self.wrapper(), self.wrapper()
+        first.ensure_connection()
+        database_connection = first.connection
+        # as if closed within transaction.atomic():
+        first.in_atomic_block = True
+        first.close()
+        first.in_atomic_block = False
+        second.ensure_connection()
+        self.assertIsNot(second.connection, database_connection)
+        self.assertEqual(second._pool.idle, 0)
+
+    def test_uncommitted_changes_are_rolled_back(self):
+        first, second = self.wrapper(), self.wrapper()
+        with first.cursor() as cursor:
+            cursor.execute("CREATE TABLE pooled (id INTEGER)")
+        first.set_autocommit(False)
+        with first.cursor() as cursor:
+            cursor.execute("INSERT INTO pooled VALUES (1)")
+        first.close()
+        with second.cursor() as cursor:
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM pooled").fetchone(), (0,))
+
+
+# reads within transactions go to the primary, so the tests must not run in one:
+@override_settings(REPLICA_DATABASES=["replica"])
+class ReadReplicaTests(TransactionTestCase):
+    def setUp(self):
+        self.user = SocialNetworkUsers.objects.create(email="reader@example.com", password=make_password("test"))
+        self.other = SocialNetworkUsers.objects.create(email="writer@example.com")
+        Fame.objects.create(
+            user=self.user,
+            expertise_area=ExpertiseAreas.objects.create(label="Replication"),
+            fame_level=FameLevels.objects.create(name="Replicated", numeric_value=42),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "replica.sqlite3")
+        connection.ensure_connection()
+        with closing(sqlite3.connect(path)) as replica_connection:
+            connection.connection.backup(replica_connection)
+        replica = DatabaseWrapper({**connection.settings_dict, "NAME": path}, alias="replica")
+        connections["replica"] = replica
+        self.addCleanup(connections.__delitem__, "replica")
+        self.addCleanup(replica.close)
+        routers.unpin()
+        self.addCleanup(routers.unpin)
+
+    def test_read_only_functions_read_from_a_replica(self):
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            user, fame = api.fame(self.user)
+            self.assertEqual(fame.db, "replica")
+            self.assertEqual(user._state.db, "replica")
+            self.assertTrue(list(fame))
+            self.assertEqual(api.timeline(self.user).db, "replica")
+        self.assertTrue(replica_queries)
+        self.assertEqual(SocialNetworkUsers.objects.all().db, "default")
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        api.follow(self.user, self.other)
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.assertEqual(api.followee_ids(self.user), {self.other.id})
+        self.assertFalse(replica_queries)
+        routers.unpin()
+        # the replica has not seen the write yet:
+        self.assertEqual(api.followee_ids(self.user), set())
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(api.fame(self.user)[1].db, "default")
+
+    def test_clients_read_their_writes(self):
+        self.client.login(email="reader@example.com", password="test")
+        routers.unpin()
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.assertEqual(self.client.get("/fame/api/fame").status_code, 200)
+        self.assertTrue(replica_queries)
+
+        routers.unpin()
+        response = self.client.post("/sn/api/follow", {"user_id": self.other.id})
+        self.assertIn(routers.COOKIE, response.cookies)
+        # the client's next request is served by another thread in a server:
+        routers.unpin()
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.assertEqual(self.client.get("/fame/api/fame").status_code, 200)
+        self.assertFalse(replica_queries)
+
+    def test_replication(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = os.path.join(directory, "primary.sqlite3"), os.path.join(directory, "replica.sqlite3")
+            with closing(sqlite3.connect(primary)) as primary_connection:
+                primary_connection.execute("CREATE TABLE posts (content TEXT)")
+                primary_connection.execute("INSERT INTO posts VALUES ('replicated')")
+                primary_connection.commit()
+            replication.copy_database(primary, replica)
+            with closing(sqlite3.connect(replica)) as replica_connection:
+                self.assertEqual(replica_connection.execute("SELECT content FROM posts").fetchall(), [("replicated",)])
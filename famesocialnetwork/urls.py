@@ -20,6 +20,8 @@ from django.urls import path, include
 from django.views.generic import RedirectView
 
 from famesocialnetwork.views.html import home, MyLogoutView, MyLoginView
+from famesocialnetwork.views.metrics import metrics
+from famesocialnetwork.views.rest import ProfilingApiView
 
 urlpatterns = [
     path(
@@ -39,6 +41,8 @@ urlpatterns = [
     ),
     path("home/", home, name="home"),
     path("admin/", admin.site.urls),
+    path("profiling/", ProfilingApiView.as_view(), name="profiling"),
+    path("metrics", metrics, name="metrics"),
     path("fame/", include("fame.urls", namespace="fame")),  # reroute to fame app
     path(
         "sn/", include("socialnetwork.urls", namespace="sn")
@@ -0,0 +1,12 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from famesocialnetwork.metrics import registry
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    The metrics of all server processes in the Prometheus text format, for scraping
+    """
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,23 @@
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from famesocialnetwork.profiling import registry
+
+
+class ProfilingApiView(APIView):
+    # the profiles reveal the views and their load, staff only:
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Get the mean wall, SQL, serializer and template time per request of every view profiled by this process
+        """
+        return Response(registry.report(), status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        """
+        Reset the profiles of this process
+        """
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
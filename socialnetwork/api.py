@@ -1,11 +1,61 @@
-from django.db.models import Q, Exists, OuterRef, When, IntegerField, FloatField, Count, ExpressionWrapper, Case, Value, F, Prefetch
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q, Exists, OuterRef, When, IntegerField, FloatField, Count, ExpressionWrapper, Case, Value, F, Prefetch, Subquery, Sum
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce
 
 from fame.models import Fame, FameLevels, FameUsers, ExpertiseAreas
-from socialnetwork.models import Posts, SocialNetworkUsers
+from fame.reference_tables import fame_levels
+from famesocialnetwork import metrics
+from famesocialnetwork.db.routers import replica_reads
+from socialnetwork import sharding
+from socialnetwork.bullshitters import deferred_updates as deferred_bullshitter_updates
+from socialnetwork.magic_AI import classify_into_expertise_areas_and_check_for_bullshit
+from socialnetwork.models import (
+    Bullshitters,
+    ClassificationTasks,
+    CommunityMemberships,
+    Posts,
+    PostExpertiseAreasAndRatings,
+    SocialNetworkUsers,
+    TimelineEntries,
+    UserRatings,
+)
+from socialnetwork.search import get_search_backend
+from socialnetwork.similarity import approximate_similarities, deferred_indexing, fame_matrix
+from socialnetwork.writes import serialized_write
 
 
 # general methods independent of html and REST views
 # should be used by REST and html views
+# read-only functions are decorated with replica_reads (see famesocialnetwork/db/routers.py), write paths must not
+# call them
+
+# functions returning querysets (timeline, search, ...) are covered by the request latency of their views:
+API_DURATION = metrics.histogram(
+    "socialnetwork_api_duration_seconds", "Duration of calls of socialnetwork.api functions.", ["function"]
+)
+POSTS_SUBMITTED = metrics.counter(
+    "socialnetwork_posts_submitted_total", "Submitted posts by classification mode.", ["mode"]
+)
+POSTS_PUBLISHED = metrics.counter("socialnetwork_posts_published_total", "Posts published after classification.")
+POSTS_UNPUBLISHED = metrics.counter(
+    "socialnetwork_posts_unpublished_total",
+    "Posts not published after classification or unpublished by banning their author.",
+    ["reason"],
+)
+FAME_ADJUSTMENTS = metrics.counter(
+    "socialnetwork_fame_adjustments_total",
+    "Fame adjustments (T2) by change: a lowered fame level or a new Confuser entry.",
+    ["change"],
+)
+BANS = metrics.counter("socialnetwork_bans_total", "Users banned by ban_user.")
 
 
 def _get_social_network_user(user) -> SocialNetworkUsers:
@@ -17,8 +67,182 @@ def _get_social_network_user(user) -> SocialNetworkUsers:
     return user
 
 
-def timeline(user: SocialNetworkUsers, start: int = 0, end: int = None, published=True, community_mode=False):
-    """Get the timeline of the user. Assumes that the user is authenticated."""
+# keyset (cursor) pagination:
+# posts are paged on (submitted, id) descending, users on id ascending. A cursor is an opaque token encoding the
+# key of the last item of the previous page, so that fetching the next page is an index range scan instead of an
+# OFFSET scan over all previous pages.
+
+
+def _encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or not key:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _posts_cursor_q(cursor: str, submitted_field: str = "submitted") -> Q:
+    """Q object selecting the posts after the given cursor in (submitted, id) descending order."""
+    try:
+        submitted, post_id = _decode_cursor(cursor)
+        submitted = datetime.fromisoformat(submitted)
+        post_id = int(post_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return Q(**{f"{submitted_field}__lt": submitted}) | Q(
+        **{submitted_field: submitted, "id__lt": post_id}
+    )
+
+
+def _users_cursor_q(cursor: str) -> Q:
+    """Q object selecting the users after the given cursor in id ascending order."""
+    try:
+        (user_id,) = _decode_cursor(cursor)
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return Q(id__gt=user_id)
+
+
+# lowest fame first, ties by date_joined (most recent first), the order of the index on the projection:
+BULLSHITTERS_ORDERING = ("fame_level_value", "-date_joined", "user_id")
+
+
+def _bullshitters_cursor_q(cursor: str) -> Q:
+    """Q object selecting the bullshitters after the given cursor in BULLSHITTERS_ORDERING."""
+    try:
+        fame_level_value, date_joined, user_id = _decode_cursor(cursor)
+        fame_level_value = int(fame_level_value)
+        date_joined = datetime.fromisoformat(date_joined)
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return (
+        Q(fame_level_value__gt=fame_level_value)
+        | Q(fame_level_value=fame_level_value, date_joined__lt=date_joined)
+        | Q(fame_level_value=fame_level_value, date_joined=date_joined, user_id__gt=user_id)
+    )
+
+
+def cursor_for(item) -> str:
+    """Get the cursor pointing behind the given post, user or bullshitter."""
+    if isinstance(item, Posts):
+        return _encode_cursor(item.submitted.isoformat(), item.id)
+    if isinstance(item, Bullshitters):
+        return _encode_cursor(item.fame_level_value, item.date_joined.isoformat(), item.user_id)
+    return _encode_cursor(item.id)
+
+
+def paginate(items, page_size: int):
+    """Get one page from the result of timeline, search, follows, followers or bullshitters_of_area.
+    Fetches at most page_size + 1 items to find out whether there is a next page.
+    Returns a tuple of the list of items on the page and the cursor of the next page (None on the last page).
+    """
+    items = list(items[: page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, cursor_for(items[-1])
+
+
+# serialization:
+# PostsSerializer reads the engagement counters of the posts and the relations prefetched here, so that serializing
+# a page of posts costs a constant number of queries instead of several queries per post.
+
+
+def with_serialization_data(posts):
+    """Prefetch authors, expertise areas and truth ratings of a queryset of posts. Must be applied before slicing."""
+    return posts.select_related("author").prefetch_related(
+        Prefetch(
+            "postexpertiseareasandratings_set",
+            queryset=PostExpertiseAreasAndRatings.objects.select_related(
+                "expertise_area", "truth_rating"
+            ).order_by("id"),
+        )
+    )
+
+
+def _count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(field).annotate(_count=Count("id")).values("_count")
+        ),
+        0,
+    )
+
+
+def _score_subquery(rating_type):
+    return Subquery(
+        UserRatings.objects.filter(post=OuterRef("pk"), type=rating_type)
+        .order_by()
+        .values("post")
+        .annotate(_score=Sum("score"))
+        .values("_score")
+    )
+
+
+def _repair_counters(queryset, counters):
+    """Recompute the counter fields of the rows in queryset from the given {field: expression} and write those that
+    drifted. The drifted rows are found and written by the database, with one UPDATE per 1000 rows (bulk_update would
+    send a CASE over all rows of the batch for every field). Returns the number of repaired rows."""
+    drifted_ids = list(
+        queryset.order_by()
+        .annotate(**{f"_{field}": expression for field, expression in counters.items()})
+        .filter(reduce(or_, [~Q(**{field: F(f"_{field}")}) for field in counters]))
+        .values_list("id", flat=True)
+    )
+    for i in range(0, len(drifted_ids), 1000):
+        queryset.model.objects.filter(id__in=drifted_ids[i : i + 1000]).update(**counters)
+    return len(drifted_ids)
+
+
+def recompute_post_stats(posts=None):
+    """Recompute the engagement counters of the given posts (all posts by default) from citations, replies and user
+    ratings and repair those that drifted. Returns the number of repaired posts."""
+    if posts is None:
+        posts = Posts.objects.all()
+    return _repair_counters(
+        posts,
+        {
+            "citations_count": _count_subquery(Posts.objects.filter(cites=OuterRef("pk")), "cites"),
+            "replies_count": _count_subquery(Posts.objects.filter(replies_to=OuterRef("pk")), "replies_to"),
+            **{
+                field: Coalesce(_score_subquery(rating_type), 0)
+                for rating_type, field in Posts.RATING_SCORE_FIELDS.items()
+            },
+            **{
+                field: _count_subquery(UserRatings.objects.filter(post=OuterRef("pk"), type=rating_type), "post")
+                for rating_type, field in Posts.RATING_COUNT_FIELDS.items()
+            },
+        },
+    )
+
+
+@replica_reads
+def timeline(
+    user: SocialNetworkUsers,
+    start: int = 0,
+    end: int = None,
+    published=True,
+    community_mode=False,
+    cursor: str = None,
+):
+    """Get the timeline of the user. Assumes that the user is authenticated.
+    If cursor is given, only posts after the cursor are returned (see paginate).
+    On a sharded database (see sharding.py), the community mode is not available and the posts are returned as
+    sharding.MergedPosts."""
+
+    if sharding.enabled():
+        if community_mode:
+            raise ValueError("The community timeline is not available on a sharded database")
+        posts = sharding.timeline(user, published, _posts_cursor_q(cursor) if cursor else Q())
+        return posts[start:] if end is None else posts[start:end+1]
 
     if community_mode:
         # T4
@@ -27,109 +251,351 @@ def timeline(user: SocialNetworkUsers, start: int = 0, end: int = None, publishe
         # 2. the user is a member of the community
         # 3. the post contains the community’s expertise area
         # 4. the post is published or the user is the author
-
-        pass
-        #########################
-        # add your code here
-        #########################
+        user_communities = CommunityMemberships.objects.filter(socialnetworkusers=user).values("expertiseareas")
+        # driven by the index on (expertise_area, post): the posts in the user's communities whose author is a member
+        # of the community, too. The members of the user's communities are read once from the index on
+        # (expertise area, user) and exclude the posts of all other authors before checking the membership per area:
+        community_posts = PostExpertiseAreasAndRatings.objects.filter(
+            Exists(
+                CommunityMemberships.objects.filter(
+                    socialnetworkusers=OuterRef("post__author"),
+                    expertiseareas=OuterRef("expertise_area"),
+                )
+            ),
+            expertise_area__in=user_communities,
+            post__author__in=CommunityMemberships.objects.filter(expertiseareas__in=user_communities).values(
+                "socialnetworkusers"
+            ),
+        ).values("post")
+        posts = Posts.objects.filter(
+            Q(id__in=community_posts)
+            & (Q(published=published) | Q(author=user))
+            & (_posts_cursor_q(cursor) if cursor else Q())
+        ).order_by("-submitted", "-id")
 
     else:
         # in standard mode, posts of followed users are displayed
-        _follows = user.follows.all()
+        # read from the materialized timeline (see _fan_out_post), the filter must stay a single filter() call
+        # so that both conditions on timeline_entries refer to the same join:
         posts = Posts.objects.filter(
-            (Q(author__in=_follows) & Q(published=published)) | Q(author=user)
-        ).order_by("-submitted")
+            Q(timeline_entries__owner=user)
+            & (Q(timeline_entries__published=published) | Q(timeline_entries__author=user))
+            & (
+                _posts_cursor_q(cursor, submitted_field="timeline_entries__submitted")
+                if cursor
+                else Q()
+            )
+        ).order_by("-timeline_entries__submitted", "-id")
+    posts = with_serialization_data(posts)
     if end is None:
         return posts[start:]
     else:
         return posts[start:end+1]
 
 
-def search(keyword: str, start: int = 0, end: int = None, published=True):
-    """Search for all posts in the system containing the keyword. Assumes that all posts are public"""
+def _timeline_query(user: SocialNetworkUsers, published=True):
+    """Compute the standard mode timeline of the user from posts and follows, i.e. without the materialized
+    timeline. Used to (re)build and check the materialized timeline."""
+    _follows = user.follows.all()
+    return Posts.objects.filter(
+        (Q(author__in=_follows) & Q(published=published)) | Q(author=user)
+    ).order_by("-submitted")
+
+
+def _timeline_entries_for(owner_ids, posts):
+    """Create (unsaved) timeline entries for every combination of owner id and post."""
+    return [
+        TimelineEntries(
+            owner_id=owner_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            submitted=post.submitted,
+            published=post.published,
+        )
+        for owner_id in owner_ids
+        for post in posts
+    ]
+
+
+def _fan_out_post(post: Posts):
+    """Insert a new post into the materialized timelines of its author and of all followers of the author."""
+    owner_ids = [post.author_id] + list(
+        SocialNetworkUsers.follows.through.objects.filter(
+            to_socialnetworkusers_id=post.author_id
+        ).values_list("from_socialnetworkusers_id", flat=True)
+    )
+    TimelineEntries.objects.bulk_create(
+        _timeline_entries_for(owner_ids, [post]), ignore_conflicts=True
+    )
+
+
+def rebuild_timeline(user: SocialNetworkUsers):
+    """Rebuild the materialized timeline of the user from existing posts and follows.
+    Returns the number of timeline entries written."""
     posts = Posts.objects.filter(
-        Q(content__icontains=keyword)
-        | Q(author__email__icontains=keyword)
-        | Q(author__first_name__icontains=keyword)
-        | Q(author__last_name__icontains=keyword),
+        Q(author__in=user.follows.all()) | Q(author=user)
+    ).only("id", "author_id", "submitted", "published")
+    TimelineEntries.objects.filter(owner=user).delete()
+    entries = TimelineEntries.objects.bulk_create(
+        _timeline_entries_for([user.id], posts), batch_size=1000
+    )
+    return len(entries)
+
+
+@replica_reads
+def check_timeline(user: SocialNetworkUsers):
+    """Compare the materialized timeline of the user with the timeline computed from posts and follows.
+    Returns a dictionary with the ids of posts that are missing in the materialized timeline and the ids of posts
+    that are displayed although they should not be. Both lists are empty if the materialized timeline is consistent.
+    """
+    missing, unexpected = set(), set()
+    for published in (True, False):
+        expected = set(_timeline_query(user, published=published).values_list("id", flat=True))
+        actual = set(timeline(user, published=published).values_list("id", flat=True))
+        missing |= expected - actual
+        unexpected |= actual - expected
+    return {"missing": sorted(missing), "unexpected": sorted(unexpected)}
+
+
+@replica_reads
+def search(
+    keyword: str,
+    start: int = 0,
+    end: int = None,
+    published=True,
+    cursor: str = None,
+    ranked: bool = False,
+):
+    """Search for all posts in the system containing the keyword. Assumes that all posts are public.
+    If cursor is given, only posts after the cursor are returned (see paginate).
+    If ranked, posts are ordered by relevance instead of newest first, this cannot be combined with a cursor and
+    should be combined with end to limit the number of ranked posts."""
+    if ranked and cursor:
+        raise ValueError("Ranked search results cannot be paged with a cursor")
+    if sharding.enabled():
+        # without the search index and the ranking, newest first:
+        posts = sharding.search(keyword, published, _posts_cursor_q(cursor) if cursor else Q())
+        return posts[start:] if end is None else posts[start:end+1]
+    posts = get_search_backend().search(
+        keyword,
         published=published,
-    ).order_by("-submitted")
+        ranked=ranked,
+        limit=None if end is None else end + 1,
+    )
+    if cursor:
+        posts = posts.filter(_posts_cursor_q(cursor))
+    posts = with_serialization_data(posts)
     if end is None:
         return posts[start:]
     else:
         return posts[start:end+1]
 
 
-def follows(user: SocialNetworkUsers, start: int = 0, end: int = None):
-    """Get the users followed by this user. Assumes that the user is authenticated."""
-    _follows = user.follows.all()
+@replica_reads
+def follows(user: SocialNetworkUsers, start: int = 0, end: int = None, cursor: str = None):
+    """Get the users followed by this user. Assumes that the user is authenticated.
+    If cursor is given, only users after the cursor are returned (see paginate)."""
+    _follows = user.follows.order_by("id")
+    if cursor:
+        _follows = _follows.filter(_users_cursor_q(cursor))
     if end is None:
         return _follows[start:]
     else:
         return _follows[start:end+1]
 
 
-def followers(user: SocialNetworkUsers, start: int = 0, end: int = None):
-    """Get the followers of this user. Assumes that the user is authenticated."""
-    _followers = user.followed_by.all()
+@replica_reads
+def followers(user: SocialNetworkUsers, start: int = 0, end: int = None, cursor: str = None):
+    """Get the followers of this user. Assumes that the user is authenticated.
+    If cursor is given, only users after the cursor are returned (see paginate)."""
+    _followers = user.followed_by.order_by("id")
+    if cursor:
+        _followers = _followers.filter(_users_cursor_q(cursor))
     if end is None:
         return _followers[start:]
     else:
         return _followers[start:end+1]
 
 
+# the follows table, unique on (from_socialnetworkusers, to_socialnetworkusers):
+_Follows = SocialNetworkUsers.follows.through
+
+
+def _user_ids(users):
+    """Ids of the given users or user ids."""
+    return {getattr(user, "id", user) for user in users}
+
+
+@replica_reads
+def is_following(user: SocialNetworkUsers, other: SocialNetworkUsers) -> bool:
+    """Check whether user follows other with an EXISTS query on the unique index of the follows table."""
+    return _Follows.objects.filter(
+        from_socialnetworkusers=user, to_socialnetworkusers=other
+    ).exists()
+
+
+@replica_reads
+def followee_ids(user: SocialNetworkUsers) -> set:
+    """Get the ids of the users followed by this user from the follows table, without loading the users."""
+    return set(
+        _Follows.objects.filter(from_socialnetworkusers=user).values_list(
+            "to_socialnetworkusers", flat=True
+        )
+    )
+
+
+@API_DURATION.time(function="follow_many")
+@serialized_write
+def follow_many(user: SocialNetworkUsers, users_to_follow) -> list:
+    """Follow all given users (or user ids) at once, with a constant number of queries. Returns the ids of the users
+    that were not followed before. Keeps the follow counters and the materialized timeline of the user up to date."""
+    ids = _user_ids(users_to_follow)
+    with transaction.atomic():
+        new_ids = sorted(
+            ids
+            - set(
+                _Follows.objects.filter(
+                    from_socialnetworkusers=user, to_socialnetworkusers__in=ids
+                ).values_list("to_socialnetworkusers", flat=True)
+            )
+        )
+        if not new_ids:
+            return []
+        _Follows.objects.bulk_create(
+            [
+                _Follows(from_socialnetworkusers_id=user.id, to_socialnetworkusers_id=followee_id)
+                for followee_id in new_ids
+            ]
+        )
+        SocialNetworkUsers.objects.filter(id=user.id).update(
+            follows_count=F("follows_count") + len(new_ids)
+        )
+        SocialNetworkUsers.objects.filter(id__in=new_ids).update(
+            followers_count=F("followers_count") + 1
+        )
+        # add the posts of the followed users to the materialized timeline:
+        TimelineEntries.objects.bulk_create(
+            _timeline_entries_for(
+                [user.id],
+                Posts.objects.filter(author__in=new_ids).only(
+                    "id", "author_id", "submitted", "published"
+                ),
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    user.follows_count += len(new_ids)
+    if user.id in new_ids:
+        user.followers_count += 1
+    return new_ids
+
+
+@API_DURATION.time(function="unfollow_many")
+@serialized_write
+def unfollow_many(user: SocialNetworkUsers, users_to_unfollow) -> list:
+    """Unfollow all given users (or user ids) at once, with a constant number of queries. Returns the ids of the users
+    that were followed before. Keeps the follow counters and the materialized timeline of the user up to date."""
+    ids = _user_ids(users_to_unfollow)
+    with transaction.atomic():
+        removed_ids = sorted(
+            _Follows.objects.filter(
+                from_socialnetworkusers=user, to_socialnetworkusers__in=ids
+            ).values_list("to_socialnetworkusers", flat=True)
+        )
+        if not removed_ids:
+            return []
+        _Follows.objects.filter(
+            from_socialnetworkusers=user, to_socialnetworkusers__in=removed_ids
+        ).delete()
+        SocialNetworkUsers.objects.filter(id=user.id).update(
+            follows_count=F("follows_count") - len(removed_ids)
+        )
+        SocialNetworkUsers.objects.filter(id__in=removed_ids).update(
+            followers_count=F("followers_count") - 1
+        )
+        # remove the posts of the unfollowed users from the materialized timeline (own posts always stay):
+        TimelineEntries.objects.filter(owner=user, author__in=removed_ids).exclude(
+            author=user
+        ).delete()
+    user.follows_count -= len(removed_ids)
+    if user.id in removed_ids:
+        user.followers_count -= 1
+    return removed_ids
+
+
 def follow(user: SocialNetworkUsers, user_to_follow: SocialNetworkUsers):
     """Follow a user. Assumes that the user is authenticated. If user already follows the user, signal that."""
-    if user_to_follow in user.follows.all():
-        return {"followed": False}
-    user.follows.add(user_to_follow)
-    user.save()
-    return {"followed": True}
+    return {"followed": bool(follow_many(user, [user_to_follow]))}
 
 
 def unfollow(user: SocialNetworkUsers, user_to_unfollow: SocialNetworkUsers):
     """Unfollow a user. Assumes that the user is authenticated. If user does not follow the user anyway, signal that."""
-    if user_to_unfollow not in user.follows.all():
-        return {"unfollowed": False}
-    user.follows.remove(user_to_unfollow)
-    user.save()
-    return {"unfollowed": True}
+    return {"unfollowed": bool(unfollow_many(user, [user_to_unfollow]))}
+
+
+def recompute_follow_counts(users=None):
+    """Recompute the follow counters of the given users (all users by default) from the follows table and repair those
+    that drifted. Returns the number of repaired users."""
+    if users is None:
+        users = SocialNetworkUsers.objects.all()
+    return _repair_counters(
+        users,
+        {
+            "follows_count": _count_subquery(
+                _Follows.objects.filter(from_socialnetworkusers=OuterRef("pk")), "from_socialnetworkusers"
+            ),
+            "followers_count": _count_subquery(
+                _Follows.objects.filter(to_socialnetworkusers=OuterRef("pk")), "to_socialnetworkusers"
+            ),
+        },
+    )
 
 # functions used for T1 and T2
-def should_publish_post(user, expertise_area):
+def _fame_entry(user, expertise_area, fame_entries):
+    if fame_entries is not None:
+        return fame_entries.get(expertise_area.id)
+    return user.fame_set.filter(expertise_area=expertise_area).order_by("id").first()
+
+
+def should_publish_post(user, expertise_area, fame_entries=None):
     """
     Check if a post should be published based on the user's fame profile.
     Do not publish posts that have an expertise area marked negative in the user's fame profile.
+    fame_entries (the fame entries of the user keyed by expertise area id) avoids querying the fame profile.
     """
-    fame_entry = user.fame_set.filter(expertise_area=expertise_area).first()
-    if fame_entry and fame_entry.fame_level.numeric_value < 0:
+    fame_entry = _fame_entry(user, expertise_area, fame_entries)
+    if fame_entry and fame_levels.get(fame_entry.fame_level_id).numeric_value < 0:
         return False
     return True
 
 
-def adjust_fame_profile(user: SocialNetworkUsers, expertise_area: ExpertiseAreas, truth_rating):
+def adjust_fame_profile(
+    user: SocialNetworkUsers, expertise_area: ExpertiseAreas, truth_rating, fame_entries=None
+):
     """
     Adjusts a user's fame profile in a given expertise area based on a truth rating.
     If the truth rating is negative, the user's fame level may decrease.
     If a user's fame level drops below "Super Pro" in a community they are part of,
     they are automatically removed from that community.
+    fame_entries (the fame entries of the user keyed by expertise area id) avoids querying the fame profile, it is
+    kept up to date.
     """
     # Only adjust if a truth rating is provided and it's negative
     if truth_rating and truth_rating.numeric_value < 0:
-        fame_entry = user.fame_set.filter(expertise_area=expertise_area).first()
-        super_pro_level = FameLevels.objects.get(name="Super Pro")
+        fame_entry = _fame_entry(user, expertise_area, fame_entries)
+        super_pro_level = fame_levels.get_by_name("Super Pro")
         super_pro_value = super_pro_level.numeric_value
 
         if fame_entry:
             # Find the next lower fame level based on numeric_value
-            lower_fame_level = FameLevels.objects.filter(
-                numeric_value__lt=fame_entry.fame_level.numeric_value
-            ).order_by("-numeric_value").first()
+            fame_entry.fame_level = fame_levels.get(fame_entry.fame_level_id)
+            lower_fame_level = fame_levels.next_lower(fame_entry.fame_level.numeric_value)
 
             if lower_fame_level:
                 # Decrease the fame level if a lower one exists
                 fame_entry.fame_level = lower_fame_level
-                fame_entry.save()
+                fame_entry.save(update_fields=["fame_level"])
+                FAME_ADJUSTMENTS.inc(change="lowered")
             else:
                 # If no lower fame level, ban the user (set is_active to False)
                 ban_user(user)
@@ -138,21 +604,27 @@ def adjust_fame_profile(user: SocialNetworkUsers, expertise_area: ExpertiseAreas
             if fame_entry.fame_level.numeric_value < super_pro_value:
                 # Check if 'communities' attribute exists and is not None
                 if hasattr(user, 'communities') and user.communities is not None:
-                    # Check if the expertise_area is one of the user's communities
-                    if expertise_area in user.communities.all():
-                        user.communities.remove(expertise_area)
-                        user.save() # Save the user after removing from the community
+                    # removing is a no-op if the expertise_area is not one of the user's communities
+                    user.communities.remove(expertise_area)
         else:
             # If no fame entry exists for this expertise area and a negative truth rating is given,
             # create a "Confuser" entry for the user in this expertise area.
-            confuser_level = FameLevels.objects.filter(name="Confuser").first()
+            try:
+                confuser_level = fame_levels.get_by_name("Confuser")
+            except FameLevels.DoesNotExist:
+                confuser_level = None
             if confuser_level: # Ensure Confuser level exists
-                Fame.objects.create(
+                fame_entry = Fame.objects.create(
                     user=user, expertise_area=expertise_area, fame_level=confuser_level
                 )
+                FAME_ADJUSTMENTS.inc(change="created")
+                if fame_entries is not None:
+                    fame_entries[expertise_area.id] = fame_entry
 
 
 
+@API_DURATION.time(function="ban_user")
+@serialized_write
 def ban_user(user):
     """
     Ban a user from the social network:
@@ -161,61 +633,87 @@ def ban_user(user):
     - Unpublish all their posts.
     """
     user.is_active = False
-    user.save()
+    user.save(update_fields=["is_active"])
+    BANS.inc()
 
     # Unpublish all posts by the user
-    user.posts_set.update(published=False)
+    # on the shard of the user with sharding (see sharding.ShardRouter):
+    POSTS_UNPUBLISHED.inc(user.posts_set.filter(published=True).update(published=False), reason="ban")
+    if not sharding.enabled():
+        TimelineEntries.objects.filter(author=user).update(published=False)
+        get_search_backend().set_published(user.posts_set.all(), False)
     
 # and of functions used for T1 and T2
 
 
+@API_DURATION.time(function="submit_post")
 def submit_post(
     user: SocialNetworkUsers,
     content: str,
     cites: Posts = None,
     replies_to: Posts = None,
+    asynchronous: bool = None,
 ):
     """Submit a post for publication. Assumes that the user is authenticated.
     returns a tuple of three elements:
-    1. a dictionary with the keys "published" and "id" (the id of the post)
+    1. a dictionary with the keys "published" and "id" (the id of the post) and, if submitted asynchronously,
+       "pending" (True while the post waits for classification)
     2. a list of dictionaries containing the expertise areas and their truth ratings
     3. a boolean indicating whether the user was banned and logged out and should be redirected to the login page
+    If asynchronous (default: setting SOCIALNETWORK_ASYNC_CLASSIFICATION), the post is stored unpublished and queued
+    for classification by the worker, the list of expertise areas is empty and the user is never redirected.
+    On a sharded database (see sharding.py), posts are always classified on submission.
     """
-
-    # create post  instance:
-    post = Posts.objects.create(
-        content=content,
-        author=user,
-        cites=cites,
-        replies_to=replies_to,
-    )
-
-    # classify the content into expertise areas:
-    _at_least_one_expertise_area_contains_bullshit, _expertise_areas = (
-        post.determine_expertise_areas_and_truth_ratings()
-    )
-    
-    # Determine if post should be published based on content analysis and user's fame profile
-    post.published = not _at_least_one_expertise_area_contains_bullshit
-    
-    # T1: Check if post should be published based on user's fame profile
-    # to improve
-    if post.published:  # Only check fame if content is not bullshit
-        
-        for epa in _expertise_areas:
-            if not should_publish_post(user, epa["expertise_area"]):
-                post.published = False
-                break
-    #same (opti)
-    # T2: Adjust fame profile based on truth ratings
-    for epa in _expertise_areas:
-        adjust_fame_profile(user, epa["expertise_area"], epa["truth_rating"])
-
-    # Refresh user state and check if user was banned after fame adjustments
-    user.refresh_from_db()
-    redirect_to_logout = not user.is_active
-
-    post.save()
+    if asynchronous is None:
+        asynchronous = getattr(settings, "SOCIALNETWORK_ASYNC_CLASSIFICATION", False)
+    if sharding.enabled():
+        asynchronous = False
+
+    # classifying does not touch the database, do it before taking the write lock and opening the transaction:
+    _expertise_areas = None if asynchronous else classify_into_expertise_areas_and_check_for_bullshit(content)
+
+    ret = _store_post(user, content, cites, replies_to, asynchronous, _expertise_areas)
+    POSTS_SUBMITTED.inc(mode="asynchronous" if asynchronous else "synchronous")
+    return ret
+
+
+@serialized_write
+def _store_post(user, content, cites, replies_to, asynchronous, _expertise_areas):
+    """The writes of submit_post, which returns the result."""
+    # on a sharded database, the post goes to the shard of its author with an id unique across the shards:
+    post_id = sharding.next_post_id()
+    db = sharding.db_for_author(user.id)
+    # the post, its classification, the fame adjustments of its author and the timeline and search index entries
+    # are written all or nothing:
+    with transaction.atomic(), sharding.atomic(db):
+        # create post  instance:
+        post = Posts.objects.using(db).create(
+            id=post_id,
+            content=content,
+            author=user,
+            cites=cites,
+            replies_to=replies_to,
+        )
+        if cites is not None:
+            Posts.objects.using(sharding.db_for_author(cites.author_id)).filter(id=cites.id).update(
+                citations_count=F("citations_count") + 1
+            )
+        if replies_to is not None:
+            Posts.objects.using(sharding.db_for_author(replies_to.author_id)).filter(id=replies_to.id).update(
+                replies_count=F("replies_count") + 1
+            )
+
+        if asynchronous:
+            ClassificationTasks.objects.create(post=post)
+            # the post is visible to its author right away, to everybody else once the worker published it:
+            _fan_out_post(post)
+            get_search_backend().index_posts([post])
+            return {"published": False, "id": post.id, "pending": True}, [], False
+
+        _expertise_areas, redirect_to_logout = classify_and_publish(post, _expertise_areas)
+        if db is None:
+            _fan_out_post(post)
+            get_search_backend().index_posts([post])
 
     return (
         {"published": post.published, "id": post.id},
@@ -224,37 +722,150 @@ def submit_post(
     )
 
 
+def classify_and_publish(post: Posts, _expertise_areas=None):
+    """Classify a new post, decide whether to publish it (T1) and adjust the fame profile of its author (T2).
+    Writes the published flag of the post. Returns a tuple of the list of expertise areas with their truth ratings
+    and a boolean indicating whether the author was banned.
+    The classification can be passed in if it was computed beforehand (see worker.process_task).
+    Should run in a transaction, so that a failure does not leave a partially classified post behind."""
+    # classify the content into expertise areas:
+    if _expertise_areas is None:
+        _expertise_areas = classify_into_expertise_areas_and_check_for_bullshit(post.content)
+    return classify_and_publish_many([post], [_expertise_areas])[0]
+
+
+@API_DURATION.time(function="classify_and_publish_many")
+@serialized_write
+def classify_and_publish_many(posts, classifications):
+    """classify_and_publish for new posts in the order of their submission, given their classifications (see
+    magic_AI.classify_many). The result is the same as calling classify_and_publish for every post, but the expertise
+    areas of all posts are inserted and the fame profiles of their authors loaded with one query each and the
+    published flags written with at most two, only fame adjustments are written one by one.
+    Returns a list of tuples like classify_and_publish, one per post."""
+    # one insert per shard on a sharded database (see sharding.py):
+    for db, post_classifications in sharding.by_database(
+        zip(posts, classifications), lambda item: item[0].author_id
+    ).items():
+        PostExpertiseAreasAndRatings.objects.using(db).bulk_create(
+            [
+                PostExpertiseAreasAndRatings(
+                    post=post,
+                    expertise_area=epa["expertise_area"],
+                    truth_rating=epa["truth_rating"],
+                )
+                for post, _expertise_areas in post_classifications
+                for epa in _expertise_areas
+            ]
+        )
+    # the fame profiles of the authors in the areas of their posts, shared by T1 and T2:
+    areas_by_author = defaultdict(set)
+    for post, _expertise_areas in zip(posts, classifications):
+        areas_by_author[post.author_id].update(epa["expertise_area"].id for epa in _expertise_areas)
+    if len(areas_by_author) == 1:
+        ((author_id, area_ids),) = areas_by_author.items()
+        fame_query = Fame.objects.filter(user_id=author_id, expertise_area_id__in=area_ids)
+    else:
+        # select the entries by id, a condition per author takes longer to compile than to run:
+        fame_query = Fame.objects.filter(
+            id__in=[
+                fame_id
+                for fame_id, user_id, expertise_area_id in Fame.objects.filter(user__in=areas_by_author)
+                .order_by()
+                .values_list("id", "user_id", "expertise_area_id")
+                if expertise_area_id in areas_by_author[user_id]
+            ]
+        )
+    fame_entries = defaultdict(dict)
+    for fame_entry in fame_query.order_by():
+        fame_entries[fame_entry.user_id][fame_entry.expertise_area_id] = fame_entry
+
+    results = []
+    # the LSH index and the bullshitters projection are updated once at the end, not for every adjusted fame entry:
+    with deferred_indexing(), deferred_bullshitter_updates():
+        for post, _expertise_areas in zip(posts, classifications):
+            user = post.author
+
+            # Determine if post should be published based on content analysis and user's fame profile
+            post.published = not any(
+                epa["truth_rating"] and epa["truth_rating"].numeric_value < 0 for epa in _expertise_areas
+            )
+
+            # T1: Check if post should be published based on user's fame profile
+            if post.published:  # Only check fame if content is not bullshit
+                post.published = all(
+                    should_publish_post(user, epa["expertise_area"], fame_entries[user.id])
+                    for epa in _expertise_areas
+                )
+
+            # T2: Adjust fame profile based on truth ratings
+            for epa in _expertise_areas:
+                adjust_fame_profile(user, epa["expertise_area"], epa["truth_rating"], fame_entries[user.id])
+
+            # ban_user updates the instance, so there is no need to reload the user:
+            results.append((_expertise_areas, not user.is_active))
+
+    # also covers authors banned while their post was waiting for classification, and the earlier posts in the batch
+    # of authors banned by a later one (ban_user unpublished them in the database only):
+    banned_ids = {post.author_id for post in posts if not post.author.is_active}
+    for post in posts:
+        if post.author_id in banned_ids:
+            post.published = False
+    for db, db_posts in sharding.by_database(posts, lambda post: post.author_id).items():
+        for published in (True, False):
+            ids = [post.id for post in db_posts if post.published == published]
+            if ids:
+                Posts.objects.using(db).filter(id__in=ids).update(published=published)
+    published_count = sum(post.published for post in posts)
+    POSTS_PUBLISHED.inc(published_count)
+    POSTS_UNPUBLISHED.inc(len(posts) - published_count, reason="classification")
+
+    return results
+
+
+@API_DURATION.time(function="rate_post")
+@serialized_write
 def rate_post(
     user: SocialNetworkUsers, post: Posts, rating_type: str, rating_score: int
 ):
     """Rate a post. Assumes that the user is authenticated. If user already rated the post with the given rating_type,
     update that rating score."""
-    user_rating = None
-    try:
-        user_rating = user.userratings_set.get(post=post, rating_type=rating_type)
-    except user.userratings_set.model.DoesNotExist:
-        pass
-
     if user == post.author:
         raise PermissionError(
             "User is the author of the post. You cannot rate your own post."
         )
 
-    if user_rating is not None:
-        # update the existing rating:
-        user_rating.rating_score = rating_score
-        user_rating.save()
-        return {"rated": True, "type": "update"}
-    else:
-        # create a new rating:
-        user.userratings_set.add(
-            post,
-            through_defaults={"rating_type": rating_type, "rating_score": rating_score},
+    score_field = Posts.RATING_SCORE_FIELDS[rating_type]
+    count_field = Posts.RATING_COUNT_FIELDS[rating_type]
+    # the shard of the post's author on a sharded database (see sharding.py):
+    db = sharding.db_for_author(post.author_id)
+    with transaction.atomic(using=db):
+        user_rating = (
+            UserRatings.objects.using(db).select_for_update()
+            .filter(user=user, post=post, type=rating_type)
+            .first()
         )
-        user.save()
-        return {"rated": True, "type": "new"}
 
+        if user_rating is not None:
+            # update the existing rating:
+            delta = rating_score - user_rating.score
+            user_rating.score = rating_score
+            user_rating.save(update_fields=["score"])
+            counters = {score_field: F(score_field) + delta} if delta else {}
+            ret = {"rated": True, "type": "update"}
+        else:
+            # create a new rating:
+            UserRatings.objects.using(db).create(
+                user=user, post=post, type=rating_type, score=rating_score
+            )
+            counters = {score_field: F(score_field) + rating_score, count_field: F(count_field) + 1}
+            ret = {"rated": True, "type": "new"}
 
+        if counters:
+            Posts.objects.using(db).filter(id=post.id).update(**counters)
+    return ret
+
+
+@replica_reads
 def fame(user: SocialNetworkUsers):
     """Get the fame of a user. Assumes that the user is authenticated."""
     try:
@@ -262,35 +873,106 @@ def fame(user: SocialNetworkUsers):
     except SocialNetworkUsers.DoesNotExist:
         raise ValueError("User does not exist")
 
-    return user, Fame.objects.filter(user=user)
+    return user, Fame.objects.filter(user=user).select_related("expertise_area", "fame_level")
+
+
+# expertise area hierarchy, read from the closure table (see socialnetwork/hierarchy.py):
 
 
+@replica_reads
+def expertise_area_ancestors(expertise_area: ExpertiseAreas):
+    """Get the ancestors of an expertise area, its parent first."""
+    return ExpertiseAreas.objects.filter(
+        descendant_links__descendant=expertise_area, descendant_links__depth__gt=0
+    ).order_by("descendant_links__depth")
+
+
+@replica_reads
+def expertise_area_descendants(expertise_area: ExpertiseAreas):
+    """Get all subareas of an expertise area (at any depth), ordered by depth and label."""
+    return ExpertiseAreas.objects.filter(
+        ancestor_links__ancestor=expertise_area, ancestor_links__depth__gt=0
+    ).order_by("ancestor_links__depth", "label", "id")
+
+
+@replica_reads
+def expertise_area_subtree(expertise_area: ExpertiseAreas):
+    """Get an expertise area and all its subareas, ordered by depth and label."""
+    return ExpertiseAreas.objects.filter(ancestor_links__ancestor=expertise_area).order_by(
+        "ancestor_links__depth", "label", "id"
+    )
+
+
+@replica_reads
+def posts_in_expertise_area(
+    expertise_area: ExpertiseAreas, published=True, include_subareas: bool = True, cursor: str = None
+):
+    """Get the posts classified into an expertise area or, if include_subareas, into any of its subareas, newest
+    first. If cursor is given, only posts after the cursor are returned (see paginate)."""
+    if include_subareas:
+        classifications = PostExpertiseAreasAndRatings.objects.filter(
+            post=OuterRef("pk"), expertise_area__ancestor_links__ancestor=expertise_area
+        )
+    else:
+        classifications = PostExpertiseAreasAndRatings.objects.filter(
+            post=OuterRef("pk"), expertise_area=expertise_area
+        )
+    posts = Posts.objects.filter(Exists(classifications), published=published)
+    if cursor:
+        posts = posts.filter(_posts_cursor_q(cursor))
+    return with_serialization_data(posts.order_by("-submitted", "-id"))
+
+
+@API_DURATION.time(function="bullshitters")
+@replica_reads
 def bullshitters():
     """
     Identifies and returns users with negative fame levels, categorized by expertise area.
     These are considered "bullshitters" in their respective areas.
+    Returns a dictionary mapping each expertise area to a list of dictionaries with the keys "user" and
+    "fame_level_numeric", ranked by fame (lowest first) and date_joined (most recent first).
+    Reads the whole projection, use bullshitters_of_area to read a single page.
     """
     result = defaultdict(list)
-    # Filter for fame entries with negative numeric values, and prefetch related objects for efficiency
-    negative_fame_entries = Fame.objects.filter(
-        fame_level_numeric_value_lt=0
-    ).select_related(
-        'user', 'expertise_area', 'fame_level' # Prefetch related user, expertise_area, and fame_level objects
-    ).order_by(
-        'expertise_area__label', # Order by expertise area label
-        'fame_level__numeric_value', # Then by fame level (ascending, more negative first)
-        '-user__date_joined' # Then by date joined (most recent first) for ties
+    entries = Bullshitters.objects.select_related("user", "expertise_area").order_by(
+        "expertise_area__label", "expertise_area_id", *BULLSHITTERS_ORDERING
     )
-    for fame_entry in negative_fame_entries:
-        expertise_area = fame_entry.expertise_area
-        user_info = {
-            "user": fame_entry.user,
-            "fame_level_numeric": fame_entry.fame_level.numeric_value
-        }
-        result[expertise_area].append(user_info)
-    return dict(result) # Convert defaultdict to regular dict for return
+    for entry in entries:
+        result[entry.expertise_area].append(
+            {"user": entry.user, "fame_level_numeric": entry.fame_level_value}
+        )
+    return dict(result)
+
+
+@replica_reads
+def bullshitters_of_area(expertise_area: ExpertiseAreas, cursor: str = None):
+    """Get the ranked bullshitters (see bullshitters) of an expertise area as a queryset of Bullshitters with the users
+    loaded. If cursor is given, only the entries after the cursor are returned (see paginate)."""
+    entries = Bullshitters.objects.filter(expertise_area=expertise_area)
+    if cursor:
+        entries = entries.filter(_bullshitters_cursor_q(cursor))
+    return entries.select_related("user").order_by(*BULLSHITTERS_ORDERING)
 
 
+@replica_reads
+def bullshitters_pages(page_size: int, expertise_area_id=None, cursor: str = None):
+    """Get the first page of ranked bullshitters (see bullshitters_of_area) of every expertise area having
+    bullshitters, the page of the area with the given id starts after the cursor instead. Every page is read from the
+    index with a LIMIT of page_size + 1 (see paginate), so the queries do not depend on the size of the projection.
+    Returns a list of (expertise area, entries, next cursor) tuples ordered by the label of the area."""
+    pages = []
+    for area in bullshitter_areas():
+        area_cursor = cursor if str(area.id) == str(expertise_area_id) else None
+        pages.append((area, *paginate(bullshitters_of_area(area, area_cursor), page_size)))
+    return pages
+
+
+@replica_reads
+def bullshitter_areas():
+    """Get the expertise areas having bullshitters, ordered by label."""
+    return ExpertiseAreas.objects.filter(
+        Exists(Bullshitters.objects.filter(expertise_area=OuterRef("pk")))
+    ).order_by("label", "id")
 
 
 def join_community(user: SocialNetworkUsers, community: ExpertiseAreas):
@@ -313,12 +995,25 @@ def leave_community(user: SocialNetworkUsers, community: ExpertiseAreas):
 
 
 
-def similar_users(user: SocialNetworkUsers):
-    """Compute the similarity of user with all other users. The method returns a QuerySet of FameUsers annotated
-    with an additional field 'similarity'. Sort the result in descending order according to 'similarity', in case
-    there is a tie, within that tie sort by date_joined (most recent first)"""
-    pass
-    #########################
-    # add your code here
-    #########################
-
+@API_DURATION.time(function="similar_users")
+@replica_reads
+def similar_users(user: SocialNetworkUsers, limit: int = None, approximate: bool = False):
+    """Compute the similarity of user with all other users. The method returns a list of SocialNetworkUsers annotated
+    with an additional field 'similarity' (see socialnetwork.similarity), users with a similarity of 0 are left out.
+    The result is sorted in descending order according to 'similarity', in case there is a tie, within that tie by
+    date_joined (most recent first). If limit is given, only the limit most similar users are returned.
+    If approximate, only users found by the LSH index are compared, which may miss some similar users but does
+    not need to hold the fame profiles of all users in memory."""
+    if approximate:
+        user_ids, similarities = approximate_similarities(user.id, limit)
+    else:
+        user_ids, similarities = fame_matrix.similarities(user.id)
+        if limit is not None:
+            user_ids, similarities = user_ids[:limit], similarities[:limit]
+    users = SocialNetworkUsers.objects.in_bulk(user_ids.tolist())
+    result = []
+    for user_id, similarity in zip(user_ids.tolist(), similarities.tolist()):
+        if user_id in users:
+            users[user_id].similarity = similarity
+            result.append(users[user_id])
+    return result
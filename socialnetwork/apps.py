@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "socialnetwork"
+
+    def ready(self):
+        # connects the signals invalidating the cached reference tables:
+        from socialnetwork import reference_tables  # noqa: F401
+        # connects the signals keeping the fame matrix of similar_users up to date:
+        from socialnetwork import similarity  # noqa: F401
+        # connects the signals maintaining the bullshitters projection:
+        from socialnetwork import bullshitters  # noqa: F401
+        # connects the signals maintaining the closure table of the expertise area hierarchy:
+        from socialnetwork import hierarchy  # noqa: F401
+        # creates the search index where the migrations did not (e.g. regenerated migrations):
+        from socialnetwork.search import create_missing_index
+
+        post_migrate.connect(create_missing_index, sender=self)
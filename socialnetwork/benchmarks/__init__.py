@@ -0,0 +1,279 @@
+"""Benchmarks of the socialnetwork API, run with `python manage.py run_benchmark <name>`.
+
+Every benchmark runs against a freshly migrated throw-away database (see isolated_database), so that generated
+datasets never end up in the development database. A benchmark may return its measurements as a dictionary, which
+can be written to a JSON file and compared against a stored baseline (see compare_to_baseline).
+"""
+
+import json
+import random as rnd
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+from faker.providers.lorem.en_US import Provider as LoremProvider
+
+from fame.models import ExpertiseAreas, Fame, FameLevels, FameUsers
+from famesocialnetwork.bulk import bulk_insert
+from socialnetwork import api
+from socialnetwork.models import Posts, SocialNetworkUsers, TruthRatings
+
+
+@contextmanager
+def isolated_database(on_disk: bool = False):
+    """Create and migrate a test database for the default connection, destroy it afterwards. If on_disk, an SQLite
+    test database is a file next to the database instead of in memory."""
+    old_name = connection.settings_dict["NAME"]
+    old_test_name = connection.settings_dict["TEST"]["NAME"]
+    if on_disk and connection.vendor == "sqlite" and not old_test_name:
+        connection.settings_dict["TEST"]["NAME"] = f"{old_name}.benchmark"
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict["TEST"]["NAME"] = old_test_name
+
+
+def _percentile(timings, fraction: float):
+    """Nearest rank percentile of sorted timings."""
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def measure(function, repeat: int = 20, warmup: int = 0):
+    """Call function warmup times unmeasured and then repeat times, return latency statistics in milliseconds and the
+    highest number of database queries of a measured call."""
+    for _ in range(warmup):
+        function()
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        executed = []
+        with connection.execute_wrapper(lambda execute, *args: executed.append(1) or execute(*args)):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(executed))
+    timings.sort()
+    return {
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "p90": _percentile(timings, 0.90),
+        "p95": _percentile(timings, 0.95),
+        "p99": _percentile(timings, 0.99),
+        "max": timings[-1],
+        "queries": queries,
+    }
+
+
+def write_results(path: str, results: dict):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = 0.5, min_difference: float = 1.0):
+    """Compare the cases of two results of the same benchmark on the same dataset. A case regressed if it needs more
+    queries than in the baseline or if its median latency exceeds the baseline median by more than tolerance (a
+    fraction) and by more than min_difference milliseconds, which keeps the noise of very fast cases from being
+    flagged. Cases missing in either result are not compared. Returns a list of descriptions of the regressions."""
+    for key in ("benchmark", "database", "users", "posts"):
+        if results.get(key) != baseline.get(key):
+            raise ValueError(f"The baseline was measured with {key} {baseline.get(key)}, not {results.get(key)}")
+    regressions = []
+    for name, case in sorted(results["cases"].items()):
+        expected = baseline["cases"].get(name)
+        if expected is None:
+            continue
+        if (
+            case["median"] > expected["median"] * (1 + tolerance)
+            and case["median"] - expected["median"] > min_difference
+        ):
+            regressions.append(
+                f"{name}: median {case['median']:.2f} ms, baseline {expected['median']:.2f} ms "
+                f"(+{case['median'] / expected['median'] - 1:.0%})"
+            )
+        if case["queries"] > expected["queries"]:
+            regressions.append(f"{name}: {case['queries']} queries, baseline {expected['queries']}")
+    return regressions
+
+
+def seed_users(count: int, seed: int = 42):
+    """Create count social network users, returns their ids."""
+    lre = rnd.Random(seed)
+    words = LoremProvider.word_list
+    now = timezone.now()
+    first_id = (FameUsers.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    ids = list(range(first_id, first_id + count))
+    bulk_insert(
+        FameUsers,
+        [
+            (
+                user_id,
+                "",
+                False,
+                lre.choice(words).capitalize(),
+                lre.choice(words).capitalize(),
+                f"user{user_id}@example.com",
+                False,
+                True,
+                now - timedelta(minutes=user_id),
+            )
+            for user_id in ids
+        ],
+        [
+            "id",
+            "password",
+            "is_superuser",
+            "first_name",
+            "last_name",
+            "email",
+            "is_staff",
+            "is_active",
+            "date_joined",
+        ],
+    )
+    bulk_insert(
+        SocialNetworkUsers,
+        [(user_id, False, 0, 0) for user_id in ids],
+        ["fameusers_ptr", "is_banned", "follows_count", "followers_count"],
+    )
+    return ids
+
+
+def seed_posts(count: int, author_ids, seed: int = 42):
+    """Create count published posts of random words by random authors, returns their ids."""
+    lre = rnd.Random(seed)
+    words = LoremProvider.word_list
+    now = timezone.now()
+    first_id = (Posts.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    ids = list(range(first_id, first_id + count))
+    bulk_insert(
+        Posts,
+        [
+            (
+                post_id,
+                " ".join(lre.choices(words, k=lre.randint(8, 30))).capitalize() + ".",
+                lre.choice(author_ids),
+                # distinct timestamps keep (author, submitted) unique:
+                now - timedelta(seconds=count - i),
+                True,
+                0,
+                0,
+                0,
+                0,
+                0,
+                0,
+                0,
+                0,
+            )
+            for i, post_id in enumerate(ids)
+        ],
+        [
+            "id",
+            "content",
+            "author",
+            "submitted",
+            "published",
+            "citations_count",
+            "replies_count",
+            "approval_score",
+            "like_score",
+            "dislike_score",
+            "approval_count",
+            "like_count",
+            "dislike_count",
+        ],
+    )
+    return ids
+
+
+# the fame levels of famesocialnetwork.fakedata:
+FAME_LEVELS = [
+    ("Jedi", 1000),
+    ("Wizard", 300),
+    ("Super Pro", 100),
+    ("Pro", 80),
+    ("Knowledgeable", 40),
+    ("Newbie", 10),
+    ("Zero", 0),
+    ("Confuser", -10),
+    ("Botcher", -40),
+    ("Liar", -80),
+    ("Bullshitter", -100),
+    ("Serious Bullshitter", -300),
+    ("Dangerous Bullshitter", -1000),
+]
+
+
+def seed_follows(user_ids, per_user: int = 20, seed: int = 42):
+    """Let every user follow per_user random other users and update the follow counters."""
+    lre = rnd.Random(seed)
+    rows = []
+    for user_id in user_ids:
+        followee_ids = [i for i in lre.sample(user_ids, min(per_user + 1, len(user_ids))) if i != user_id]
+        rows.extend((user_id, followee_id) for followee_id in followee_ids[:per_user])
+    bulk_insert(
+        SocialNetworkUsers.follows.through, rows, ["from_socialnetworkusers", "to_socialnetworkusers"]
+    )
+    api.recompute_follow_counts()
+
+
+# the truth ratings of famesocialnetwork.fakedata:
+TRUTH_RATINGS = [
+    ("Utter Bullshit", -3),
+    ("Partial Bullshit", -2),
+    ("Misleading", -1),
+    ("Neutral", 0),
+    ("Not rated", 0),
+    ("Mostly True", 1),
+    ("Completely True", 2),
+    ("Insightful", 3),
+]
+
+
+def seed_truth_ratings():
+    """Create the truth ratings needed to classify posts if there are none."""
+    if not TruthRatings.objects.exists():
+        TruthRatings.objects.bulk_create(
+            [TruthRatings(name=name, numeric_value=value) for name, value in TRUTH_RATINGS]
+        )
+
+
+def seed_fame(user_ids, areas: int = 20, max_areas_per_user: int = 10, seed: int = 42):
+    """Create areas expertise areas (and the fame levels if there are none) and give every user a fame entry with a
+    random fame level in 1 to max_areas_per_user random areas."""
+    lre = rnd.Random(seed)
+    if not FameLevels.objects.exists():
+        FameLevels.objects.bulk_create(
+            [FameLevels(name=name, numeric_value=value) for name, value in FAME_LEVELS]
+        )
+    level_ids = list(FameLevels.objects.values_list("id", flat=True))
+    first = ExpertiseAreas.objects.count()
+    ExpertiseAreas.objects.bulk_create(
+        [ExpertiseAreas(label=f"Area {first + i}") for i in range(areas)]
+    )
+    area_ids = list(ExpertiseAreas.objects.values_list("id", flat=True))
+    bulk_insert(
+        Fame,
+        [
+            (user_id, area_id, lre.choice(level_ids))
+            for user_id in user_ids
+            for area_id in lre.sample(area_ids, lre.randint(1, min(max_areas_per_user, len(area_ids))))
+        ],
+        ["user", "expertise_area", "fame_level"],
+    )
+
+
+def print_table(stdout, header, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        stdout.write("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,71 @@
+"""Query plan and latency of the community mode of api.timeline."""
+
+import random as rnd
+
+from fame.models import ExpertiseAreas
+from famesocialnetwork.bulk import bulk_insert
+from socialnetwork import api
+from socialnetwork.benchmarks import measure, print_table, seed_posts, seed_users
+from socialnetwork.models import PostExpertiseAreasAndRatings, SocialNetworkUsers
+
+PAGE_SIZE = 50
+AREAS = 50
+# indexes the plan has to use instead of scanning the tables:
+EXPECTED_INDEXES = ["pear_area_post_idx", "communities_area_user_idx"]
+
+
+def run(stdout, users: int = 10000, posts: int = 1000000, repeat: int = 5, **kwargs):
+    stdout.write(f"Seeding {users} users in {AREAS} communities and {posts} classified posts ...")
+    lre = rnd.Random(42)
+    user_ids = seed_users(users)
+    post_ids = seed_posts(posts, user_ids)
+    ExpertiseAreas.objects.bulk_create([ExpertiseAreas(label=f"Area {i}") for i in range(AREAS)])
+    area_ids = list(ExpertiseAreas.objects.values_list("id", flat=True))
+    bulk_insert(
+        SocialNetworkUsers.communities.through,
+        [
+            (user_id, area_id)
+            for user_id in user_ids
+            for area_id in lre.sample(area_ids, lre.randint(0, 3))
+        ],
+        ["socialnetworkusers", "expertiseareas"],
+    )
+    bulk_insert(
+        PostExpertiseAreasAndRatings,
+        [
+            (post_id, area_id)
+            for post_id in post_ids
+            for area_id in lre.sample(area_ids, lre.randint(1, 3))
+        ],
+        ["post", "expertise_area"],
+    )
+
+    member = SocialNetworkUsers.objects.filter(communities__isnull=False).order_by("id").first()
+    plan = api.timeline(member, community_mode=True).explain()
+    stdout.write("EXPLAIN QUERY PLAN of the first page:")
+    stdout.write(plan)
+    for index in EXPECTED_INDEXES:
+        stdout.write(f"uses {index}: {index in plan}")
+    scans = [line for line in plan.splitlines() if " SCAN " in f" {line}"]
+    stdout.write(f"full table scans: {scans or 'none'}")
+
+    rows = []
+    for label, user in [
+        ("member", member),
+        ("non-member", SocialNetworkUsers.objects.filter(communities__isnull=True).order_by("id").first()),
+    ]:
+        first_page = measure(lambda: api.paginate(api.timeline(user, community_mode=True), PAGE_SIZE), repeat)
+        _, cursor = api.paginate(api.timeline(user, community_mode=True), PAGE_SIZE)
+        next_page = measure(
+            lambda: api.paginate(api.timeline(user, community_mode=True, cursor=cursor), PAGE_SIZE), repeat
+        )
+        rows.append(
+            (
+                label,
+                user.communities.count(),
+                f"{first_page['median']:.1f}",
+                f"{first_page['p95']:.1f}",
+                f"{next_page['median']:.1f}" if cursor else "-",
+            )
+        )
+    print_table(stdout, ("user", "communities", "first page ms", "p95", "next page ms"), rows)
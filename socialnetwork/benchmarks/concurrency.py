@@ -0,0 +1,118 @@
+"""Throughput of a mixed read/write workload (timeline and search pages, submit_post and rate_post) with concurrent
+threads on an SQLite file: with the default settings without and with serialized writes (see socialnetwork/writes.py)
+and with the production profile (see settings.SQLITE_PRODUCTION_OPTIONS)."""
+
+import random as rnd
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+from faker.providers.lorem.en_US import Provider as LoremProvider
+
+from socialnetwork import api
+from socialnetwork.benchmarks import hot_paths, print_table
+from socialnetwork.models import Posts, SocialNetworkUsers
+
+# the database file is needed for WAL and to share the database between the threads:
+ON_DISK = True
+# fraction of the operations that write:
+WRITES = 0.2
+# users whose timelines are read:
+READERS = 100
+
+# name, connection options and whether writes are serialized:
+PROFILES = [
+    ("default, unserialized", {}, False),
+    ("default", {}, True),
+    ("production", settings.SQLITE_PRODUCTION_OPTIONS, True),
+]
+
+
+def _work(stop, seed, user_ids, post_ids, stats):
+    lre = rnd.Random(seed)
+    words = LoremProvider.word_list
+    users = list(SocialNetworkUsers.objects.filter(id__in=user_ids))
+    try:
+        while not stop.is_set():
+            user = lre.choice(users)
+            write = lre.random() < WRITES
+            started = time.perf_counter()
+            try:
+                if not write:
+                    if lre.random() < 0.5:
+                        api.paginate(api.timeline(user), hot_paths.PAGE_SIZE)
+                    else:
+                        api.paginate(api.search(lre.choice(words)), hot_paths.PAGE_SIZE)
+                elif lre.random() < 0.5:
+                    api.submit_post(user, " ".join(lre.choices(words, k=20)).capitalize() + ".", asynchronous=False)
+                else:
+                    post = Posts.objects.get(id=lre.choice(post_ids))
+                    if post.author_id != user.id:
+                        api.rate_post(user, post, lre.choice(list(Posts.RATING_SCORE_FIELDS)), lre.randint(0, 15))
+            except OperationalError:
+                stats["errors"] += 1
+                continue
+            stats["writes" if write else "reads"].append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+
+
+def run(stdout, users: int = 1000, posts: int = 10000, threads: int = 8, duration: float = 10.0, **kwargs):
+    if connection.vendor != "sqlite":
+        stdout.write("The concurrency benchmark compares SQLite profiles, the database is not SQLite.")
+        return
+    stdout.write(f"Seeding {users} users and {posts} posts ...")
+    user_ids, post_ids = hot_paths.seed(users, posts)
+    readers = rnd.Random(7).sample(user_ids, min(READERS, len(user_ids)))
+    for user in SocialNetworkUsers.objects.filter(id__in=readers):
+        api.rebuild_timeline(user)
+
+    original_options = connection.settings_dict["OPTIONS"]
+    rows = []
+    # WAL mode is kept by the database file once set, so the default profile has to run first:
+    for name, options, serialized in PROFILES:
+        connection.close()
+        # the settings of the connection are shared with the connections of the threads:
+        connection.settings_dict["OPTIONS"] = options
+        stats_by_thread = [{"reads": [], "writes": [], "errors": 0} for _ in range(threads)]
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=_work, args=(stop, i, readers, post_ids, stats_by_thread[i]))
+            for i in range(threads)
+        ]
+        with override_settings(SQLITE_SERIALIZE_WRITES=serialized):
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            time.sleep(duration)
+            stop.set()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+        reads = sorted(t for stats in stats_by_thread for t in stats["reads"])
+        writes = sorted(t for stats in stats_by_thread for t in stats["writes"])
+        rows.append(
+            (
+                name,
+                threads,
+                f"{(len(reads) + len(writes)) / elapsed:.0f}",
+                f"{len(reads) / elapsed:.0f}",
+                f"{len(writes) / elapsed:.0f}",
+                f"{statistics.median(reads):.1f}" if reads else "-",
+                f"{reads[int(len(reads) * 0.95)]:.1f}" if reads else "-",
+                f"{statistics.median(writes):.1f}" if writes else "-",
+                f"{writes[int(len(writes) * 0.95)]:.1f}" if writes else "-",
+                sum(stats["errors"] for stats in stats_by_thread),
+            )
+        )
+    connection.close()
+    connection.settings_dict["OPTIONS"] = original_options
+    print_table(
+        stdout,
+        ("profile", "threads", "ops/s", "reads/s", "writes/s", "read ms", "p95", "write ms", "p95", "errors"),
+        rows,
+    )
@@ -0,0 +1,122 @@
+"""Latency percentiles and query counts of the hot paths of the API on one dataset: timeline, search, submit_post,
+rate_post, the bullshitters pages, similar_users and fame. Returns the measurements, so that they can be written as JSON and
+compared against a baseline (see run_benchmark --json and --baseline)."""
+
+import itertools
+import random as rnd
+
+from django.conf import settings
+from faker.providers.lorem.en_US import Provider as LoremProvider
+
+from fame.reference_tables import expertise_areas, fame_levels
+from socialnetwork import api, bullshitters
+from socialnetwork.benchmarks import (
+    measure,
+    print_table,
+    seed_fame,
+    seed_follows,
+    seed_posts,
+    seed_truth_ratings,
+    seed_users,
+)
+from socialnetwork.models import Posts, SocialNetworkUsers
+from socialnetwork.reference_tables import truth_ratings
+from socialnetwork.search import get_search_backend
+from socialnetwork.similarity import fame_matrix
+
+PAGE_SIZE = 50
+SIMILAR_USERS_LIMIT = 100
+# number of users (and posts) the measured calls cycle through:
+SAMPLE = 20
+
+
+def seed(users: int, posts: int):
+    """Generate the dataset and bring the derived tables and in-process caches up to date."""
+    user_ids = seed_users(users)
+    post_ids = seed_posts(posts, user_ids)
+    seed_follows(user_ids)
+    seed_fame(user_ids)
+    seed_truth_ratings()
+    for table in (expertise_areas, fame_levels, truth_ratings):
+        table.invalidate()
+    get_search_backend().rebuild()
+    bullshitters.rebuild()
+    fame_matrix.invalidate()
+    return user_ids, post_ids
+
+
+def cases(user_ids, post_ids):
+    """The measured calls by name, each call uses the next of SAMPLE users (posts, keywords)."""
+    lre = rnd.Random(7)
+    users = list(SocialNetworkUsers.objects.filter(id__in=lre.sample(user_ids, min(SAMPLE, len(user_ids)))))
+    for user in users:
+        api.rebuild_timeline(user)
+    posts = list(Posts.objects.filter(id__in=lre.sample(post_ids, min(SAMPLE, len(post_ids)))))
+    words = LoremProvider.word_list
+    keywords = itertools.cycle(lre.sample(words, SAMPLE))
+    timeline_users, fame_users, similar_users = (itertools.cycle(users) for _ in range(3))
+    # raters are never the author of the rated post:
+    ratings = itertools.cycle(
+        [
+            (user, post, rating_type, lre.randint(0, 15))
+            for user, post in zip(users, posts[1:] + posts[:1])
+            if user.id != post.author_id
+            for rating_type in Posts.RATING_SCORE_FIELDS
+        ]
+    )
+    submissions = itertools.cycle(users)
+
+    def rate_post():
+        user, post, rating_type, score = next(ratings)
+        api.rate_post(user, post, rating_type, score)
+
+    def fame():
+        _, entries = api.fame(next(fame_users))
+        list(entries)
+
+    return {
+        "timeline": lambda: api.paginate(api.timeline(next(timeline_users)), PAGE_SIZE),
+        "search": lambda: api.paginate(api.search(next(keywords)), PAGE_SIZE),
+        "submit_post": lambda: api.submit_post(
+            next(submissions), " ".join(lre.choices(words, k=20)).capitalize() + ".", asynchronous=False
+        ),
+        "rate_post": rate_post,
+        "bullshitters": lambda: api.bullshitters_pages(PAGE_SIZE),
+        "similar_users": lambda: api.similar_users(next(similar_users), limit=SIMILAR_USERS_LIMIT),
+        "fame": fame,
+    }
+
+
+def run(stdout, users: int = 10000, posts: int = 100000, repeat: int = 20, **kwargs):
+    stdout.write(f"Seeding {users} users and {posts} posts ...")
+    user_ids, post_ids = seed(users, posts)
+
+    results = {
+        "benchmark": "hot_paths",
+        "database": settings.DATABASES["default"]["ENGINE"],
+        "users": users,
+        "posts": posts,
+        "repeat": repeat,
+        "cases": {},
+    }
+    for name, function in cases(user_ids, post_ids).items():
+        # the first calls load the in-process caches (reference tables, fame matrix):
+        results["cases"][name] = measure(function, repeat, warmup=2)
+
+    print_table(
+        stdout,
+        ("case", "median ms", "p90", "p95", "p99", "max", "queries"),
+        [
+            (
+                name,
+                f"{case['median']:.2f}",
+                f"{case['p90']:.2f}",
+                f"{case['p95']:.2f}",
+                f"{case['p99']:.2f}",
+                f"{case['max']:.2f}",
+                case["queries"],
+            )
+            for name, case in results["cases"].items()
+        ],
+    )
+    return results
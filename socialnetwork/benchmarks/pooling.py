@@ -0,0 +1,65 @@
+"""Latency of a short view (/fame/api/fame) when every request opens a new database connection (the default), when a
+thread keeps its connection between requests (CONN_MAX_AGE) and when connections are taken from a pool (see
+famesocialnetwork/db/pool.py). The database connection is handled at the end of every request like by a server."""
+
+from django.db import close_old_connections, connections
+from django.db.utils import load_backend
+from django.test import Client
+
+from famesocialnetwork.db.pool import close_idle_connections
+from socialnetwork.benchmarks import measure, print_table, seed_fame, seed_users
+from socialnetwork.models import SocialNetworkUsers
+
+# a file database, as in-memory databases are never closed:
+ON_DISK = True
+URL = "/fame/api/fame"
+
+
+def _profiles(engine: str):
+    pooled = engine.replace("django.db.backends.", "famesocialnetwork.db.backends.")
+    # name, engine and CONN_MAX_AGE:
+    return [
+        ("new connection per request", engine, 0),
+        ("persistent connection", engine, None),
+        ("connection pool", pooled, 0),
+    ]
+
+
+def run(stdout, users: int = 1000, repeat: int = 500, **kwargs):
+    stdout.write(f"Seeding {users} users ...")
+    user_ids = seed_users(users)
+    seed_fame(user_ids)
+    # a host allowed with DEBUG outside of the test runner:
+    client = Client(SERVER_NAME="localhost")
+    client.force_login(SocialNetworkUsers.objects.get(id=user_ids[0]))
+
+    def request():
+        client.get(URL)
+        # the test client does not close the connection at the end of a request like the request handler does:
+        close_old_connections()
+
+    original = connections["default"]
+    settings_dict = original.settings_dict
+    original.close()
+    results = {"benchmark": "pooling", "database": original.vendor, "users": users, "posts": 0, "cases": {}}
+    try:
+        for name, engine, conn_max_age in _profiles(settings_dict["ENGINE"]):
+            wrapper = load_backend(engine).DatabaseWrapper(
+                {**settings_dict, "ENGINE": engine, "CONN_MAX_AGE": conn_max_age}
+            )
+            connections["default"] = wrapper
+            results["cases"][name] = measure(request, repeat=repeat, warmup=20)
+            wrapper.close()
+    finally:
+        connections["default"] = original
+        # the test database is deleted afterwards:
+        close_idle_connections()
+    print_table(
+        stdout,
+        ("connections", "median ms", "p95 ms", "max ms", "queries"),
+        [
+            (name, f"{case['median']:.2f}", f"{case['p95']:.2f}", f"{case['max']:.2f}", case["queries"])
+            for name, case in results["cases"].items()
+        ],
+    )
+    return results
@@ -0,0 +1,52 @@
+"""Latency of api.search with the full-text index against the icontains implementation."""
+
+import random as rnd
+import time
+
+from faker.providers.lorem.en_US import Provider as LoremProvider
+
+from socialnetwork import api
+from socialnetwork.benchmarks import measure, print_table, seed_posts, seed_users
+from socialnetwork.search import IContainsSearchBackend, get_search_backend
+
+PAGE_SIZE = 50
+
+
+def run(stdout, users: int = 10000, posts: int = 1000000, repeat: int = 5, **kwargs):
+    stdout.write(f"Seeding {users} users and {posts} posts ...")
+    author_ids = seed_users(users)
+    seed_posts(posts, author_ids)
+
+    backend = get_search_backend()
+    started = time.perf_counter()
+    backend.rebuild()
+    stdout.write(
+        f"Built the {type(backend).__name__} index in {time.perf_counter() - started:.1f}s."
+    )
+
+    # a frequent and a rare word of the corpus, a word part and a (rare) last name:
+    lre = rnd.Random(7)
+    keywords = lre.sample(LoremProvider.word_list, 2) + ["tion", lre.choice(LoremProvider.word_list).capitalize()]
+
+    rows = []
+    for keyword in keywords:
+        scan = measure(
+            lambda: api.paginate(IContainsSearchBackend().search(keyword), PAGE_SIZE), repeat
+        )
+        indexed = measure(lambda: api.paginate(api.search(keyword), PAGE_SIZE), repeat)
+        ranked = measure(lambda: list(api.search(keyword, end=PAGE_SIZE - 1, ranked=True)), repeat)
+        rows.append(
+            (
+                keyword,
+                api.search(keyword).count(),
+                f"{scan['median']:.1f}",
+                f"{indexed['median']:.1f}",
+                f"{ranked['median']:.1f}",
+                f"{scan['median'] / indexed['median']:.1f}x",
+            )
+        )
+    print_table(
+        stdout,
+        ("keyword", "matches", "icontains ms", "index ms", "ranked ms", "speedup"),
+        rows,
+    )
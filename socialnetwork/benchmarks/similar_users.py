@@ -0,0 +1,120 @@
+"""Latency of api.similar_users with the in-memory fame matrix against a pure ORM implementation, and latency and
+recall of the approximate mode using the LSH index."""
+
+import random as rnd
+import statistics
+import time
+
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Abs, Cast, Coalesce
+
+from fame.models import Fame
+from socialnetwork import api
+from socialnetwork.benchmarks import measure, print_table, seed_fame, seed_users
+from socialnetwork.models import SocialNetworkUsers
+from socialnetwork.similarity import MAX_FAME_DIFFERENCE, fame_matrix, rebuild_index
+
+LIMIT = 100
+SAMPLE = 20
+
+
+def similar_users_orm(user: SocialNetworkUsers):
+    """Same result as api.similar_users, computed by the database with correlated subqueries."""
+    area_count = Fame.objects.filter(user=user).count()
+    if area_count == 0:
+        return SocialNetworkUsers.objects.none()
+    own_level = Fame.objects.filter(
+        user=user, expertise_area=OuterRef("expertise_area")
+    ).values("fame_level__numeric_value")
+    similar_areas = (
+        Fame.objects.filter(user=OuterRef("pk"))
+        .annotate(own_level=Subquery(own_level))
+        .annotate(difference=Abs(F("fame_level__numeric_value") - F("own_level")))
+        .filter(difference__lte=MAX_FAME_DIFFERENCE)
+        .order_by()
+        .values("user")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return (
+        SocialNetworkUsers.objects.exclude(id=user.id)
+        .annotate(
+            similarity=Cast(Coalesce(Subquery(similar_areas), 0), FloatField()) / area_count
+        )
+        .filter(similarity__gt=0)
+        .order_by("-similarity", "-date_joined")
+    )
+
+
+def run(stdout, users: int = 100000, repeat: int = 5, **kwargs):
+    stdout.write(f"Seeding {users} users with fame profiles ...")
+    user_ids = seed_users(users)
+    seed_fame(user_ids)
+
+    fame_matrix.invalidate()
+    started = time.perf_counter()
+    fame_matrix.similarities(user_ids[0])
+    stdout.write(
+        f"Loaded the {fame_matrix.levels.shape[0]} x {fame_matrix.levels.shape[1]} fame matrix "
+        f"in {time.perf_counter() - started:.1f}s."
+    )
+
+    rows = []
+    for user_id in rnd.Random(7).sample(user_ids, 3):
+        user = SocialNetworkUsers.objects.get(id=user_id)
+        matrix = measure(lambda: fame_matrix.similarities(user_id), repeat)
+        limited = measure(lambda: api.similar_users(user, limit=LIMIT), repeat)
+        orm = measure(lambda: list(similar_users_orm(user)[:LIMIT]), repeat)
+        assert [(u.id, u.similarity) for u in api.similar_users(user, limit=LIMIT)] == [
+            (u.id, u.similarity) for u in similar_users_orm(user)[:LIMIT]
+        ]
+        rows.append(
+            (
+                user_id,
+                len(fame_matrix.similarities(user_id)[0]),
+                f"{matrix['median']:.1f}",
+                f"{matrix['p95']:.1f}",
+                f"{limited['median']:.1f}",
+                f"{orm['median']:.1f}",
+                f"{orm['median'] / limited['median']:.1f}x",
+            )
+        )
+    print_table(
+        stdout,
+        ("user", "similar", "matrix ms", "matrix p95", f"top {LIMIT} ms", f"orm top {LIMIT} ms", "speedup"),
+        rows,
+    )
+
+    started = time.perf_counter()
+    rebuild_index()
+    stdout.write(f"Built the LSH index in {time.perf_counter() - started:.1f}s.")
+
+    # recall@LIMIT: fraction of the LIMIT most similar users found, counting ties with the last one as found:
+    recalls = []
+    exact_timings = []
+    approximate_timings = []
+    for user_id in rnd.Random(11).sample(user_ids, SAMPLE):
+        user = SocialNetworkUsers.objects.get(id=user_id)
+        exact_timings.append(measure(lambda: api.similar_users(user, limit=LIMIT), repeat)["median"])
+        approximate_timings.append(
+            measure(lambda: api.similar_users(user, limit=LIMIT, approximate=True), repeat)["median"]
+        )
+        exact = [u.similarity for u in api.similar_users(user, limit=LIMIT)]
+        if not exact:
+            continue
+        approximate = [u.similarity for u in api.similar_users(user, limit=LIMIT, approximate=True)]
+        recalls.append(sum(1 for similarity in approximate if similarity >= exact[-1]) / len(exact))
+    print_table(
+        stdout,
+        ("users", f"exact top {LIMIT} ms", f"lsh top {LIMIT} ms", f"recall@{LIMIT} mean", "min"),
+        [
+            (
+                SAMPLE,
+                f"{statistics.median(exact_timings):.1f}",
+                f"{statistics.median(approximate_timings):.1f}",
+                f"{statistics.mean(recalls):.2f}",
+                f"{min(recalls):.2f}",
+            )
+        ],
+    )
+
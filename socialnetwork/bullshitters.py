@@ -0,0 +1,116 @@
+"""Maintenance of the bullshitters projection (see models.Bullshitters) read by api.bullshitters.
+
+Every fame entry with a negative fame level has a row in the projection, which is kept up to date by the signals of
+Fame (also during loaddata, so fixtures need no rebuild). Deleting a fame entry deletes its row by cascade.
+Within a deferred_updates block the changed entries are updated at once at the end. Queryset update() and raw SQL
+bypass the signals: run `manage.py rebuild_bullshitters` afterwards.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from fame.models import Fame, FameLevels, FameUsers
+from fame.reference_tables import fame_levels
+from socialnetwork.models import Bullshitters
+
+
+def update_fame_entry(fame_entry: Fame):
+    """Add, update or remove the row of a fame entry in the projection."""
+    numeric_value = fame_levels.get(fame_entry.fame_level_id).numeric_value
+    if numeric_value >= 0:
+        Bullshitters.objects.filter(fame_id=fame_entry.id).delete()
+        return
+    updated = Bullshitters.objects.filter(fame_id=fame_entry.id).update(
+        user_id=fame_entry.user_id,
+        expertise_area_id=fame_entry.expertise_area_id,
+        fame_level_value=numeric_value,
+    )
+    if not updated:
+        Bullshitters.objects.create(
+            fame_id=fame_entry.id,
+            user_id=fame_entry.user_id,
+            expertise_area_id=fame_entry.expertise_area_id,
+            fame_level_value=numeric_value,
+            date_joined=FameUsers.objects.values_list("date_joined", flat=True).get(id=fame_entry.user_id),
+        )
+
+
+def _rows(fame_entries):
+    """Projection rows (unsaved) of the negative entries among the given fame entries."""
+    # the numeric values come from the cached reference table instead of a join:
+    negative_values = {level.id: level.numeric_value for level in fame_levels.all() if level.numeric_value < 0}
+    return [
+        Bullshitters(
+            fame_id=fame_id,
+            user_id=user_id,
+            expertise_area_id=expertise_area_id,
+            fame_level_value=negative_values[fame_level_id],
+            date_joined=date_joined,
+        )
+        for fame_id, user_id, expertise_area_id, fame_level_id, date_joined in fame_entries.filter(
+            fame_level_id__in=negative_values
+        )
+        .order_by()
+        .values_list("id", "user_id", "expertise_area_id", "fame_level_id", "user__date_joined")
+    ]
+
+
+def rebuild() -> int:
+    """Rebuild the projection from all fame entries. Returns the number of rows."""
+    with transaction.atomic():
+        Bullshitters.objects.all().delete()
+        rows = Bullshitters.objects.bulk_create(_rows(Fame.objects.all()), batch_size=5000)
+    return len(rows)
+
+
+def update_fame_entries(fame_ids, batch_size: int = 5000):
+    """Add, update or remove the rows of the given fame entries (by id) in the projection. Within a transaction, a
+    failure rolls back the enclosing transaction (no savepoint, which would cost two queries)."""
+    fame_ids = list(fame_ids)
+    with transaction.atomic(savepoint=False):
+        for i in range(0, len(fame_ids), batch_size):
+            batch = fame_ids[i : i + batch_size]
+            Bullshitters.objects.filter(fame_id__in=batch).delete()
+            Bullshitters.objects.bulk_create(_rows(Fame.objects.filter(id__in=batch)))
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_updates():
+    """Within the block, saving fame entries only collects them, their rows are updated at once when the block is
+    left (e.g. while generating fake data, where users change their fame many times, or in
+    api.classify_and_publish_many, where a post changes the fame of its author in several areas)."""
+    if getattr(_deferred, "fame_ids", None) is not None:
+        # nested, the outermost block updates:
+        yield
+        return
+    _deferred.fame_ids = set()
+    try:
+        yield
+        if _deferred.fame_ids:
+            update_fame_entries(_deferred.fame_ids)
+    finally:
+        _deferred.fame_ids = None
+
+
+def _fame_saved(instance, **kwargs):
+    if getattr(_deferred, "fame_ids", None) is not None:
+        _deferred.fame_ids.add(instance.id)
+    else:
+        update_fame_entry(instance)
+
+
+def _fame_level_saved(instance, raw=False, **kwargs):
+    # changing the numeric value of a level may move all its entries in or out of the projection; fixtures load the
+    # levels before the fame entries:
+    if not raw:
+        rebuild()
+
+
+post_save.connect(_fame_saved, sender=Fame, weak=False)
+post_save.connect(_fame_level_saved, sender=FameLevels, weak=False)
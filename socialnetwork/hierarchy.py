@@ -0,0 +1,84 @@
+"""Maintenance of the closure table of the expertise area hierarchy (see models.ExpertiseAreasClosure).
+
+Saving an expertise area (also during loaddata) links it and its subtree below the ancestors of its parent, deleting an
+area deletes its links by cascade. Queryset update() of parent_expertise_area and raw SQL bypass the signals: run
+`manage.py rebuild_expertise_areas_closure` afterwards.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+
+from fame.models import ExpertiseAreas
+from socialnetwork.models import ExpertiseAreasClosure
+
+
+def closure_rows(parents: dict):
+    """Get the (ancestor id, descendant id, depth) tuples for a hierarchy given as {area id: parent id or None}."""
+    rows = []
+    for area_id in parents:
+        ancestor_id, depth = area_id, 0
+        while ancestor_id is not None:
+            rows.append((ancestor_id, area_id, depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+            if depth > len(parents):
+                raise ValueError(f"The expertise area hierarchy contains a cycle through {area_id}")
+    return rows
+
+
+def link(area: ExpertiseAreas):
+    """(Re)link an area and its subtree below the ancestors of the area's parent."""
+    with transaction.atomic():
+        ExpertiseAreasClosure.objects.get_or_create(ancestor=area, descendant=area, defaults={"depth": 0})
+        subtree = list(
+            ExpertiseAreasClosure.objects.filter(ancestor=area).values_list("descendant_id", "depth")
+        )
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        # detach the subtree from its former ancestors:
+        ExpertiseAreasClosure.objects.filter(descendant_id__in=subtree_ids).exclude(
+            ancestor_id__in=subtree_ids
+        ).delete()
+        if area.parent_expertise_area_id is not None:
+            ExpertiseAreasClosure.objects.bulk_create(
+                [
+                    ExpertiseAreasClosure(
+                        ancestor_id=ancestor_id,
+                        descendant_id=descendant_id,
+                        depth=ancestor_depth + descendant_depth + 1,
+                    )
+                    for ancestor_id, ancestor_depth in ExpertiseAreasClosure.objects.filter(
+                        descendant_id=area.parent_expertise_area_id
+                    ).values_list("ancestor_id", "depth")
+                    for descendant_id, descendant_depth in subtree
+                ]
+            )
+
+
+def rebuild() -> int:
+    """Rebuild the closure table from the parent_expertise_area links. Returns the number of rows."""
+    rows = closure_rows(dict(ExpertiseAreas.objects.values_list("id", "parent_expertise_area_id")))
+    with transaction.atomic():
+        ExpertiseAreasClosure.objects.all().delete()
+        ExpertiseAreasClosure.objects.bulk_create(
+            [
+                ExpertiseAreasClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                for ancestor_id, descendant_id, depth in rows
+            ]
+        )
+    return len(rows)
+
+
+def _check_parent(instance, raw=False, **kwargs):
+    if raw or instance.pk is None or instance.parent_expertise_area_id is None:
+        return
+    if ExpertiseAreasClosure.objects.filter(
+        ancestor_id=instance.pk, descendant_id=instance.parent_expertise_area_id
+    ).exists():
+        raise ValueError("An expertise area cannot be moved below itself or one of its subareas")
+
+
+def _area_saved(instance, **kwargs):
+    link(instance)
+
+
+pre_save.connect(_check_parent, sender=ExpertiseAreas, weak=False)
+post_save.connect(_area_saved, sender=ExpertiseAreas, weak=False)
@@ -1,14 +1,39 @@
 import random as rnd
 
-from fame.models import ExpertiseAreas
+from fame.reference_tables import expertise_areas
+from famesocialnetwork import metrics
 import hashlib
 
 rnd.seed(42)
 
+CLASSIFIER_DURATION = metrics.histogram(
+    "socialnetwork_classifier_duration_seconds", "Duration of classifier calls (a call may classify a batch)."
+)
+CLASSIFIED_CONTENTS = metrics.counter("socialnetwork_classified_contents_total", "Contents classified.")
+
 
 def classify_into_expertise_areas_and_check_for_bullshit(content: str):
     """Classify the given content into expertise areas."""
+    return classify_many([content])[0]
+
+
+@CLASSIFIER_DURATION.time()
+def classify_many(contents):
+    """Classify a batch of contents into expertise areas. Returns one classification per content, in the same order
+    and identical to classifying each content on its own. Reference data is loaded once for the whole batch."""
+    from socialnetwork.reference_tables import truth_ratings
+
+    _expertise_areas = list(expertise_areas.all())
+    positive_truth_ratings = [tr for tr in truth_ratings.all() if tr.numeric_value > 0]
+    negative_truth_ratings = [tr for tr in truth_ratings.all() if tr.numeric_value < 0]
+    CLASSIFIED_CONTENTS.inc(len(contents))
+    return [
+        _classify(content, _expertise_areas, positive_truth_ratings, negative_truth_ratings)
+        for content in contents
+    ]
 
+
+def _classify(content: str, _expertise_areas, positive_truth_ratings, negative_truth_ratings):
     # in the absence of a real text classifier, we just randomly assign expertise areas and truth ratings:
     # the random engine is initialized with a hash of the content to make the results deterministic for testing purposes
 
@@ -27,12 +52,10 @@ def classify_into_expertise_areas_and_check_for_bullshit(content: str):
     lre = rnd.Random(seed)
 
     def get_truth_ratings(is_positive: bool):
-        from socialnetwork.models import TruthRatings
-
         if is_positive:
-            return lre.choice(TruthRatings.objects.filter(numeric_value__gt=0))
+            return lre.choice(positive_truth_ratings)
         else:  # is negative
-            return lre.choice(TruthRatings.objects.filter(numeric_value__lt=0))
+            return lre.choice(negative_truth_ratings)
 
     return [
         {
@@ -47,5 +70,5 @@ def classify_into_expertise_areas_and_check_for_bullshit(content: str):
                 )
             ),
         }
-        for s in lre.sample(list(ExpertiseAreas.objects.all()), 2)
+        for s in lre.sample(_expertise_areas, 2)
     ]
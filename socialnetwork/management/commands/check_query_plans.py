@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand, CommandError
+
+from socialnetwork.query_plans import check_api_query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN QUERY PLAN on every query of socialnetwork.api (on the data of the SQLite database, writes are "
+        "rolled back) and fails if a query reads a large table completely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-rows", type=int, default=1000, help="Full scans of tables with more rows fail."
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            checked, findings = check_api_query_plans(max_rows=kwargs["max_rows"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for finding in findings:
+            self.stdout.write(
+                f"{finding['step']}: full scan of {finding['table']} ({finding['rows']} rows) on {finding['database']}"
+                f" - {finding['plan']}\n    {finding['sql']}"
+            )
+        if findings:
+            raise CommandError(f"{len(findings)} full scans of tables with more than {kwargs['max_rows']} rows.")
+        self.stdout.write(
+            f"Checked the plans of {checked} queries, no full scans of tables with more than {kwargs['max_rows']} rows."
+        )
@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand, CommandError
+
+from socialnetwork import api
+from socialnetwork.models import SocialNetworkUsers
+
+
+class Command(BaseCommand):
+    help = "Checks the materialized timelines against the timelines computed from posts and follows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", help="Only check the timeline of this user id (repeatable)."
+        )
+        parser.add_argument(
+            "--repair", action="store_true", help="Rebuild every inconsistent timeline."
+        )
+
+    def handle(self, *args, **kwargs):
+        users = SocialNetworkUsers.objects.all().order_by("id")
+        if kwargs["user"]:
+            users = users.filter(id__in=kwargs["user"])
+
+        inconsistent = 0
+        for user in users:
+            diff = api.check_timeline(user)
+            if not diff["missing"] and not diff["unexpected"]:
+                continue
+            inconsistent += 1
+            self.stdout.write(
+                f"user {user.id}: {len(diff['missing'])} missing, {len(diff['unexpected'])} unexpected posts"
+            )
+            if kwargs["repair"]:
+                api.rebuild_timeline(user)
+
+        if inconsistent and not kwargs["repair"]:
+            raise CommandError(f"{inconsistent} inconsistent timelines found.")
+        self.stdout.write(f"Checked {users.count()} timelines, {inconsistent} inconsistent.")
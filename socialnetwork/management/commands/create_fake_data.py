@@ -1,10 +1,30 @@
+import time
+
 from django.core.management import BaseCommand
 
 from famesocialnetwork.fakedata import create_fake_data
 
 
 class Command(BaseCommand):
-    help = "Loads meaningful fake test data for initial setup of a dev, test or staging server."
+    help = (
+        "Loads meaningful fake test data for initial setup of a dev, test or staging server. "
+        "The defaults reproduce database_dump.json, larger counts generate datasets for load testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Number of random users (plus a@b.de).")
+        parser.add_argument("--posts", type=int, default=400, help="Number of posts.")
+        parser.add_argument("--ratings-per-post", type=int, default=3, help="Number of ratings of every post.")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per bulk insert, classification batch and commit."
+        )
 
     def handle(self, *args, **kwargs):
-        create_fake_data()
+        started = time.perf_counter()
+        create_fake_data(
+            users=kwargs["users"],
+            posts=kwargs["posts"],
+            ratings_per_post=kwargs["ratings_per_post"],
+            batch_size=kwargs["batch_size"],
+        )
+        self.stdout.write(f"Created fake data in {time.perf_counter() - started:.1f}s.")
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import bullshitters
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the bullshitters projection from all fame entries."
+
+    def handle(self, *args, **kwargs):
+        count = bullshitters.rebuild()
+        self.stdout.write(f"Ranked {count} negative fame entries.")
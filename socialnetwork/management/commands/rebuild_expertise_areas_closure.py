@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import hierarchy
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the closure table of the expertise area hierarchy from the parent links."
+
+    def handle(self, *args, **kwargs):
+        count = hierarchy.rebuild()
+        self.stdout.write(f"Linked {count} ancestor/descendant pairs.")
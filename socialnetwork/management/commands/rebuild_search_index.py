@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from socialnetwork.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over all posts."
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        count = backend.rebuild()
+        self.stdout.write(f"Indexed {count} posts with {type(backend).__name__}.")
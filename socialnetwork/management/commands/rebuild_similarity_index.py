@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import similarity
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the LSH index used by api.similar_users(approximate=True) from all fame profiles."
+
+    def handle(self, *args, **kwargs):
+        count = similarity.rebuild_index()
+        self.stdout.write(f"Indexed {count} users.")
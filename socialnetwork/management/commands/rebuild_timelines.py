@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import api
+from socialnetwork.models import SocialNetworkUsers
+
+
+class Command(BaseCommand):
+    help = "Backfills the materialized timelines from existing posts and follows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", help="Only rebuild the timeline of this user id (repeatable)."
+        )
+
+    def handle(self, *args, **kwargs):
+        users = SocialNetworkUsers.objects.all().order_by("id")
+        if kwargs["user"]:
+            users = users.filter(id__in=kwargs["user"])
+
+        total = 0
+        for user in users:
+            total += api.rebuild_timeline(user)
+        self.stdout.write(f"Rebuilt {users.count()} timelines with {total} entries.")
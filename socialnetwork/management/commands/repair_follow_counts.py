@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from socialnetwork import api
+from socialnetwork.models import SocialNetworkUsers
+
+
+class Command(BaseCommand):
+    help = "Recomputes the follow counters of all users and repairs those that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drifted counters, fail if there are any.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["check"]:
+            with transaction.atomic():
+                drifted = api.recompute_follow_counts()
+                transaction.set_rollback(True)
+            if drifted:
+                raise CommandError(f"{drifted} users with drifted counters found.")
+        else:
+            drifted = api.recompute_follow_counts()
+        self.stdout.write(f"Checked {SocialNetworkUsers.objects.count()} users, {drifted} drifted.")
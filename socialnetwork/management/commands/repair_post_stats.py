@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from socialnetwork import api
+from socialnetwork.models import Posts
+
+
+class Command(BaseCommand):
+    help = "Recomputes the engagement counters of all posts and repairs those that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drifted counters, fail if there are any.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["check"]:
+            with transaction.atomic():
+                drifted = api.recompute_post_stats()
+                transaction.set_rollback(True)
+            if drifted:
+                raise CommandError(f"{drifted} posts with drifted counters found.")
+        else:
+            drifted = api.recompute_post_stats()
+        self.stdout.write(f"Checked {Posts.objects.count()} posts, {drifted} drifted.")
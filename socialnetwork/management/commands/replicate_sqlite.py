@@ -0,0 +1,38 @@
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from famesocialnetwork.db.replication import replicate
+
+
+class Command(BaseCommand):
+    help = "Copies the SQLite database to its read replicas (settings.REPLICA_DATABASES), periodically or once."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="Seconds between two copies."
+        )
+        parser.add_argument("--once", action="store_true", help="Copy once and exit.")
+
+    def handle(self, *args, **kwargs):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError("There are no replicas, set FAMESOCIALNETWORK_DB_REPLICAS.")
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        copies = 0
+        while True:
+            started = time.monotonic()
+            try:
+                replicas = replicate()
+            except ValueError as e:
+                raise CommandError(str(e))
+            copies += 1
+            if kwargs["once"]:
+                self.stdout.write(f"Copied the database to {', '.join(replicas)}.")
+                return
+            if stop.wait(max(0.0, kwargs["interval"] - (time.monotonic() - started))):
+                self.stdout.write(f"Copied the database {copies} times.")
+                return
@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand, CommandError
+
+from socialnetwork import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the posts, with their expertise areas and ratings, to the shard of their author "
+        "(settings.SHARD_DATABASES): from the default database and between shards after shards were added or removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Posts moved per transaction."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only print the number of posts to move."
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            moved = sharding.reshard(batch_size=kwargs["batch_size"], dry_run=kwargs["dry_run"])
+        except ValueError as e:
+            raise CommandError(f"{e}, set FAMESOCIALNETWORK_DB_SHARDS.")
+        verb = "To move" if kwargs["dry_run"] else "Moved"
+        for (source, target), count in sorted(moved.items()):
+            self.stdout.write(f"{verb} {count} posts from {source} to {target}.")
+        self.stdout.write(f"{verb} {sum(moved.values())} posts in total.")
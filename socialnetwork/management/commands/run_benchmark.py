@@ -0,0 +1,57 @@
+from importlib import import_module
+
+from django.core.management import BaseCommand, CommandError
+
+from socialnetwork.benchmarks import compare_to_baseline, isolated_database, load_results, write_results
+
+BENCHMARKS = ["search", "similar_users", "community_timeline", "hot_paths", "concurrency", "pooling"]
+
+
+class Command(BaseCommand):
+    help = "Runs a benchmark of the socialnetwork API on a generated dataset in a throw-away database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=BENCHMARKS)
+        parser.add_argument("--users", type=int, help="Number of generated users.")
+        parser.add_argument("--posts", type=int, help="Number of generated posts.")
+        parser.add_argument("--repeat", type=int, help="Number of measurements per case.")
+        parser.add_argument("--threads", type=int, help="Number of concurrent threads.")
+        parser.add_argument("--duration", type=float, help="Seconds to run a concurrent workload.")
+        parser.add_argument("--json", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--baseline", help="Compare the results to this JSON file and fail if a case regressed."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Allowed increase of the median latency over the baseline, as a fraction (default: 0.5).",
+        )
+
+    def handle(self, *args, **kwargs):
+        benchmark = import_module(f"socialnetwork.benchmarks.{kwargs['name']}")
+        options = {
+            key: kwargs[key]
+            for key in ("users", "posts", "repeat", "threads", "duration")
+            if kwargs[key] is not None
+        }
+        # load the baseline first, so that a wrong path fails before the (long) run:
+        baseline = load_results(kwargs["baseline"]) if kwargs["baseline"] else None
+        with isolated_database(on_disk=getattr(benchmark, "ON_DISK", False)):
+            results = benchmark.run(self.stdout, **options)
+
+        if results is None:
+            if kwargs["json"] or baseline:
+                raise CommandError(f"The {kwargs['name']} benchmark does not return results.")
+            return
+        if kwargs["json"]:
+            write_results(kwargs["json"], results)
+            self.stdout.write(f"Wrote the results to {kwargs['json']}.")
+        if baseline:
+            try:
+                regressions = compare_to_baseline(results, baseline, kwargs["tolerance"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
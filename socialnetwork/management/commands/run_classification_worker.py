@@ -0,0 +1,48 @@
+import json
+import signal
+import threading
+
+from django.core.management import BaseCommand
+
+from socialnetwork import worker
+
+
+class Command(BaseCommand):
+    help = "Classifies and publishes posts that were submitted asynchronously."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=1, help="Number of worker threads."
+        )
+        parser.add_argument(
+            "--drain", action="store_true", help="Exit as soon as the queue is empty."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+        parser.add_argument(
+            "--backlog",
+            action="store_true",
+            help="Only print the backlog (tasks per status, age of the oldest pending task) as JSON.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["backlog"]:
+            self.stdout.write(json.dumps(worker.backlog()))
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        requeued = worker.requeue_stale_tasks()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale tasks.")
+        processed = worker.run_worker(
+            concurrency=kwargs["concurrency"],
+            drain=kwargs["drain"],
+            poll_interval=kwargs["poll_interval"],
+            stop=stop,
+        )
+        self.stdout.write(f"Processed {processed} tasks, backlog: {json.dumps(worker.backlog())}")
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:24
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_timelines(apps, schema_editor):
+    """Backfill the materialized timelines of the existing posts and follows (see api.rebuild_timeline)."""
+    Posts = apps.get_model("socialnetwork", "Posts")
+    SocialNetworkUsers = apps.get_model("socialnetwork", "SocialNetworkUsers")
+    TimelineEntries = apps.get_model("socialnetwork", "TimelineEntries")
+    follows = SocialNetworkUsers._meta.get_field("follows").remote_field.through
+
+    followers = defaultdict(list)
+    for follower_id, followee_id in follows.objects.values_list(
+        "from_socialnetworkusers_id", "to_socialnetworkusers_id"
+    ).iterator():
+        followers[followee_id].append(follower_id)
+    entries = []
+    for post_id, author_id, submitted, published in Posts.objects.values_list(
+        "id", "author_id", "submitted", "published"
+    ).iterator(chunk_size=5000):
+        entries += [
+            TimelineEntries(
+                owner_id=owner_id, post_id=post_id, author_id=author_id, submitted=submitted, published=published
+            )
+            for owner_id in [author_id, *followers[author_id]]
+        ]
+        if len(entries) >= 5000:
+            TimelineEntries.objects.bulk_create(entries, ignore_conflicts=True)
+            entries = []
+    TimelineEntries.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitted', models.DateTimeField()),
+                ('published', models.BooleanField(default=False)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='socialnetwork.socialnetworkusers')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='socialnetwork.socialnetworkusers')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='socialnetwork.posts')),
+            ],
+            options={
+                'db_table': 'timeline_entries',
+                'indexes': [models.Index(fields=['owner', '-submitted', '-post'], name='timeline_owner_submitted_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
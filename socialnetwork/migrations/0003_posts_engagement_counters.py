@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Compute the counters of the existing posts, like api.recompute_post_stats."""
+    Posts = apps.get_model("socialnetwork", "Posts")
+    UserRatings = apps.get_model("socialnetwork", "UserRatings")
+
+    def count(field):
+        return Coalesce(
+            Subquery(
+                Posts.objects.filter(**{field: OuterRef("pk")})
+                .order_by()
+                .values(field)
+                .annotate(_count=Count("id"))
+                .values("_count")
+            ),
+            0,
+        )
+
+    def score(rating_type):
+        return Coalesce(
+            Subquery(
+                UserRatings.objects.filter(post=OuterRef("pk"), type=rating_type)
+                .order_by()
+                .values("post")
+                .annotate(_score=Sum("score"))
+                .values("_score")
+            ),
+            0,
+        )
+
+    Posts.objects.update(
+        citations_count=count("cites"),
+        replies_count=count("replies_to"),
+        approval_score=score("A"),
+        like_score=score("L"),
+        dislike_score=score("D"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0002_timeline_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='approval_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='citations_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='dislike_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='like_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='replies_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
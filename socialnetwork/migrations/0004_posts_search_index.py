@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:29
+
+from django.db import migrations
+
+from socialnetwork.search import INDEXED_BACKENDS, SEARCH_TABLE
+
+# see socialnetwork/search.py for the backends using these tables
+
+
+def create_search_index(apps, schema_editor):
+    backend = INDEXED_BACKENDS.get(schema_editor.connection.vendor)
+    if backend is not None:
+        # also indexes the existing posts, search reads only the index:
+        backend().create_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in INDEXED_BACKENDS:
+        schema_editor.execute(f"DROP TABLE {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0003_posts_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
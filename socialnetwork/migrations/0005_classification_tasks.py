@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0004_posts_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificationTasks',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('R', 'Running'), ('D', 'Done'), ('F', 'Failed')], default='P', max_length=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='classification_task', to='socialnetwork.posts')),
+            ],
+            options={
+                'db_table': 'classification_tasks',
+                'indexes': [models.Index(fields=['status', 'id'], name='classification_status_idx')],
+            },
+        ),
+    ]
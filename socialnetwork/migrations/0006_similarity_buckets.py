@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0005_classification_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBuckets',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.SmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='socialnetwork.socialnetworkusers')),
+            ],
+            options={
+                'db_table': 'similarity_buckets',
+                'indexes': [models.Index(fields=['band', 'bucket'], name='similarity_bucket_idx')],
+                'unique_together': {('user', 'band')},
+            },
+        ),
+    ]
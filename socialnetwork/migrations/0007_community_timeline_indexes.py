@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0006_similarity_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='postexpertiseareasandratings',
+            index=models.Index(fields=['expertise_area', 'post'], name='pear_area_post_idx'),
+        ),
+        # the auto-created through table of SocialNetworkUsers.communities has a unique index on (user, area), this
+        # one covers the lookups of the members of a community:
+        migrations.RunSQL(
+            'CREATE INDEX "communities_area_user_idx" '
+            'ON "social_network_users_communities" ("expertiseareas_id", "socialnetworkusers_id")',
+            reverse_sql='DROP INDEX "communities_area_user_idx"',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_bullshitters(apps, schema_editor):
+    Fame = apps.get_model("fame", "Fame")
+    Bullshitters = apps.get_model("socialnetwork", "Bullshitters")
+    Bullshitters.objects.bulk_create(
+        [
+            Bullshitters(
+                fame_id=fame_id,
+                user_id=user_id,
+                expertise_area_id=expertise_area_id,
+                fame_level_value=fame_level_value,
+                date_joined=date_joined,
+            )
+            for fame_id, user_id, expertise_area_id, fame_level_value, date_joined in Fame.objects.filter(
+                fame_level__numeric_value__lt=0
+            ).values_list("id", "user_id", "expertise_area_id", "fame_level__numeric_value", "user__date_joined")
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0007_community_timeline_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bullshitters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fame_level_value', models.IntegerField()),
+                ('date_joined', models.DateTimeField()),
+                ('expertise_area', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fame.expertiseareas')),
+                ('fame', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='bullshitter', to='fame.fame')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'bullshitters',
+                'indexes': [models.Index(fields=['expertise_area', 'fame_level_value', '-date_joined', 'user'], name='bullshitters_rank_idx')],
+            },
+        ),
+        migrations.RunPython(fill_bullshitters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_closure(apps, schema_editor):
+    ExpertiseAreas = apps.get_model("fame", "ExpertiseAreas")
+    ExpertiseAreasClosure = apps.get_model("socialnetwork", "ExpertiseAreasClosure")
+    parents = dict(ExpertiseAreas.objects.values_list("id", "parent_expertise_area_id"))
+    rows = []
+    for area_id in parents:
+        ancestor_id, depth = area_id, 0
+        while ancestor_id is not None:
+            rows.append(ExpertiseAreasClosure(ancestor_id=ancestor_id, descendant_id=area_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    ExpertiseAreasClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0008_bullshitters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpertiseAreasClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='fame.expertiseareas')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='fame.expertiseareas')),
+            ],
+            options={
+                'db_table': 'expertise_areas_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='closure_descendant_depth_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(fill_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follow_counts(apps, schema_editor):
+    SocialNetworkUsers = apps.get_model("socialnetwork", "SocialNetworkUsers")
+    follows = SocialNetworkUsers._meta.get_field("follows").remote_field.through
+
+    def count(field):
+        return Coalesce(
+            Subquery(
+                follows.objects.filter(**{field: OuterRef("pk")})
+                .order_by()
+                .values(field)
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        )
+
+    SocialNetworkUsers.objects.update(
+        follows_count=count("from_socialnetworkusers"),
+        followers_count=count("to_socialnetworkusers"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0009_expertise_areas_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='socialnetworkusers',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='socialnetworkusers',
+            name='follows_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0010_follow_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdBlocks',
+            fields=[
+                ('name', models.CharField(max_length=42, primary_key=True, serialize=False)),
+                ('next_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'id_blocks',
+            },
+        ),
+    ]
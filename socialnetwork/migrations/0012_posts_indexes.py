@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0002_fame_user_index'),
+        ('socialnetwork', '0011_id_blocks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='posts',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='socialnetwork.socialnetworkusers'),
+        ),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-submitted', '-id'], name='posts_published_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['-submitted', '-id'], name='posts_submitted_idx'),
+        ),
+    ]
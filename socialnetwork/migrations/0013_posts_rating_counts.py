@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counts(apps, schema_editor):
+    """Count the ratings of the existing posts by type, like api.recompute_post_stats."""
+    Posts = apps.get_model("socialnetwork", "Posts")
+    UserRatings = apps.get_model("socialnetwork", "UserRatings")
+
+    def count(rating_type):
+        return Coalesce(
+            Subquery(
+                UserRatings.objects.filter(post=OuterRef("pk"), type=rating_type)
+                .order_by()
+                .values("post")
+                .annotate(_count=Count("id"))
+                .values("_count")
+            ),
+            0,
+        )
+
+    Posts.objects.update(approval_count=count("A"), like_count=count("L"), dislike_count=count("D"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0012_posts_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='approval_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='dislike_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
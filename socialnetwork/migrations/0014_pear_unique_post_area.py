@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:36
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def delete_duplicates(apps, schema_editor):
+    """Keep the first row of every post and expertise area: the unique constraint was declared in a second Meta
+    class of the model that replaced it, so e.g. a repeated move of posts between shards could copy rows twice."""
+    PostExpertiseAreasAndRatings = apps.get_model("socialnetwork", "PostExpertiseAreasAndRatings")
+    first_ids = (
+        PostExpertiseAreasAndRatings.objects.values("post", "expertise_area").annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    PostExpertiseAreasAndRatings.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0002_fame_user_index'),
+        ('socialnetwork', '0013_posts_rating_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='postexpertiseareasandratings',
+            unique_together={('post', 'expertise_area')},
+        ),
+    ]
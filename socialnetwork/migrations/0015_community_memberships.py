@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0002_fame_user_index'),
+        ('socialnetwork', '0014_pear_unique_post_area'),
+    ]
+
+    operations = [
+        # the table, its unique index and communities_area_user_idx (see 0007) exist already, only the model state
+        # changes from the auto-created through model to CommunityMemberships:
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CommunityMemberships',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('expertiseareas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fame.expertiseareas')),
+                        ('socialnetworkusers', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='socialnetwork.socialnetworkusers')),
+                    ],
+                    options={
+                        'db_table': 'social_network_users_communities',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='socialnetworkusers',
+                    name='communities',
+                    field=models.ManyToManyField(blank=True, related_name='community_members', through='socialnetwork.CommunityMemberships', to='fame.expertiseareas'),
+                ),
+                migrations.AddIndex(
+                    model_name='communitymemberships',
+                    index=models.Index(fields=['expertiseareas', 'socialnetworkusers'], name='communities_area_user_idx'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='communitymemberships',
+                    unique_together={('socialnetworkusers', 'expertiseareas')},
+                ),
+            ],
+        ),
+    ]
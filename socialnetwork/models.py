@@ -3,7 +3,7 @@ import random as rnd
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
-from fame.models import ExpertiseAreas, FameUsers
+from fame.models import ExpertiseAreas, Fame, FameUsers
 from socialnetwork.magic_AI import classify_into_expertise_areas_and_check_for_bullshit
 
 rnd.seed(42)
@@ -16,10 +16,13 @@ class SocialNetworkUsers(FameUsers):
         "self", symmetrical=False, related_name="followed_by"
     )
     is_banned = models.BooleanField(default=False)
+    # follow graph counters, maintained by api.follow_many and api.unfollow_many (see api.recompute_follow_counts):
+    follows_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
     # T4
     # use this member field to adapt the data model, DO NOT RENAME!
     communities = models.ManyToManyField(
-        ExpertiseAreas, related_name="community_members", blank=True
+        ExpertiseAreas, related_name="community_members", blank=True, through="CommunityMemberships"
     )
 
     def __str__(self):
@@ -29,11 +32,28 @@ class SocialNetworkUsers(FameUsers):
         db_table = "social_network_users"
 
 
+class CommunityMemberships(models.Model):
+    """Through model of SocialNetworkUsers.communities, declared (with the table and columns of the auto-created one)
+    for the index on the members of a community."""
+
+    socialnetworkusers = models.ForeignKey(SocialNetworkUsers, on_delete=models.CASCADE)
+    expertiseareas = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("socialnetworkusers", "expertiseareas")
+        indexes = [
+            # the members of a community, e.g. for the community timeline:
+            models.Index(fields=["expertiseareas", "socialnetworkusers"], name="communities_area_user_idx"),
+        ]
+        db_table = "social_network_users_communities"
+
+
 class Posts(models.Model):
     """Posts in the social network."""
 
     content = models.CharField(max_length=42 * 42, null=False)
-    author = models.ForeignKey("SocialNetworkUsers", on_delete=models.CASCADE)
+    # indexed by the unique index on (author, submitted):
+    author = models.ForeignKey("SocialNetworkUsers", on_delete=models.CASCADE, db_index=False)
     submitted = models.DateTimeField(auto_now_add=True)
 
     cites = models.ForeignKey(
@@ -62,28 +82,65 @@ class Posts(models.Model):
 
     published = models.BooleanField(default=False)
 
+    # engagement counters, maintained by api.submit_post and api.rate_post (see api.recompute_post_stats):
+    citations_count = models.IntegerField(default=0)
+    replies_count = models.IntegerField(default=0)
+    approval_score = models.IntegerField(default=0)
+    like_score = models.IntegerField(default=0)
+    dislike_score = models.IntegerField(default=0)
+    approval_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    dislike_count = models.IntegerField(default=0)
+
+    # counter field holding the score sum for each UserRatings type:
+    RATING_SCORE_FIELDS = {
+        "A": "approval_score",
+        "L": "like_score",
+        "D": "dislike_score",
+    }
+    # counter field holding the number of ratings for each UserRatings type:
+    RATING_COUNT_FIELDS = {
+        "A": "approval_count",
+        "L": "like_count",
+        "D": "dislike_count",
+    }
+
     class Meta:
         ordering = ["-submitted"]
         unique_together = ("author", "submitted")
+        indexes = [
+            # newest first, e.g. for search, posts_in_expertise_area and cursors (the published flag is compared as a
+            # boolean, which only a partial index serves):
+            models.Index(
+                fields=["-submitted", "-id"], condition=models.Q(published=True), name="posts_published_submitted_idx"
+            ),
+            models.Index(fields=["-submitted", "-id"], name="posts_submitted_idx"),
+        ]
         db_table = "posts"
 
-    def determine_expertise_areas_and_truth_ratings(self):
-        # ask the mighty AI to classify_into_expertise_areas the content into expertise areas:
-        _expertise_areas = classify_into_expertise_areas_and_check_for_bullshit(
-            self.content
-        )
-
-        # create the expertise areas and truth ratings:
-        at_least_one_expertise_area_contains_bullshit = False
-
-        for epa in _expertise_areas:
-            PostExpertiseAreasAndRatings.objects.create(
-                post=self,
-                expertise_area=epa["expertise_area"],
-                truth_rating=epa["truth_rating"],
+    def determine_expertise_areas_and_truth_ratings(self, _expertise_areas=None):
+        # ask the mighty AI to classify_into_expertise_areas the content into expertise areas
+        # (unless the caller already did so):
+        if _expertise_areas is None:
+            _expertise_areas = classify_into_expertise_areas_and_check_for_bullshit(
+                self.content
             )
-            if epa["truth_rating"] and epa["truth_rating"].numeric_value < 0:
-                at_least_one_expertise_area_contains_bullshit = True
+
+        # create the expertise areas and truth ratings (in a single INSERT):
+        PostExpertiseAreasAndRatings.objects.bulk_create(
+            [
+                PostExpertiseAreasAndRatings(
+                    post=self,
+                    expertise_area=epa["expertise_area"],
+                    truth_rating=epa["truth_rating"],
+                )
+                for epa in _expertise_areas
+            ]
+        )
+        at_least_one_expertise_area_contains_bullshit = any(
+            epa["truth_rating"] and epa["truth_rating"].numeric_value < 0
+            for epa in _expertise_areas
+        )
 
         return at_least_one_expertise_area_contains_bullshit, _expertise_areas
 
@@ -113,13 +170,15 @@ class PostExpertiseAreasAndRatings(models.Model):
 
     class Meta:
         unique_together = ("post", "expertise_area")
+        indexes = [
+            # posts by expertise area, e.g. for the community timeline:
+            models.Index(fields=["expertise_area", "post"], name="pear_area_post_idx"),
+        ]
+        db_table = "post_expertise_areas_and_ratings"
 
     def __str__(self):
         return f"{self.post} - {self.expertise_area} - {self.truth_rating}"
 
-    class Meta:
-        db_table = "post_expertise_areas_and_ratings"
-
 
 class UserRatings(models.Model):
     """User ratings and/or approvals of a post."""
@@ -145,3 +204,151 @@ class UserRatings(models.Model):
 
     def __str__(self):
         return f"{self.user} - {self.post} - {self.type} - {self.score}"
+
+
+class TimelineEntries(models.Model):
+    """Materialized standard-mode timeline: one row per post displayed in the timeline of a user.
+    Maintained on write (fan-out) by the API, so that reading a timeline is a single range scan on the
+    (owner, submitted) index.
+    """
+
+    owner = models.ForeignKey(
+        SocialNetworkUsers, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    post = models.ForeignKey(
+        Posts, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+
+    # denormalized from the post to avoid touching the posts table for filtering and sorting:
+    author = models.ForeignKey(
+        SocialNetworkUsers, on_delete=models.CASCADE, related_name="+"
+    )
+    submitted = models.DateTimeField()
+    published = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ("owner", "post")
+        indexes = [
+            models.Index(
+                fields=["owner", "-submitted", "-post"],
+                name="timeline_owner_submitted_idx",
+            ),
+        ]
+        db_table = "timeline_entries"
+
+    def __str__(self):
+        return f"{self.owner} - {self.post}"
+
+
+class ClassificationTasks(models.Model):
+    """Queue of posts waiting for classification when posts are submitted asynchronously, processed by
+    `manage.py run_classification_worker` (see socialnetwork/worker.py)."""
+
+    PENDING = "P"
+    RUNNING = "R"
+    DONE = "D"
+    FAILED = "F"
+    STATUS = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    post = models.OneToOneField(
+        Posts, on_delete=models.CASCADE, related_name="classification_task"
+    )
+    status = models.CharField(max_length=1, choices=STATUS, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="classification_status_idx"),
+        ]
+        db_table = "classification_tasks"
+
+    def __str__(self):
+        return f"{self.post_id} - {self.get_status_display()}"
+
+
+class SimilarityBuckets(models.Model):
+    """MinHash LSH index over the expertise areas of the users' fame profiles: one bucket per user and band, users
+    sharing a bucket are candidates for api.similar_users(approximate=True) (see socialnetwork/similarity.py)."""
+
+    user = models.ForeignKey(
+        SocialNetworkUsers, on_delete=models.CASCADE, related_name="similarity_buckets"
+    )
+    band = models.SmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ("user", "band")
+        indexes = [
+            models.Index(fields=["band", "bucket"], name="similarity_bucket_idx"),
+        ]
+        db_table = "similarity_buckets"
+
+    def __str__(self):
+        return f"{self.user_id} - {self.band}: {self.bucket}"
+
+
+class Bullshitters(models.Model):
+    """Projection of the fame entries with negative fame, ranked per expertise area for api.bullshitters
+    (maintained by socialnetwork/bullshitters.py)."""
+
+    fame = models.OneToOneField(Fame, on_delete=models.CASCADE, related_name="bullshitter")
+    user = models.ForeignKey(FameUsers, on_delete=models.CASCADE, related_name="+")
+    expertise_area = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE, related_name="+")
+    # copied from the fame level and the user, so that a page of an area is read from the index alone:
+    fame_level_value = models.IntegerField()
+    date_joined = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["expertise_area", "fame_level_value", "-date_joined", "user"],
+                name="bullshitters_rank_idx",
+            ),
+        ]
+        db_table = "bullshitters"
+
+    def __str__(self):
+        return f"{self.expertise_area_id} - {self.user_id}: {self.fame_level_value}"
+
+
+class ExpertiseAreasClosure(models.Model):
+    """Closure of the expertise area hierarchy: one row for every area and each of its ancestors (including the area
+    itself with depth 0). Maintained on save of ExpertiseAreas, see socialnetwork/hierarchy.py."""
+
+    ancestor = models.ForeignKey(
+        ExpertiseAreas, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        ExpertiseAreas, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    # number of levels between ancestor and descendant:
+    depth = models.IntegerField()
+
+    class Meta:
+        unique_together = ("ancestor", "descendant")
+        indexes = [
+            models.Index(fields=["descendant", "depth"], name="closure_descendant_depth_idx"),
+        ]
+        db_table = "expertise_areas_closure"
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class IdBlocks(models.Model):
+    """Next free id of a table whose rows are spread over several databases, from which processes reserve blocks of
+    ids (see socialnetwork/sharding.py)."""
+
+    name = models.CharField(max_length=42, primary_key=True)
+    next_id = models.BigIntegerField()
+
+    class Meta:
+        db_table = "id_blocks"
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
@@ -0,0 +1,178 @@
+"""Query plan checks of socialnetwork.api on SQLite.
+
+check_api_query_plans calls the API functions (see _workload) in a transaction that is rolled back, records every
+query they execute and asks SQLite for its plan with EXPLAIN QUERY PLAN. A step of a plan scanning a table is a full
+scan unless it scans an index for a query with a LIMIT (e.g. a page of the newest posts), which stops early. Full
+scans of tables with more than max_rows rows are reported, except those in EXPECTED_FULL_SCANS.
+"""
+
+import re
+from contextlib import ExitStack
+
+from django.db import connections, transaction
+
+from fame.models import ExpertiseAreas
+from socialnetwork import api, sharding
+from socialnetwork.models import Bullshitters, Posts, SocialNetworkUsers
+
+# tables read completely by design, by workload step:
+EXPECTED_FULL_SCANS = {
+    # the fame matrix holds all fame entries in memory (see similarity.py):
+    "similar_users": {"fame"},
+}
+
+_STATEMENT = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (\S+)( USING (?:COVERING )?INDEX \S+)?$")
+_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+_LIMIT = re.compile(r"\bLIMIT \d+(?: OFFSET \d+)?\s*$", re.IGNORECASE)
+
+
+def _workload(user, other, post, area, bullshitter):
+    """The API calls to check as (name, function) pairs, the writes last. api.bullshitters is not checked, it returns
+    the whole bullshitters projection by definition (the bullshitters page reads bullshitters_pages)."""
+    cursor = api.cursor_for(post)
+    # the next page of the area of a bullshitter, if any:
+    bullshitters_page = (bullshitter.expertise_area_id, api.cursor_for(bullshitter)) if bullshitter else (None, None)
+    calls = [
+        ("timeline", lambda: list(api.timeline(user, end=9))),
+        ("timeline (next page)", lambda: list(api.timeline(user, end=9, cursor=cursor))),
+        ("timeline (unpublished)", lambda: list(api.timeline(user, end=9, published=False))),
+        ("search", lambda: list(api.search("the", end=9))),
+        ("search (next page)", lambda: list(api.search("the", end=9, cursor=cursor))),
+        ("follows", lambda: list(api.follows(user, end=9))),
+        ("followers", lambda: list(api.followers(user, end=9))),
+        ("is_following", lambda: api.is_following(user, other)),
+        ("followee_ids", lambda: api.followee_ids(user)),
+        ("fame", lambda: list(api.fame(user)[1])),
+        ("expertise_area_subtree", lambda: api.expertise_area_subtree(area)),
+        ("bullshitters_pages", lambda: api.bullshitters_pages(20)),
+        ("bullshitters_pages (next page)", lambda: api.bullshitters_pages(20, *bullshitters_page)),
+        ("similar_users", lambda: api.similar_users(user, limit=10)),
+        ("similar_users (approximate)", lambda: api.similar_users(user, limit=10, approximate=True)),
+        ("submit_post", lambda: api.submit_post(user, "Checking the query plans", cites=post, asynchronous=False)),
+        ("rate_post", lambda: api.rate_post(user, post, "L", 1)),
+        ("follow", lambda: api.follow(user, other)),
+        ("unfollow", lambda: api.unfollow(user, other)),
+        ("ban_user", lambda: api.ban_user(other)),
+    ]
+    if not sharding.enabled():
+        # not available on a sharded database:
+        calls[3:3] = [
+            ("timeline (community mode)", lambda: list(api.timeline(user, end=9, community_mode=True))),
+            ("search (ranked)", lambda: list(api.search("the", end=9, ranked=True))),
+            ("posts_in_expertise_area", lambda: list(api.posts_in_expertise_area(area)[:10])),
+            (
+                "posts_in_expertise_area (next page)",
+                lambda: list(api.posts_in_expertise_area(area, cursor=cursor)[:10]),
+            ),
+        ]
+    return calls
+
+
+def _sample_data():
+    user = SocialNetworkUsers.objects.filter(follows__isnull=False).order_by("id").first()
+    if user is None:
+        raise ValueError("The query plans are checked on the data of the database, which has no users following others")
+    other = SocialNetworkUsers.objects.exclude(id=user.id).exclude(id__in=user.follows.all()).order_by("id").first()
+    post = next(
+        (
+            post
+            for alias in ["default", *sharding.shards()]
+            for post in Posts.objects.using(alias).exclude(author=user).order_by("-submitted", "-id")[:1]
+        ),
+        None,
+    )
+    area = ExpertiseAreas.objects.filter(parent_expertise_area=None).order_by("id").first()
+    if other is None or post is None or area is None:
+        raise ValueError("The query plans are checked on the data of the database, which has too few users or posts")
+    bullshitter = Bullshitters.objects.order_by("id").first()
+    return user, other, post, area, bullshitter
+
+
+class _Recorder:
+    """Records the statements executed on a connection (see connection.execute_wrapper)."""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+        self.step = None
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and _STATEMENT.match(sql):
+            self.statements.append((self.step, sql, params))
+        return execute(sql, params, many, context)
+
+
+def _row_count(connection, table: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+        return cursor.fetchone()[0]
+
+
+def full_scans(connection, sql: str, params) -> list:
+    """The tables a statement reads completely, with the step of its plan, as (table, detail) pairs."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        details = [row[3] for row in cursor.fetchall()]
+    aliases = dict((alias, table) for table, alias in _ALIAS.findall(sql))
+    scans = []
+    for detail in details:
+        match = _SCAN.match(detail)
+        # scanning an index stops early for a LIMIT:
+        if match and not (match.group(2) and _LIMIT.search(sql)):
+            scans.append((aliases.get(match.group(1), match.group(1)), detail))
+    return scans
+
+
+def check_api_query_plans(max_rows: int = 1000) -> tuple:
+    """Check the plans of the queries of the API (see the module documentation). Returns the number of statements
+    checked and a list of the full scans of tables with more than max_rows rows, as dictionaries with the workload
+    step, the database, the table, its row count, the plan step and the SQL. Requires SQLite."""
+    aliases = [alias for alias in ["default", *sharding.shards()] if connections[alias].vendor == "sqlite"]
+    if "default" not in aliases:
+        raise ValueError("EXPLAIN QUERY PLAN is specific to SQLite, the default database is not an SQLite database")
+    sample = _sample_data()
+    recorders = [_Recorder(alias) for alias in aliases]
+    with ExitStack() as stack:
+        for recorder in recorders:
+            stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+            stack.enter_context(transaction.atomic(using=recorder.alias))
+            # the writes are undone:
+            stack.callback(transaction.set_rollback, True, using=recorder.alias)
+        for step, call in _workload(*sample):
+            for recorder in recorders:
+                recorder.step = step
+            call()
+        for recorder in recorders:
+            recorder.step = None
+
+    checked, findings = 0, []
+    for recorder in recorders:
+        connection = connections[recorder.alias]
+        # counted when first scanned:
+        rows = dict.fromkeys(connection.introspection.table_names())
+        seen = set()
+        for step, sql, params in recorder.statements:
+            key = (step, sql, tuple(params or ()))
+            if key in seen:
+                continue
+            seen.add(key)
+            checked += 1
+            for table, detail in full_scans(connection, sql, params):
+                # subqueries, views and virtual tables are no tables:
+                if table not in rows or table in EXPECTED_FULL_SCANS.get(step, ()):
+                    continue
+                if rows[table] is None:
+                    rows[table] = _row_count(connection, table)
+                if rows[table] > max_rows:
+                    findings.append(
+                        {
+                            "step": step,
+                            "database": recorder.alias,
+                            "table": table,
+                            "rows": rows[table],
+                            "plan": detail,
+                            "sql": sql,
+                        }
+                    )
+    return checked, findings
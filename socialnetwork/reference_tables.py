@@ -0,0 +1,6 @@
+"""In-process cache of the truth ratings, see fame.reference_tables."""
+
+from fame.reference_tables import ReferenceTable
+from socialnetwork.models import TruthRatings
+
+truth_ratings = ReferenceTable(TruthRatings)
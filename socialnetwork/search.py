@@ -0,0 +1,248 @@
+"""Full-text search index over post contents and author names, used by api.search.
+
+The index is a separate table keyed by post id, created by migration 0004_posts_search_index and, where it is missing
+(e.g. after recreate_models_and_data.sh regenerated the migrations), after every migrate (see create_missing_index):
+- on SQLite an FTS5 virtual table with the trigram tokenizer, which keeps the case-insensitive substring semantics
+  of icontains for keywords with at least three characters,
+- on PostgreSQL a tsvector table with a GIN index.
+On other databases (and for keywords too short for the trigram index) search falls back to icontains predicates.
+
+The backend is chosen by database vendor and can be overridden with the setting SOCIALNETWORK_SEARCH_BACKEND
+(dotted path to a SearchBackend subclass).
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, router
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from socialnetwork.models import Posts
+
+SEARCH_TABLE = "posts_search"
+# posts indexed per statement when filling a new index:
+FILL_CHUNK_SIZE = 5000
+
+
+def _author_text(author) -> str:
+    return f"{author.first_name} {author.last_name} {author.email}"
+
+
+def _as_bool(published) -> bool:
+    # published may come as a string from the query parameters of the html views:
+    return models.BooleanField().to_python(published)
+
+
+def _in_rank_order(ids):
+    """Queryset of the posts with the given ids, ordered like the ids."""
+    return Posts.objects.filter(id__in=ids).order_by(
+        Case(
+            *[When(id=post_id, then=Value(i)) for i, post_id in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
+
+
+class SearchBackend:
+    """Matches posts containing a keyword in their content or in the name or email of their author."""
+
+    def search(self, keyword: str, published=True, ranked: bool = False, limit: int = None):
+        """Get a queryset of the matching posts that are (not) published.
+        If ranked, the posts are ordered by relevance and only the limit most relevant posts are returned,
+        otherwise all posts are returned newest first (as required by keyset pagination).
+        """
+        raise NotImplementedError()
+
+    def index_posts(self, posts):
+        """Add posts to the index or update them in the index. The authors of the posts should be loaded."""
+
+    def set_published(self, posts, published):
+        """Update the published flag of a queryset of posts in the index."""
+
+    def rebuild(self):
+        """Rebuild the index from all posts. Returns the number of indexed posts."""
+        return 0
+
+
+class IContainsSearchBackend(SearchBackend):
+    """No index, every search scans the posts with LIKE '%keyword%'."""
+
+    def search(self, keyword: str, published=True, ranked: bool = False, limit: int = None):
+        # there is no relevance without an index, ranked results are simply the newest:
+        return Posts.objects.filter(
+            Q(content__icontains=keyword)
+            | Q(author__email__icontains=keyword)
+            | Q(author__first_name__icontains=keyword)
+            | Q(author__last_name__icontains=keyword),
+            published=published,
+        ).order_by("-submitted", "-id")
+
+
+class _IndexedSearchBackend(SearchBackend):
+    """Shared implementation of the backends maintaining the posts_search table."""
+
+    # keywords shorter than this cannot be answered by the index:
+    min_keyword_length = 1
+    match_sql = None
+    rank_sql = None
+    upsert_sql = None
+    rebuild_sql = None
+    # statements creating the (empty) index:
+    create_sql = ()
+
+    def _match_param(self, keyword: str) -> str:
+        return keyword
+
+    def search(self, keyword: str, published=True, ranked: bool = False, limit: int = None):
+        if len(keyword) < self.min_keyword_length:
+            return IContainsSearchBackend().search(
+                keyword, published=published, ranked=ranked, limit=limit
+            )
+
+        params = [self._match_param(keyword), _as_bool(published)]
+        if ranked:
+            # on the database the search reads from (see famesocialnetwork/db/routers.py):
+            with connections[router.db_for_read(Posts)].cursor() as cursor:
+                if limit is None:
+                    cursor.execute(self.rank_sql, params)
+                else:
+                    cursor.execute(self.rank_sql + " LIMIT %s", [*params, limit])
+                return _in_rank_order([row[0] for row in cursor.fetchall()])
+        return Posts.objects.filter(id__in=RawSQL(self.match_sql, params)).order_by(
+            "-submitted", "-id"
+        )
+
+    def index_posts(self, posts):
+        rows = [
+            (post.id, post.content, _author_text(post.author), post.published)
+            for post in posts
+        ]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.upsert_sql, rows)
+
+    def set_published(self, posts, published):
+        sql, params = posts.values("id").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SEARCH_TABLE} SET published = %s WHERE {self.id_column} IN ({sql})",
+                [_as_bool(published), *params],
+            )
+
+    def create_index(self, connection):
+        """Create the index on the given connection and index the existing posts."""
+        with connection.cursor() as cursor:
+            for sql in self.create_sql:
+                cursor.execute(sql)
+            cursor.execute("SELECT MAX(id) FROM posts")
+            max_id = cursor.fetchone()[0] or 0
+            for start in range(0, max_id, FILL_CHUNK_SIZE):
+                cursor.execute(
+                    f"{self.rebuild_sql} WHERE posts.id > %s AND posts.id <= %s", [start, start + FILL_CHUNK_SIZE]
+                )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            if self.rebuild_sql is not None:
+                cursor.execute(self.rebuild_sql)
+                return Posts.objects.count()
+        count = 0
+        posts = Posts.objects.select_related("author").order_by("id")
+        last_id = 0
+        while True:
+            chunk = list(posts.filter(id__gt=last_id)[:5000])
+            if not chunk:
+                return count
+            self.index_posts(chunk)
+            count += len(chunk)
+            last_id = chunk[-1].id
+
+
+class SQLiteFTS5SearchBackend(_IndexedSearchBackend):
+    """FTS5 virtual table with the trigram tokenizer, the post id is the rowid."""
+
+    min_keyword_length = 3
+    id_column = "rowid"
+    match_sql = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND published = %s"
+    rank_sql = match_sql + " ORDER BY rank"
+    upsert_sql = (
+        f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, content, author, published) VALUES (%s, %s, %s, %s)"
+    )
+    # bulk load in a single statement, must produce the same author text as _author_text:
+    rebuild_sql = (
+        f"INSERT INTO {SEARCH_TABLE} (rowid, content, author, published) "
+        f"SELECT posts.id, posts.content, "
+        f"fame_users.first_name || ' ' || fame_users.last_name || ' ' || fame_users.email, posts.published "
+        f"FROM posts INNER JOIN fame_users ON fame_users.id = posts.author_id"
+    )
+
+    create_sql = (
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+        f"content, author, published UNINDEXED, tokenize = 'trigram')",
+    )
+
+    def _match_param(self, keyword: str) -> str:
+        # search the keyword as a phrase, i.e. without interpreting FTS5 query syntax:
+        return '"' + keyword.replace('"', '""') + '"'
+
+
+class PostgresSearchBackend(_IndexedSearchBackend):
+    """tsvector column with a GIN index. Note that this matches words (after normalization) instead of substrings."""
+
+    id_column = "post_id"
+    match_sql = (
+        f"SELECT post_id FROM {SEARCH_TABLE} "
+        f"WHERE document @@ plainto_tsquery('simple', %s) AND published = %s"
+    )
+    rank_sql = (
+        f"SELECT post_id FROM {SEARCH_TABLE}, plainto_tsquery('simple', %s) query "
+        f"WHERE document @@ query AND published = %s ORDER BY ts_rank(document, query) DESC"
+    )
+    upsert_sql = (
+        f"INSERT INTO {SEARCH_TABLE} (post_id, document, published) "
+        f"VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B'), %s) "
+        f"ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document, published = EXCLUDED.published"
+    )
+    # bulk load in a single statement, must produce the same document as upsert_sql with _author_text:
+    rebuild_sql = (
+        f"INSERT INTO {SEARCH_TABLE} (post_id, document, published) "
+        f"SELECT posts.id, setweight(to_tsvector('simple', posts.content), 'A') || setweight(to_tsvector('simple', "
+        f"fame_users.first_name || ' ' || fame_users.last_name || ' ' || fame_users.email), 'B'), posts.published "
+        f"FROM posts INNER JOIN fame_users ON fame_users.id = posts.author_id"
+    )
+    create_sql = (
+        f"CREATE TABLE {SEARCH_TABLE} ("
+        f"post_id bigint PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE, "
+        f"document tsvector NOT NULL, "
+        f"published boolean NOT NULL)",
+        f"CREATE INDEX posts_search_document_idx ON {SEARCH_TABLE} USING GIN (document)",
+    )
+
+
+# the backend maintaining the posts_search table, by database vendor:
+INDEXED_BACKENDS = {
+    "sqlite": SQLiteFTS5SearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend() -> SearchBackend:
+    """Get the search backend configured in the settings or the default one for the database in use."""
+    backend = getattr(settings, "SOCIALNETWORK_SEARCH_BACKEND", None)
+    if backend is not None:
+        return import_string(backend)()
+    if connection.vendor in INDEXED_BACKENDS:
+        return INDEXED_BACKENDS[connection.vendor]()
+    return IContainsSearchBackend()
+
+
+def create_missing_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the index on the given database if it has posts but no index, a post_migrate handler. Migrations
+    regenerated from the models (recreate_models_and_data.sh) do not contain migration 0004, which creates it."""
+    connection = connections[using]
+    if connection.vendor not in INDEXED_BACKENDS:
+        return
+    tables = connection.introspection.table_names()
+    if "posts" in tables and SEARCH_TABLE not in tables:
+        INDEXED_BACKENDS[connection.vendor]().create_index(connection)
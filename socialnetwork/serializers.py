@@ -1,17 +1,17 @@
-from django.db.models import Sum
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
+from famesocialnetwork.profiling import ProfiledSerializerMixin
 from .models import Posts, SocialNetworkUsers
 
 
-class SocialNetworkUsersSerializer(serializers.ModelSerializer):
+class SocialNetworkUsersSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = SocialNetworkUsers
         fields = "__all__"
 
 
-class PostsSerializer(serializers.ModelSerializer):
+class PostsSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     expertise_area_and_truth_ratings = SerializerMethodField()
     date_submitted = SerializerMethodField()
     user_ratings = SerializerMethodField()
@@ -48,18 +48,20 @@ class PostsSerializer(serializers.ModelSerializer):
         return ret
 
     def get_citations(self, post: Posts):
-        return Posts.objects.filter(cites=post).count()
+        return post.citations_count
 
     def get_replies(self, post: Posts):
-        return Posts.objects.filter(replies_to=post).count()
+        return post.replies_count
 
     def get_date_submitted(self, post: Posts):
         return post.submitted.strftime("%Y-%m-%d %H:%M")
 
     def get_user_ratings(self, post: Posts):
+        # the score sum of each rating type the post has ratings of:
         ret = {}
-        for pur in post.userratings_set.values("type").annotate(score=Sum("score")):
-            ret[pur["type"]] = pur["score"]
+        for rating_type, field in sorted(Posts.RATING_SCORE_FIELDS.items()):
+            if getattr(post, Posts.RATING_COUNT_FIELDS[rating_type]):
+                ret[rating_type] = getattr(post, field)
         return ret
 
     def get_author(self, post: Posts):
@@ -0,0 +1,331 @@
+"""Optional horizontal sharding of the posts and their ratings by author id.
+
+With settings.SHARD_DATABASES (see FAMESOCIALNETWORK_DB_SHARDS in the settings), the rows of Posts,
+PostExpertiseAreasAndRatings and UserRatings are stored on the shard of the post's author,
+SHARD_DATABASES[author_id % len(SHARD_DATABASES)]. All other tables stay on the default database. Shards hold only the
+tables of the sharded models (see ShardRouter.allow_migrate). Their rows reference users, expertise areas and posts on
+other databases, so shards use the sqlite3_shard backend, which does not enforce foreign keys.
+
+- Post ids are unique across the shards and kept when a post moves. They are allocated from blocks reserved on the
+  default database (see next_post_id). Ids of expertise areas and ratings are local to a shard.
+- api.submit_post, classify_and_publish_many, rate_post and ban_user write to the author's shard.
+- api.timeline and api.search query every shard newest first and merge the results (see MergedPosts).
+- ShardRouter routes saved instances and the posts of a user (user.posts_set) to their shard, and the users, expertise
+  areas and truth ratings of rows on a shard to the default database.
+- `manage.py reshard` moves rows to the shard of their author: from the default database when sharding is enabled
+  and between shards when shards are added or removed.
+
+Sharding replaces the materialized timelines and the search index, which are neither written nor read. Not
+available on a sharded database: the community timeline, asynchronous classification (posts are classified on
+submission), and the functions reading posts through joins with other tables (posts_in_expertise_area and
+recompute_post_stats). Related lookups between posts (cites, replies_to) only find posts on the same shard.
+"""
+
+import heapq
+import threading
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import F, Max, Prefetch, Q, prefetch_related_objects
+
+from fame.models import FameUsers
+from socialnetwork.models import (
+    ClassificationTasks,
+    IdBlocks,
+    PostExpertiseAreasAndRatings,
+    Posts,
+    SocialNetworkUsers,
+    TimelineEntries,
+    UserRatings,
+)
+
+SHARDED_MODELS = {"posts", "postexpertiseareasandratings", "userratings"}
+# number of post ids a process reserves at once:
+ID_BLOCK_SIZE = 100
+
+
+def shards() -> list:
+    return getattr(settings, "SHARD_DATABASES", [])
+
+
+def enabled() -> bool:
+    return bool(shards())
+
+
+def shard_for(author_id: int) -> str:
+    """The shard storing the posts of the author."""
+    databases = shards()
+    return databases[author_id % len(databases)]
+
+
+def db_for_author(author_id: int):
+    """The database storing the posts of the author: the author's shard, or None (the database chosen by the routers)
+    without sharding. To be passed to QuerySet.using and transaction.atomic."""
+    return shard_for(author_id) if enabled() else None
+
+
+def by_database(items, author_id) -> dict:
+    """Group items by the database of their author, author_id(item) gives the author id of an item."""
+    groups = defaultdict(list)
+    for item in items:
+        groups[db_for_author(author_id(item))].append(item)
+    return groups
+
+
+def atomic(alias):
+    """A transaction on the shard (see db_for_author). Nothing without sharding, where the caller holds the
+    transaction on the default database."""
+    return nullcontext() if alias is None else transaction.atomic(using=alias)
+
+
+class _IdAllocator:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def _max_id(self) -> int:
+        return max(
+            Posts.objects.using(alias).aggregate(max_id=Max("id"))["max_id"] or 0
+            for alias in [DEFAULT_DB_ALIAS, *shards()]
+        )
+
+    def _reserve(self):
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not IdBlocks.objects.filter(name=self.name).update(next_id=F("next_id") + ID_BLOCK_SIZE):
+                try:
+                    # the first block, starting after the ids of the posts created before sharding:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        IdBlocks.objects.create(name=self.name, next_id=self._max_id() + 1 + ID_BLOCK_SIZE)
+                except IntegrityError:
+                    # another process created it first
+                    IdBlocks.objects.filter(name=self.name).update(next_id=F("next_id") + ID_BLOCK_SIZE)
+            self._end = IdBlocks.objects.get(name=self.name).next_id
+        self._next = self._end - ID_BLOCK_SIZE
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve()
+            self._next += 1
+            return self._next - 1
+
+
+_post_ids = _IdAllocator("posts")
+
+
+def next_post_id():
+    """The id of a new post on a shard, None (an id assigned by the database) without sharding. Reserves a new block
+    of ids when the block of the process is used up: call it outside of transactions, as a block reserved in a
+    transaction that is rolled back would be handed out again."""
+    return _post_ids.next() if enabled() else None
+
+
+def _shard_of(instance):
+    """The shard of a row of a sharded model, None if unknown."""
+    if isinstance(instance, Posts) and instance.author_id is not None:
+        return shard_for(instance.author_id)
+    post = instance._state.fields_cache.get("post") if hasattr(instance, "post_id") else None
+    if post is not None:
+        return _shard_of(post)
+    return instance._state.db if instance._state.db in shards() else None
+
+
+class ShardRouter:
+    """Routes the rows of the sharded models to their shard, see the module documentation. Must come before the
+    other routers."""
+
+    def _db_for(self, model, instance):
+        if not enabled() or instance is None:
+            return None
+        if model._meta.model_name in SHARDED_MODELS:
+            if model is Posts and isinstance(instance, FameUsers):
+                # the posts of a user:
+                return shard_for(instance.id)
+            if isinstance(instance, (Posts, PostExpertiseAreasAndRatings, UserRatings)):
+                return _shard_of(instance)
+            return None
+        # users, expertise areas and truth ratings of rows on a shard:
+        return DEFAULT_DB_ALIAS if instance._state.db in shards() else None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *shards()}
+        if enabled() and obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in shards():
+            return app_label == "socialnetwork" and model_name in SHARDED_MODELS
+        return None
+
+
+# scatter-gather reads:
+
+
+def _newest_first(post):
+    return post.submitted, post.id
+
+
+def with_serialization_data(posts):
+    """Load the authors, expertise areas and truth ratings of a list of posts from several shards, like
+    api.with_serialization_data: a query per shard and one per related table."""
+    prefetch_related_objects(posts, "author")
+    for alias, group in by_database(posts, lambda post: post.author_id).items():
+        prefetch_related_objects(
+            group,
+            Prefetch(
+                "postexpertiseareasandratings_set",
+                queryset=PostExpertiseAreasAndRatings.objects.using(alias).order_by("id"),
+            ),
+        )
+    prefetch_related_objects(
+        [pear for post in posts for pear in post.postexpertiseareasandratings_set.all()],
+        "expertise_area",
+        "truth_rating",
+    )
+    return posts
+
+
+class MergedPosts:
+    """The posts of querysets on several shards, each ordered newest first, merged newest first. Sliced like a
+    queryset: a slice reads at most as many posts as its end from every shard and is returned as a list (with the
+    serialization data), a slice without an end stays lazy."""
+
+    def __init__(self, querysets, offset: int = 0):
+        self.querysets = querysets
+        self.offset = offset
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None or (item.start or 0) < 0 or (item.stop or 0) < 0:
+            raise TypeError("Merged posts only support slices with non-negative bounds")
+        start = self.offset + (item.start or 0)
+        if item.stop is None:
+            return MergedPosts(self.querysets, start)
+        stop = self.offset + item.stop
+        # a k-way merge of the shards' results:
+        merged = heapq.merge(
+            *(queryset[:stop] for queryset in self.querysets), key=_newest_first, reverse=True
+        )
+        return with_serialization_data(list(islice(merged, start, stop)))
+
+    def __iter__(self):
+        merged = heapq.merge(*self.querysets, key=_newest_first, reverse=True)
+        return iter(with_serialization_data(list(islice(merged, self.offset, None))))
+
+
+def timeline(user: SocialNetworkUsers, published, cursor_q: Q) -> MergedPosts:
+    """The standard mode timeline (see api.timeline): the posts of the followed users and the user's own posts, read
+    from the shards of their authors."""
+    followee_ids = SocialNetworkUsers.follows.through.objects.filter(from_socialnetworkusers=user).values_list(
+        "to_socialnetworkusers", flat=True
+    )
+    querysets = []
+    for alias, author_ids in by_database([user.id, *followee_ids], lambda author_id: author_id).items():
+        condition = Q(author_id__in=[author_id for author_id in author_ids if author_id != user.id]) & Q(
+            published=published
+        )
+        if user.id in author_ids:
+            condition |= Q(author_id=user.id)
+        querysets.append(Posts.objects.using(alias).filter(condition & cursor_q).order_by("-submitted", "-id"))
+    return MergedPosts(querysets)
+
+
+def search(keyword: str, published, cursor_q: Q) -> MergedPosts:
+    """Posts containing the keyword in their content or in the name or email of their author (see api.search),
+    without the search index: the content is matched on every shard, the authors on the default database."""
+    author_ids = SocialNetworkUsers.objects.filter(
+        Q(email__icontains=keyword) | Q(first_name__icontains=keyword) | Q(last_name__icontains=keyword)
+    ).values_list("id", flat=True)
+    authors_by_shard = by_database(author_ids, lambda author_id: author_id)
+    return MergedPosts(
+        [
+            Posts.objects.using(alias)
+            .filter(
+                (Q(content__icontains=keyword) | Q(author_id__in=authors_by_shard.get(alias, [])))
+                & Q(published=published)
+                & cursor_q
+            )
+            .order_by("-submitted", "-id")
+            for alias in shards()
+        ]
+    )
+
+
+# resharding:
+
+
+def _copy_rows(model, source: str, target: str, post_ids, keep_id: bool):
+    """Copy the rows of model belonging to the posts from source to target with plain INSERT statements, which keep
+    auto_now_add values. Rows already on target (by primary key or unique_together) are skipped, so that an interrupted
+    move can be repeated."""
+    fields = [field for field in model._meta.concrete_fields if keep_id or not field.primary_key]
+    rows = list(
+        model.objects.using(source)
+        .filter(**{"id__in" if model is Posts else "post_id__in": post_ids})
+        .order_by("id")
+        .values_list(*[field.attname for field in fields])
+    )
+    quote_name = connections[target].ops.quote_name
+    sql = "INSERT OR IGNORE INTO {} ({}) VALUES ({})".format(
+        quote_name(model._meta.db_table),
+        ", ".join(quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    with connections[target].cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _move_posts(post_ids, source: str, target: str):
+    with transaction.atomic(using=target):
+        _copy_rows(Posts, source, target, post_ids, keep_id=True)
+        _copy_rows(PostExpertiseAreasAndRatings, source, target, post_ids, keep_id=False)
+        _copy_rows(UserRatings, source, target, post_ids, keep_id=False)
+    # posts on the default database may be referenced by posts (cites, replies_to) not moved yet:
+    with connections[source].constraint_checks_disabled(), transaction.atomic(using=source):
+        PostExpertiseAreasAndRatings.objects.using(source).filter(post_id__in=post_ids).delete()
+        UserRatings.objects.using(source).filter(post_id__in=post_ids).delete()
+        if source == DEFAULT_DB_ALIAS:
+            # not used with sharding:
+            for model in (TimelineEntries, ClassificationTasks):
+                model.objects.filter(post_id__in=post_ids).delete()
+        # a plain DELETE, as deleting with the ORM would also delete the posts citing or replying to the moved ones:
+        with connections[source].cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE id IN ({})".format(
+                    connections[source].ops.quote_name(Posts._meta.db_table), ", ".join(["%s"] * len(post_ids))
+                ),
+                post_ids,
+            )
+
+
+def reshard(batch_size: int = 1000, dry_run: bool = False) -> Counter:
+    """Move the posts, with their expertise areas and ratings, that are not on the shard of their author (or on the
+    default database) to the shard of their author, batch_size posts per transaction. Returns the number of posts
+    moved (or, if dry_run, to be moved) by source and target database."""
+    if not enabled():
+        raise ValueError("Sharding is not enabled, there are no shards to move the posts to")
+    moved = Counter()
+    for source in [DEFAULT_DB_ALIAS, *shards()]:
+        author_ids = Posts.objects.using(source).order_by().values_list("author_id", flat=True).distinct()
+        for author_id in list(author_ids):
+            target = shard_for(author_id)
+            if target == source:
+                continue
+            posts = Posts.objects.using(source).filter(author_id=author_id)
+            if dry_run:
+                moved[source, target] += posts.count()
+                continue
+            while post_ids := list(posts.order_by("id").values_list("id", flat=True)[:batch_size]):
+                _move_posts(post_ids, source, target)
+                moved[source, target] += len(post_ids)
+    return moved
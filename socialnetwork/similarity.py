@@ -0,0 +1,327 @@
+"""Similarity of users by their fame profiles, used by api.similar_users.
+
+The fame of a user u_j is similar to the fame of u_i in an expertise area if both have a fame entry in the area and
+their fame levels differ by at most MAX_FAME_DIFFERENCE. The similarity of u_j to u_i is the fraction of the
+expertise areas of u_i in which u_j is similar.
+
+All fame entries are held in memory as a user x expertise area matrix of numeric fame levels, loaded with a single
+query. Saving or deleting a fame entry through the ORM updates the matrix in place, other changes (queryset
+update()/delete(), raw SQL, other processes, rolled back transactions) are picked up after settings.SIMILAR_USERS_TTL
+seconds or by calling invalidate().
+
+For networks too large for exact similarities, the similarity_buckets table holds a MinHash LSH index over the fame
+profiles of the users (see approximate_similarities). It is updated when fame entries are saved or deleted through the
+ORM (e.g. by api.adjust_fame_profile), or once per user at the end of a deferred_indexing block.
+`manage.py rebuild_similarity_index` rebuilds it after bulk changes.
+"""
+
+import hashlib
+import random as rnd
+import threading
+import time
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+
+from fame.models import Fame, FameLevels
+from fame.reference_tables import fame_levels
+from socialnetwork.models import SimilarityBuckets
+
+MAX_FAME_DIFFERENCE = 100
+
+# users become candidates if their signatures agree in all rows of at least one band, the probability for sets with
+# Jaccard similarity s is 1 - (1 - s**ROWS_PER_BAND)**BANDS:
+BANDS = 24
+ROWS_PER_BAND = 2
+# number of candidates compared exactly by approximate_similarities:
+MAX_CANDIDATES = 2000
+_PRIME = 2**31 - 1
+_lre = rnd.Random(4711)
+_HASH_A = np.array([_lre.randrange(1, _PRIME) for _ in range(BANDS * ROWS_PER_BAND)], dtype=np.int64)
+_HASH_B = np.array([_lre.randrange(0, _PRIME) for _ in range(BANDS * ROWS_PER_BAND)], dtype=np.int64)
+
+
+class FameMatrix:
+    """Numeric fame levels of all users (rows) in all expertise areas (columns)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._invalidated = True
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.date_joined = np.empty(0, dtype=np.float64)
+        self.levels = np.zeros((0, 0), dtype=np.int32)
+        # whether a user has a fame entry in an area at all:
+        self.has_fame = np.zeros((0, 0), dtype=bool)
+        self._rows = {}
+        self._columns = {}
+        post_save.connect(self._fame_saved, sender=Fame, weak=False)
+        post_delete.connect(self._fame_deleted, sender=Fame, weak=False)
+        post_save.connect(self.invalidate, sender=FameLevels, weak=False)
+        post_delete.connect(self.invalidate, sender=FameLevels, weak=False)
+
+    def invalidate(self, **kwargs):
+        self._invalidated = True
+
+    def _load(self):
+        entries = list(
+            Fame.objects.order_by().values_list(
+                "user_id", "user__date_joined", "expertise_area_id", "fame_level_id"
+            )
+        )
+        users = sorted({(user_id, date_joined) for user_id, date_joined, _, _ in entries})
+        rows = {user_id: row for row, (user_id, _) in enumerate(users)}
+        columns = {
+            area_id: column
+            for column, area_id in enumerate(sorted({area_id for _, _, area_id, _ in entries}))
+        }
+        numeric_values = {level.id: level.numeric_value for level in fame_levels.all()}
+
+        levels = np.zeros((len(rows), len(columns)), dtype=np.int32)
+        has_fame = np.zeros((len(rows), len(columns)), dtype=bool)
+        if entries:
+            user_index = np.fromiter((rows[entry[0]] for entry in entries), np.int64, len(entries))
+            area_index = np.fromiter((columns[entry[2]] for entry in entries), np.int64, len(entries))
+            levels[user_index, area_index] = np.fromiter(
+                (numeric_values[entry[3]] for entry in entries), np.int32, len(entries)
+            )
+            has_fame[user_index, area_index] = True
+
+        self.user_ids = np.fromiter((user_id for user_id, _ in users), np.int64, len(users))
+        self.date_joined = np.fromiter(
+            (date_joined.timestamp() for _, date_joined in users), np.float64, len(users)
+        )
+        self.levels = levels
+        self.has_fame = has_fame
+        self._rows = rows
+        self._columns = columns
+        self._loaded_at = time.monotonic()
+        self._invalidated = False
+
+    def _ensure_loaded(self):
+        if self._invalidated or time.monotonic() - self._loaded_at > settings.SIMILAR_USERS_TTL:
+            self._load()
+
+    def _fame_saved(self, instance, **kwargs):
+        with self._lock:
+            row = self._rows.get(instance.user_id)
+            column = self._columns.get(instance.expertise_area_id)
+            if self._invalidated or row is None or column is None:
+                # a new user or expertise area changes the shape of the matrix, rebuild it on the next use:
+                self._invalidated = True
+                return
+            self.levels[row, column] = fame_levels.get(instance.fame_level_id).numeric_value
+            self.has_fame[row, column] = True
+
+    def _fame_deleted(self, instance, **kwargs):
+        with self._lock:
+            row = self._rows.get(instance.user_id)
+            column = self._columns.get(instance.expertise_area_id)
+            if row is not None and column is not None:
+                self.has_fame[row, column] = False
+
+    def similarities(self, user_id: int):
+        """Get the ids of the users similar to the given user and their similarities (both as arrays), ordered by
+        similarity (descending) and date joined (most recent first). Users with a similarity of 0 are left out."""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._rows.get(user_id)
+            if row is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+            own_areas = self.has_fame[row]
+            area_count = int(own_areas.sum())
+            if area_count == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+            difference = np.abs(self.levels[:, own_areas] - self.levels[row, own_areas])
+            similar = self.has_fame[:, own_areas] & (difference <= MAX_FAME_DIFFERENCE)
+            similarity = similar.sum(axis=1) / area_count
+            similarity[row] = 0.0
+
+            candidates = np.flatnonzero(similarity)
+            # lexsort sorts by the last key first:
+            order = np.lexsort((-self.date_joined[candidates], -similarity[candidates]))
+            candidates = candidates[order]
+            return self.user_ids[candidates], similarity[candidates]
+
+
+fame_matrix = FameMatrix()
+
+
+def _similarity(own_levels: dict, levels: dict) -> float:
+    similar = sum(
+        1
+        for area_id, level in own_levels.items()
+        if area_id in levels and abs(levels[area_id] - level) <= MAX_FAME_DIFFERENCE
+    )
+    return similar / len(own_levels)
+
+
+def _tokens(levels: dict):
+    # two grids of cells of width 2 * MAX_FAME_DIFFERENCE, shifted by MAX_FAME_DIFFERENCE: levels differing by at most
+    # MAX_FAME_DIFFERENCE fall into the same cell of at least one grid, so similar fame shares a token
+    return [
+        (area_id << 16) | (grid << 15) | ((level + grid * MAX_FAME_DIFFERENCE) // (2 * MAX_FAME_DIFFERENCE) & 0x7FFF)
+        for area_id, level in levels.items()
+        for grid in (0, 1)
+    ]
+
+
+def buckets(levels: dict):
+    """Get the LSH bucket of each band for a fame profile given as {expertise area id: numeric fame level}
+    (empty for an empty profile)."""
+    if not levels:
+        return []
+    tokens = np.array(_tokens(levels), dtype=np.int64) % _PRIME
+    signature = ((_HASH_A[:, None] * tokens[None, :] + _HASH_B[:, None]) % _PRIME).min(axis=1)
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band in signature.reshape(BANDS, ROWS_PER_BAND)
+    ]
+
+
+def _fame_profiles(fame_entries):
+    """Group (user id, expertise area id, fame level id) tuples to {user id: {expertise area id: numeric level}}."""
+    profiles = {}
+    for user_id, area_id, level_id in fame_entries:
+        profiles.setdefault(user_id, {})[area_id] = fame_levels.get(level_id).numeric_value
+    return profiles
+
+
+def _bucket_rows(profiles: dict):
+    """(user id, band, bucket) tuples of the given fame profiles."""
+    return [
+        (user_id, band, bucket)
+        for user_id, levels in profiles.items()
+        for band, bucket in enumerate(buckets(levels))
+    ]
+
+
+def index_users(user_ids, batch_size: int = 5000):
+    """Recompute the LSH buckets of the given users from their fame profiles. Within a transaction, a failure rolls
+    back the enclosing transaction (no savepoint, which would cost two queries)."""
+    user_ids = list(user_ids)
+    with transaction.atomic(savepoint=False):
+        for i in range(0, len(user_ids), batch_size):
+            batch = user_ids[i : i + batch_size]
+            profiles = _fame_profiles(
+                Fame.objects.filter(user_id__in=batch)
+                .order_by()
+                .values_list("user_id", "expertise_area_id", "fame_level_id")
+            )
+            SimilarityBuckets.objects.filter(user_id__in=batch).delete()
+            SimilarityBuckets.objects.bulk_create(
+                [
+                    SimilarityBuckets(user_id=user_id, band=band, bucket=bucket)
+                    for user_id, band, bucket in _bucket_rows(profiles)
+                ]
+            )
+
+
+def index_user(user_id: int):
+    """Recompute the LSH buckets of a user from their fame profile."""
+    index_users([user_id])
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_indexing():
+    """Within the block, saving or deleting fame entries only collects their users, which are indexed at once when
+    the block is left (e.g. while generating fake data, where users change their fame many times, or in
+    api.classify_and_publish_many, where a post changes the fame of its author in several areas)."""
+    if getattr(_deferred, "user_ids", None) is not None:
+        # nested, the outermost block indexes:
+        yield
+        return
+    _deferred.user_ids = set()
+    try:
+        yield
+        if _deferred.user_ids:
+            index_users(_deferred.user_ids)
+    finally:
+        _deferred.user_ids = None
+
+
+def rebuild_index(batch_size: int = 5000) -> int:
+    """Rebuild the LSH index from all fame entries. Returns the number of indexed users."""
+    profiles = _fame_profiles(
+        Fame.objects.order_by().values_list("user_id", "expertise_area_id", "fame_level_id")
+    )
+    # plain INSERT statements, bulk_create spends most of the time building model instances:
+    sql = "INSERT INTO {} (user_id, band, bucket) VALUES (%s, %s, %s)".format(
+        connection.ops.quote_name(SimilarityBuckets._meta.db_table)
+    )
+    user_ids = list(profiles)
+    with transaction.atomic(), connection.cursor() as cursor:
+        SimilarityBuckets.objects.all().delete()
+        for i in range(0, len(user_ids), batch_size):
+            cursor.executemany(
+                sql, _bucket_rows({user_id: profiles[user_id] for user_id in user_ids[i : i + batch_size]})
+            )
+    return len(profiles)
+
+
+def _fame_changed(instance, raw=False, **kwargs):
+    # loaddata is followed by a rebuild:
+    if raw:
+        return
+    if getattr(_deferred, "user_ids", None) is not None:
+        _deferred.user_ids.add(instance.user_id)
+    else:
+        index_user(instance.user_id)
+
+
+post_save.connect(_fame_changed, sender=Fame, weak=False)
+post_delete.connect(_fame_changed, sender=Fame, weak=False)
+
+
+def approximate_similarities(user_id: int, limit: int = None):
+    """Like FameMatrix.similarities, but only the (at most MAX_CANDIDATES) users sharing the most LSH buckets with the
+    given user are compared (exactly). Does not hold any data in memory."""
+    own_levels = _fame_profiles(
+        Fame.objects.filter(user_id=user_id)
+        .order_by()
+        .values_list("user_id", "expertise_area_id", "fame_level_id")
+    ).get(user_id)
+    if not own_levels:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    # the users sharing the most buckets, whose profiles are the most likely to be similar:
+    candidates = (
+        SimilarityBuckets.objects.filter(
+            reduce(or_, [Q(band=band, bucket=bucket) for band, bucket in enumerate(buckets(own_levels))])
+        )
+        .exclude(user_id=user_id)
+        .values("user_id")
+        .annotate(shared=Count("id"))
+        .order_by("-shared")
+        .values("user_id")[:MAX_CANDIDATES]
+    )
+    rows = list(
+        Fame.objects.filter(user_id__in=candidates, expertise_area_id__in=list(own_levels))
+        .order_by()
+        .values_list("user_id", "user__date_joined", "expertise_area_id", "fame_level_id")
+    )
+    date_joined = {candidate_id: joined for candidate_id, joined, _, _ in rows}
+    profiles = _fame_profiles((candidate_id, area_id, level_id) for candidate_id, _, area_id, level_id in rows)
+
+    similar = [
+        (similarity, date_joined[candidate_id], candidate_id)
+        for candidate_id, levels in profiles.items()
+        if (similarity := _similarity(own_levels, levels)) > 0
+    ]
+    similar.sort(reverse=True)
+    similar = similar[:limit]
+    return (
+        np.fromiter((candidate_id for _, _, candidate_id in similar), np.int64, len(similar)),
+        np.fromiter((similarity for similarity, _, _ in similar), np.float64, len(similar)),
+    )
@@ -1,10 +1,16 @@
 from django import template
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
 register = template.Library()
 
 
 def _unnnest_json(textinput):
+    if "path" in textinput:
+        # serialized with the full path (see ExpertiseAreasSerializer), no need to walk the nesting:
+        return " &nbsp; <i class='fa-solid fa-arrow-right'></i> &nbsp; ".join(
+            escape(label) for label in textinput["path"]
+        )
     ret = textinput["label"]
     if textinput["parent_expertise_area"] is not None:
         ret += (
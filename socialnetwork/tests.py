@@ -1,6 +1,51 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Sum
+from django.db.utils import load_backend
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from fame.models import ExpertiseAreas, Fame, FameLevels
+from fame.serializers import ExpertiseAreasSerializer
+from fame.reference_tables import expertise_areas, fame_levels
+from famesocialnetwork.fakedata import create_fake_data
+from famesocialnetwork.library import (
+    query_budget,
+    test_paths_for_allowed_and_forbidden_users,
+    test_paths_within_query_budgets,
+)
+from socialnetwork import api, hierarchy, magic_AI, query_plans, sharding, similarity, worker, writes
+from socialnetwork.benchmarks import community_timeline, compare_to_baseline, hot_paths
+from socialnetwork.benchmarks.similar_users import similar_users_orm
+from socialnetwork.models import (
+    Bullshitters,
+    ClassificationTasks,
+    ExpertiseAreasClosure,
+    PostExpertiseAreasAndRatings,
+    Posts,
+    SocialNetworkUsers,
+    UserRatings,
+)
+from socialnetwork.reference_tables import truth_ratings
+from socialnetwork.search import (
+    IContainsSearchBackend,
+    SQLiteFTS5SearchBackend,
+    get_search_backend,
+)
+from socialnetwork.serializers import PostsSerializer
+from socialnetwork.similarity import fame_matrix
 
 
 class ViewExistsTests(TestCase):
@@ -20,3 +65,1039 @@ class ViewExistsTests(TestCase):
             users_allowed="P",
             users_forbidden="N",
         )
+
+
+class MaterializedTimelineTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        # the fixture does not contain materialized timelines:
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+
+    def assertConsistent(self, user):
+        self.assertEqual(api.check_timeline(user), {"missing": [], "unexpected": []})
+
+    def test_rebuilt_timeline_matches_query(self):
+        self.assertEqual(
+            list(api.timeline(self.user).values_list("id", flat=True)),
+            list(api._timeline_query(self.user).values_list("id", flat=True)),
+        )
+
+    def test_submit_post_fans_out(self):
+        ret, _, _ = api.submit_post(self.user, "a brand new post")
+        for follower in self.user.followed_by.all():
+            self.assertConsistent(follower)
+        self.assertConsistent(self.user)
+        self.assertEqual(api.timeline(self.user, published=ret["published"]).first().id, ret["id"])
+
+    def test_follow_and_unfollow(self):
+        other = SocialNetworkUsers.objects.exclude(id=self.user.id).exclude(
+            id__in=self.user.follows.all()
+        ).first()
+        api.follow(self.user, other)
+        self.assertConsistent(self.user)
+        api.unfollow(self.user, other)
+        self.assertConsistent(self.user)
+
+    def test_ban_user_unpublishes_entries(self):
+        followee = self.user.follows.filter(posts__published=True).first()
+        api.ban_user(followee)
+        self.assertConsistent(self.user)
+        self.assertFalse(
+            api.timeline(self.user).filter(author=followee).exists()
+        )
+
+    def test_check_detects_inconsistency(self):
+        post = Posts.objects.filter(author=self.user).first()
+        self.user.timeline_entries.filter(post=post).delete()
+        self.assertEqual(api.check_timeline(self.user)["missing"], [post.id])
+
+
+class CursorPaginationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+
+    def _all_pages(self, get_page, page_size):
+        items, cursor = api.paginate(get_page(None), page_size)
+        while cursor is not None:
+            page, cursor = api.paginate(get_page(cursor), page_size)
+            self.assertTrue(len(page) > 0)
+            items += page
+        return [item.id for item in items]
+
+    def test_timeline_pages(self):
+        self.assertEqual(
+            self._all_pages(lambda c: api.timeline(self.user, cursor=c), 7),
+            list(api.timeline(self.user).values_list("id", flat=True)),
+        )
+
+    def test_community_timeline_pages(self):
+        member = SocialNetworkUsers.objects.filter(communities__isnull=False).order_by("id").first()
+        posts = list(api.timeline(member, community_mode=True).values_list("id", flat=True))
+        self.assertTrue(len(posts) > 3)
+        self.assertEqual(
+            self._all_pages(lambda c: api.timeline(member, community_mode=True, cursor=c), 3), posts
+        )
+
+    def test_community_timeline_uses_the_indexes(self):
+        member = SocialNetworkUsers.objects.filter(communities__isnull=False).order_by("id").first()
+        plan = api.timeline(member, community_mode=True).explain()
+        for index in community_timeline.EXPECTED_INDEXES:
+            self.assertIn(index, plan)
+
+    def test_search_pages(self):
+        self.assertEqual(
+            self._all_pages(lambda c: api.search("a", cursor=c), 25),
+            list(api.search("a").values_list("id", flat=True)),
+        )
+
+    def test_follows_and_followers_pages(self):
+        self.assertEqual(
+            self._all_pages(lambda c: api.follows(self.user, cursor=c), 2),
+            list(api.follows(self.user).values_list("id", flat=True)),
+        )
+        self.assertEqual(
+            self._all_pages(lambda c: api.followers(self.user, cursor=c), 2),
+            list(api.followers(self.user).values_list("id", flat=True)),
+        )
+
+    def test_html_next_page_keeps_parameters(self):
+        self.client.login(email=self.user.email, password="test")
+        response = self.client.get("/sn/html/timeline", {"published": "False", "search": "a"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context["next_cursor"])
+        self.assertEqual(
+            QueryDict(response.context["next_page_query"]).dict(),
+            {"published": "False", "search": "a", "cursor": response.context["next_cursor"]},
+        )
+
+    def test_rest_view_pages(self):
+        self.client.login(email=self.user.email, password="test")
+        ret = self.client.get("/sn/api/posts", {"page_size": 3})
+        self.assertEqual(ret.status_code, 200)
+        self.assertEqual(len(ret.json()["results"]), 3)
+        ret = self.client.get("/sn/api/posts", {"page_size": 3, "cursor": ret.json()["next_cursor"]})
+        self.assertEqual(ret.status_code, 200)
+        self.assertEqual(
+            self.client.get("/sn/api/posts", {"cursor": "not a cursor"}).status_code, 400
+        )
+
+
+class SerializationQueryCountTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+
+    def _serialize_timeline_page(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            posts, _ = api.paginate(api.timeline(self.user), page_size)
+            data = PostsSerializer(posts, many=True).data
+        self.assertEqual(len(data), page_size)
+        return len(queries)
+
+    def test_constant_query_count(self):
+        self.assertEqual(
+            self._serialize_timeline_page(2), self._serialize_timeline_page(60)
+        )
+
+    def test_annotations_match_unannotated_serialization(self):
+        # the counters give the same citations, replies and user ratings as aggregating the rows (a rating type
+        # appears only if the post has ratings of that type):
+        call_command("repair_post_stats", stdout=StringIO())
+        # a rating with score 0 still shows its type:
+        unapproved = next(
+            post
+            for post in api.timeline(self.user)[:50]
+            if post.author != self.user and not post.userratings_set.filter(type="A").exists()
+        )
+        api.rate_post(self.user, unapproved, "A", 0)
+        posts = list(api.timeline(self.user)[:50])
+        self.assertTrue(any(len(post["user_ratings"]) < 3 for post in PostsSerializer(posts, many=True).data))
+        self.assertEqual(PostsSerializer(unapproved).data["user_ratings"].get("A"), None)
+        unapproved.refresh_from_db()
+        self.assertEqual(PostsSerializer(unapproved).data["user_ratings"]["A"], 0)
+        for post, data in zip(posts, PostsSerializer(posts, many=True).data):
+            self.assertEqual(data["citations"], Posts.objects.filter(cites=post).count())
+            self.assertEqual(data["replies"], Posts.objects.filter(replies_to=post).count())
+            self.assertEqual(
+                data["user_ratings"],
+                {
+                    rating["type"]: rating["score"]
+                    for rating in post.userratings_set.values("type").annotate(score=Sum("score"))
+                },
+            )
+
+
+
+class QueryBudgetTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        call_command("rebuild_timelines", stdout=StringIO())
+        # the first request loads the fame matrix:
+        fame_matrix.invalidate()
+
+    def test_pages_within_budget(self):
+        test_paths_within_query_budgets(
+            self,
+            {
+                "/sn/html/timeline": 10,
+                "/sn/html/timeline?search=the": 5,
+                "/sn/api/posts": 5,
+                "/sn/html/bullshitters": 22,
+                "/sn/html/similar-users": 6,
+            },
+        )
+
+    def test_follow_and_unfollow_within_budget(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        other = SocialNetworkUsers.objects.exclude(id=user.id).exclude(followed_by=user).order_by("id").first()
+        test_paths_within_query_budgets(self, {"/sn/api/follow": 12}, method="post", data={"user_id": other.id})
+        test_paths_within_query_budgets(self, {"/sn/api/unfollow": 11}, method="post", data={"user_id": other.id})
+
+    def test_exceeded_budget_reports_sql(self):
+        with self.assertRaisesRegex(AssertionError, r"2 queries executed, the budget is 1:\n1\. SELECT .*\n2\. SELECT"):
+            with query_budget(1):
+                Posts.objects.count()
+                SocialNetworkUsers.objects.count()
+
+
+class PostStatsTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        # the fixture does not contain engagement counters:
+        call_command("repair_post_stats", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.post = Posts.objects.exclude(author=self.user).first()
+
+    def test_counters_match_aggregates(self):
+        post = Posts.objects.filter(citations_count__gt=0, replies_count__gt=0).first()
+        self.assertEqual(post.citations_count, Posts.objects.filter(cites=post).count())
+        self.assertEqual(post.replies_count, Posts.objects.filter(replies_to=post).count())
+        self.assertEqual(api.recompute_post_stats(), 0)
+
+    def test_submit_post_counts_citations_and_replies(self):
+        api.submit_post(self.user, "citing", cites=self.post, replies_to=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.citations_count, Posts.objects.filter(cites=self.post).count())
+        self.assertEqual(self.post.replies_count, Posts.objects.filter(replies_to=self.post).count())
+
+    def test_rate_post_new_and_update(self):
+        old = self.post.approval_score
+        self.assertEqual(api.rate_post(self.user, self.post, "A", 5)["type"], "new")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approval_score, old + 5)
+        self.assertEqual(api.rate_post(self.user, self.post, "A", 2)["type"], "update")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approval_score, old + 2)
+        self.assertEqual(api.recompute_post_stats(), 0)
+
+    def test_repair_fixes_drift(self):
+        Posts.objects.filter(id=self.post.id).update(like_score=-42)
+        with self.assertRaises(CommandError):
+            call_command("repair_post_stats", "--check", stdout=StringIO())
+        self.assertEqual(api.recompute_post_stats(), 1)
+
+
+class FollowGraphTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        # the fixture does not contain follow counters:
+        call_command("repair_follow_counts", stdout=StringIO())
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.others = list(
+            SocialNetworkUsers.objects.exclude(id=self.user.id)
+            .exclude(id__in=self.user.follows.all())
+            .order_by("id")[:3]
+        )
+
+    def test_counters_match_follows(self):
+        self.assertEqual(self.user.follows_count, self.user.follows.count())
+        self.assertEqual(self.user.followers_count, self.user.followed_by.count())
+        self.assertEqual(api.recompute_follow_counts(), 0)
+
+    def test_membership(self):
+        followee = self.user.follows.first()
+        self.assertTrue(api.is_following(self.user, followee))
+        self.assertFalse(api.is_following(self.user, self.others[0]))
+        self.assertEqual(
+            api.followee_ids(self.user), set(self.user.follows.values_list("id", flat=True))
+        )
+
+    def test_follow_many_and_unfollow_many(self):
+        follows_count = self.user.follows_count
+        followee = self.user.follows.first()
+        # savepoint, existing follows, insert follows, 2 counter updates, posts, timeline entries, release:
+        with self.assertNumQueries(8):
+            followed = api.follow_many(self.user, [followee, *self.others])
+        self.assertEqual(followed, [other.id for other in self.others])
+        self.assertEqual(self.user.follows_count, follows_count + 3)
+        self.assertEqual(api.recompute_follow_counts(), 0)
+        self.assertEqual(api.check_timeline(self.user), {"missing": [], "unexpected": []})
+
+        self.assertEqual(api.follow_many(self.user, self.others), [])
+        self.assertEqual(api.unfollow_many(self.user, self.others), followed)
+        self.assertEqual(self.user.follows_count, follows_count)
+        self.assertEqual(api.recompute_follow_counts(), 0)
+        self.assertEqual(api.check_timeline(self.user), {"missing": [], "unexpected": []})
+
+    def test_follow_and_unfollow_signal_no_change(self):
+        self.assertEqual(api.follow(self.user, self.others[0]), {"followed": True})
+        self.assertEqual(api.follow(self.user, self.others[0]), {"followed": False})
+        self.assertEqual(api.unfollow(self.user, self.others[0]), {"unfollowed": True})
+        self.assertEqual(api.unfollow(self.user, self.others[0]), {"unfollowed": False})
+        self.assertEqual(api.recompute_follow_counts(), 0)
+
+    def test_repair_fixes_drift(self):
+        SocialNetworkUsers.objects.filter(id=self.user.id).update(followers_count=-1)
+        with self.assertRaises(CommandError):
+            call_command("repair_follow_counts", "--check", stdout=StringIO())
+        self.assertEqual(api.recompute_follow_counts(), 1)
+
+
+class SearchIndexTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        # the fixture does not contain the search index:
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+
+    def assertSameAsIContains(self, keyword, published=True):
+        self.assertEqual(
+            list(api.search(keyword, published=published).values_list("id", flat=True)),
+            list(
+                IContainsSearchBackend()
+                .search(keyword, published=published)
+                .values_list("id", flat=True)
+            ),
+        )
+
+    def test_index_matches_icontains(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTS5SearchBackend)
+        for keyword in ["the", "Whole", "petersson", "@example.com", "xyzzy", 'a "b', "ab"]:
+            self.assertSameAsIContains(keyword)
+            self.assertSameAsIContains(keyword, published=False)
+
+    def test_migrate_creates_missing_index(self):
+        # like after recreate_models_and_data.sh, whose migrations do not create the index:
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE posts_search")
+        call_command("migrate", verbosity=0)
+        self.assertIn("posts_search", connection.introspection.table_names())
+        self.assertSameAsIContains("the")
+        ret, _, _ = api.submit_post(self.user, "indexed after migrating")
+        self.assertEqual(
+            list(api.search("after migrating", published=ret["published"]).values_list("id", flat=True)), [ret["id"]]
+        )
+
+    def test_ranked(self):
+        ranked = list(api.search("the", end=9, ranked=True))
+        self.assertEqual(len(ranked), 10)
+        self.assertTrue(
+            set(post.id for post in ranked)
+            <= set(api.search("the").values_list("id", flat=True))
+        )
+
+    def test_submit_post_and_ban_keep_index_in_sync(self):
+        ret, _, _ = api.submit_post(self.user, "supercalifragilistic")
+        self.assertEqual(
+            list(api.search("califragil", published=ret["published"]).values_list("id", flat=True)),
+            [ret["id"]],
+        )
+        api.ban_user(self.user)
+        self.assertSameAsIContains("Petersson")
+        self.assertSameAsIContains("Petersson", published=False)
+
+
+class ReferenceTablesQueryTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_submit_post_does_not_query_reference_tables(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        # warm up the caches:
+        api.submit_post(user, "warm up")
+        # a post with a negative truth rating exercises T1 and T2:
+        content = Posts.objects.filter(
+            postexpertiseareasandratings__truth_rating__numeric_value__lt=0
+        ).first().content
+        with CaptureQueriesContext(connection) as queries:
+            api.submit_post(user, content)
+        for query in queries.captured_queries:
+            for table in ["fame_levels", "truth_ratings", "expertise_areas"]:
+                self.assertNotIn(f'FROM "{table}"', query["sql"])
+                self.assertNotIn(f'JOIN "{table}"', query["sql"])
+
+
+class SubmitPostTransactionTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        # warm up the reference table caches:
+        api.submit_post(self.user, "warm up")
+
+    def test_query_count(self):
+        content = "hello world"
+        self.assertEqual(len(magic_AI.classify_many([content])[0]), 2)
+        # savepoint, post, ratings, fame profile, published flag, followers, timeline entries, search index, release:
+        with self.assertNumQueries(9):
+            ret, _, _ = api.submit_post(self.user, content)
+        self.assertTrue(ret["published"])
+
+    def test_query_count_with_fame_adjustments(self):
+        # a post rated negatively in two areas lowers the fame of its author in both:
+        content = next(
+            post.content
+            for post in Posts.objects.filter(
+                postexpertiseareasandratings__truth_rating__numeric_value__lt=0
+            ).order_by("id")
+            if sum(
+                bool(epa["truth_rating"] and epa["truth_rating"].numeric_value < 0)
+                for epa in magic_AI.classify_many([post.content])[0]
+            )
+            >= 2
+        )
+        # savepoint, post, ratings, fame profile, per area: fame entry, community membership, once for the author:
+        # bullshitters (delete, negative fame entries), LSH index (profile, delete, insert), published flag,
+        # followers, timeline entries, search index, release:
+        with self.assertNumQueries(18):
+            ret, _, _ = api.submit_post(self.user, content)
+        self.assertFalse(ret["published"])
+        self.assertTrue(self.user.similarity_buckets.exists())
+        self.assertEqual(
+            set(Bullshitters.objects.filter(user=self.user).values_list("fame_id", flat=True)),
+            set(self.user.fame_set.filter(fame_level__numeric_value__lt=0).values_list("id", flat=True)),
+        )
+
+        content = Posts.objects.filter(
+            postexpertiseareasandratings__truth_rating__numeric_value__lt=0
+        ).first().content
+        posts = Posts.objects.count()
+        fame = list(self.user.fame_set.order_by("id").values_list("expertise_area_id", "fame_level_id"))
+        with mock.patch("socialnetwork.api._fan_out_post", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                api.submit_post(self.user, content)
+        self.assertEqual(Posts.objects.count(), posts)
+        self.assertEqual(
+            list(self.user.fame_set.order_by("id").values_list("expertise_area_id", "fame_level_id")), fame
+        )
+
+
+class ClassifyManyTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_batch_matches_stored_classifications(self):
+        # the fixture was classified post by post, a batch must reproduce those classifications:
+        posts = list(Posts.objects.order_by("id"))
+        expertise_areas.invalidate()
+        truth_ratings.invalidate()
+        with self.assertNumQueries(2):
+            classifications = magic_AI.classify_many([post.content for post in posts])
+        for post, classification in zip(posts, classifications):
+            self.assertEqual(
+                [(epa["expertise_area"].id, epa["truth_rating"] and epa["truth_rating"].id) for epa in classification],
+                list(
+                    post.postexpertiseareasandratings_set.order_by("id").values_list(
+                        "expertise_area_id", "truth_rating_id"
+                    )
+                ),
+            )
+
+    def test_single_matches_batch(self):
+        contents = ["a", "b", "a", "some longer content"]
+        self.assertEqual(
+            magic_AI.classify_many(contents),
+            [magic_AI.classify_into_expertise_areas_and_check_for_bullshit(c) for c in contents],
+        )
+
+    def test_classify_and_publish_many_matches_one_by_one(self):
+        contents = [f"post number {i}" for i in range(40)]
+
+        def classify_and_publish(batch):
+            with transaction.atomic():
+                user = SocialNetworkUsers.objects.get(email="a@b.de")
+                posts = [Posts.objects.create(content=content, author=user) for content in contents]
+                if batch:
+                    api.classify_and_publish_many(posts, magic_AI.classify_many(contents))
+                else:
+                    for post in posts:
+                        api.classify_and_publish(post)
+                result = (
+                    list(Posts.objects.filter(id__in=[post.id for post in posts]).values_list("id", "published")),
+                    sorted(Fame.objects.filter(user=user).values_list("expertise_area_id", "fame_level_id")),
+                    SocialNetworkUsers.objects.get(id=user.id).is_active,
+                )
+                transaction.set_rollback(True)
+            return result
+
+        self.assertEqual(classify_and_publish(batch=True), classify_and_publish(batch=False))
+
+
+class AsynchronousClassificationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.content = Posts.objects.filter(published=True).first().content
+
+    def test_pending_until_processed(self):
+        ret, expertise_areas, redirect_to_logout = api.submit_post(
+            self.user, self.content, asynchronous=True
+        )
+        self.assertEqual(ret["pending"], True)
+        self.assertEqual(expertise_areas, [])
+        self.assertFalse(Posts.objects.get(id=ret["id"]).published)
+        self.assertEqual(worker.backlog()["pending"], 1)
+
+        self.assertEqual(worker.run_worker(drain=True), 1)
+        self.assertEqual(worker.backlog()["pending"], 0)
+        self.assertEqual(worker.backlog()["done"], 1)
+
+        post = Posts.objects.get(id=ret["id"])
+        self.assertEqual(post.postexpertiseareasandratings_set.count(), 2)
+        for follower in self.user.followed_by.all():
+            self.assertEqual(api.check_timeline(follower), {"missing": [], "unexpected": []})
+
+    def test_same_classification_as_synchronous(self):
+        ret, _, _ = api.submit_post(self.user, self.content, asynchronous=True)
+        worker.run_worker(drain=True)
+        self.assertEqual(
+            list(
+                Posts.objects.get(id=ret["id"])
+                .postexpertiseareasandratings_set.values_list("expertise_area_id", "truth_rating_id")
+            ),
+            [
+                (epa["expertise_area"].id, epa["truth_rating"] and epa["truth_rating"].id)
+                for epa in magic_AI.classify_many([self.content])[0]
+            ],
+        )
+
+    def test_failed_task_is_retried(self):
+        ret, _, _ = api.submit_post(self.user, self.content, asynchronous=True)
+        with mock.patch("socialnetwork.api.classify_and_publish", side_effect=RuntimeError("boom")):
+            worker.run_worker(drain=True)
+        task = ClassificationTasks.objects.get(post_id=ret["id"])
+        self.assertEqual(task.status, ClassificationTasks.FAILED)
+        self.assertEqual(task.attempts, worker.MAX_ATTEMPTS)
+        self.assertIn("boom", task.error)
+
+
+class SimilarUsersTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        # changes of other tests were rolled back without signals:
+        fame_matrix.invalidate()
+        self.user = SocialNetworkUsers.objects.get(id=21)
+
+    def test_similarities(self):
+        similar = api.similar_users(self.user)
+        self.assertEqual(
+            [user.id for user in similar],
+            [19, 16, 20, 15, 10, 1, 13, 12, 11, 7, 4, 3, 17, 14, 9, 8, 5, 18, 6, 2],
+        )
+        self.assertEqual(
+            [user.similarity for user in similar],
+            [0.6875, 0.6875, 0.625, 0.625, 0.5625, 0.5625, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4375,
+             0.4375, 0.4375, 0.4375, 0.4375, 0.375, 0.375, 0.3125],
+        )
+        self.assertEqual([user.id for user in api.similar_users(self.user, limit=3)], [19, 16, 20])
+
+    def test_matches_orm(self):
+        for user in SocialNetworkUsers.objects.all():
+            self.assertEqual(
+                [(u.id, u.similarity) for u in api.similar_users(user)],
+                [(u.id, u.similarity) for u in similar_users_orm(user)],
+            )
+
+    def test_follows_fame_changes(self):
+        api.similar_users(self.user)
+        fame_entry = self.user.fame_set.order_by("id").first()
+        fame_entry.fame_level = FameLevels.objects.get(name="Dangerous Bullshitter")
+        fame_entry.save()
+        with self.assertNumQueries(1):
+            similar = api.similar_users(self.user)
+        self.assertEqual(
+            [(u.id, u.similarity) for u in similar],
+            [(u.id, u.similarity) for u in similar_users_orm(self.user)],
+        )
+
+    def test_approximate(self):
+        call_command("rebuild_similarity_index", stdout=StringIO())
+        exact = {user.id: user.similarity for user in api.similar_users(self.user)}
+        approximate = api.similar_users(self.user, approximate=True)
+        self.assertTrue(approximate)
+        similarities = [user.similarity for user in approximate]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+        for user in approximate:
+            self.assertEqual(user.similarity, exact[user.id])
+
+    def test_index_follows_fame_changes(self):
+        call_command("rebuild_similarity_index", stdout=StringIO())
+        content = Posts.objects.filter(
+            postexpertiseareasandratings__truth_rating__numeric_value__lt=0
+        ).first().content
+        api.submit_post(self.user, content)
+        levels = {
+            fame_entry.expertise_area_id: fame_entry.fame_level.numeric_value
+            for fame_entry in self.user.fame_set.all()
+        }
+        self.assertEqual(
+            list(self.user.similarity_buckets.order_by("band").values_list("bucket", flat=True)),
+            similarity.buckets(levels),
+        )
+
+
+class BullshittersTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _assert_projection_in_sync(self):
+        self.assertEqual(
+            set(Bullshitters.objects.values_list("fame_id", "user_id", "expertise_area_id", "fame_level_value")),
+            set(
+                Fame.objects.filter(fame_level__numeric_value__lt=0).values_list(
+                    "id", "user_id", "expertise_area_id", "fame_level__numeric_value"
+                )
+            ),
+        )
+
+    def test_projection_follows_fame_changes(self):
+        # filled while loading the fixture:
+        self._assert_projection_in_sync()
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        content = Posts.objects.filter(
+            postexpertiseareasandratings__truth_rating__numeric_value__lt=0
+        ).first().content
+        api.submit_post(user, content)
+        self._assert_projection_in_sync()
+        Fame.objects.filter(fame_level__numeric_value__lt=0).first().delete()
+        self._assert_projection_in_sync()
+
+    def test_rebuild(self):
+        Bullshitters.objects.all().delete()
+        call_command("rebuild_bullshitters", stdout=StringIO())
+        self._assert_projection_in_sync()
+
+    def test_area_pages(self):
+        area = max(api.bullshitter_areas(), key=lambda area: api.bullshitters_of_area(area).count())
+        entries = list(api.bullshitters_of_area(area))
+        self.assertTrue(len(entries) > 2)
+        self.assertEqual(
+            [(entry["user"].id, entry["fame_level_numeric"]) for entry in api.bullshitters()[area]],
+            [(entry.user_id, entry.fame_level_value) for entry in entries],
+        )
+        pages = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = api.paginate(api.bullshitters_of_area(area, cursor), 2)
+            pages += page
+            if cursor is None:
+                break
+        self.assertEqual([entry.id for entry in pages], [entry.id for entry in entries])
+
+    def test_view_pages(self):
+        self.client.force_login(SocialNetworkUsers.objects.get(email="a@b.de"))
+        area = api.bullshitter_areas().first()
+        _, cursor = api.paginate(api.bullshitters_of_area(area), 1)
+        response = self.client.get("/sn/html/bullshitters", {"area": area.id, "cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/sn/html/bullshitters", {"area": area.id, "cursor": "invalid"})
+        self.assertEqual(response.context["error"], "Invalid cursor")
+
+
+class ExpertiseAreasHierarchyTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _assert_closure_in_sync(self):
+        self.assertEqual(
+            set(ExpertiseAreasClosure.objects.values_list("ancestor_id", "descendant_id", "depth")),
+            set(hierarchy.closure_rows(dict(ExpertiseAreas.objects.values_list("id", "parent_expertise_area_id")))),
+        )
+
+    def test_closure_follows_changes(self):
+        # filled while loading the fixture:
+        self._assert_closure_in_sync()
+        sports = ExpertiseAreas.objects.get(label="Sports")
+        science = ExpertiseAreas.objects.get(label="Science")
+        sports.parent_expertise_area = science
+        sports.save()
+        self._assert_closure_in_sync()
+        with self.assertRaises(ValueError):
+            science.parent_expertise_area = ExpertiseAreas.objects.filter(parent_expertise_area=sports).first()
+            science.save()
+        ExpertiseAreas.objects.create(label="Curling", parent_expertise_area=sports)
+        science.delete()
+        self._assert_closure_in_sync()
+
+    def test_ancestors_and_descendants(self):
+        sports = ExpertiseAreas.objects.get(label="Sports")
+        children = list(ExpertiseAreas.objects.filter(parent_expertise_area=sports))
+        self.assertTrue(children)
+        self.assertEqual(set(api.expertise_area_descendants(sports)), set(children))
+        self.assertEqual(set(api.expertise_area_subtree(sports)), {sports, *children})
+        for child in children:
+            self.assertEqual(list(api.expertise_area_ancestors(child)), [sports])
+
+    def test_posts_in_subtree(self):
+        sports = ExpertiseAreas.objects.get(label="Sports")
+        areas = list(api.expertise_area_subtree(sports))
+        expected = (
+            Posts.objects.filter(postexpertiseareasandratings__expertise_area__in=areas, published=True)
+            .distinct()
+            .order_by("-submitted", "-id")
+        )
+        self.assertEqual(list(api.posts_in_expertise_area(sports)), list(expected))
+        self.assertTrue(
+            len(api.posts_in_expertise_area(sports, include_subareas=False)) < len(expected)
+        )
+
+    def test_serializer_paths(self):
+        areas = list(ExpertiseAreas.objects.all())
+        # the paths are built when the expertise areas are loaded:
+        expertise_areas.invalidate()
+        with self.assertNumQueries(1):
+            data = ExpertiseAreasSerializer(areas, many=True).data
+        for area, serialized in zip(areas, data):
+            parent, nested = area.parent_expertise_area, serialized["parent_expertise_area"]
+            self.assertEqual(serialized["path"][0], area.label)
+            while parent is not None:
+                self.assertEqual(nested["label"], parent.label)
+                parent, nested = parent.parent_expertise_area, nested["parent_expertise_area"]
+            self.assertIsNone(nested)
+
+
+class FakeDataTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Posts.objects.order_by("id").values_list("content", "author", "cites", "replies_to", "published")),
+            list(Fame.objects.order_by("id").values_list("user", "expertise_area", "fame_level")),
+            list(SocialNetworkUsers.follows.through.objects.order_by("id").values_list(
+                "from_socialnetworkusers", "to_socialnetworkusers"
+            )),
+        )
+
+    def test_data_is_consistent(self):
+        create_fake_data(users=30, posts=300, ratings_per_post=2, batch_size=64)
+        self.assertEqual(SocialNetworkUsers.objects.count(), 31)
+        self.assertEqual(Posts.objects.count(), 300)
+        self.assertEqual(Posts.objects.filter(userratings__isnull=False).distinct().count(), 300)
+        self.assertEqual(api.recompute_post_stats(), 0)
+        self.assertEqual(api.recompute_follow_counts(), 0)
+        for user in SocialNetworkUsers.objects.order_by("id")[:5]:
+            self.assertEqual(api.check_timeline(user), {"missing": [], "unexpected": []})
+        self.assertEqual(
+            Bullshitters.objects.count(), Fame.objects.filter(fame_level__numeric_value__lt=0).count()
+        )
+
+    def test_batch_size_does_not_change_data(self):
+        with transaction.atomic():
+            create_fake_data(users=30, posts=300, batch_size=1000)
+            expected = self.snapshot()
+            transaction.set_rollback(True)
+        create_fake_data(users=30, posts=300, batch_size=7)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_defaults_reproduce_the_fixture(self):
+        # compared by email, label, name and content, the ids depend on the rows the test database had before:
+        with open(os.path.join(settings.BASE_DIR, "database_dump.json")) as f:
+            fixture = json.load(f)
+        objects = {}
+        for entry in fixture:
+            objects.setdefault(entry["model"], {})[entry["pk"]] = entry["fields"]
+        emails = {pk: fields["email"] for pk, fields in objects["fame.fameusers"].items()}
+        labels = {pk: fields["label"] for pk, fields in objects["fame.expertiseareas"].items()}
+        levels = {pk: fields["name"] for pk, fields in objects["fame.famelevels"].items()}
+        contents = {pk: fields["content"] for pk, fields in objects["socialnetwork.posts"].items()}
+        expected = (
+            sorted(
+                (fields["content"], emails[fields["author"]], contents.get(fields["cites"]),
+                 contents.get(fields["replies_to"]), fields["published"])
+                for fields in objects["socialnetwork.posts"].values()
+            ),
+            sorted(
+                (emails[fields["user"]], labels[fields["expertise_area"]], levels[fields["fame_level"]])
+                for fields in objects["fame.fame"].values()
+            ),
+            sorted(
+                (emails[pk], emails[followee])
+                for pk, fields in objects["socialnetwork.socialnetworkusers"].items()
+                for followee in fields["follows"]
+            ),
+        )
+
+        create_fake_data()
+        self.assertEqual(
+            (
+                sorted(Posts.objects.values_list(
+                    "content", "author__email", "cites__content", "replies_to__content", "published"
+                )),
+                sorted(Fame.objects.values_list("user__email", "expertise_area__label", "fame_level__name")),
+                sorted(SocialNetworkUsers.follows.through.objects.values_list(
+                    "from_socialnetworkusers__email", "to_socialnetworkusers__email"
+                )),
+            ),
+            expected,
+        )
+        self.assertEqual((len(expected[0]), len(expected[1]), len(expected[2])), (400, 342, 147))
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        for cache in (expertise_areas, fame_levels, truth_ratings, fame_matrix):
+            self.addCleanup(cache.invalidate)
+
+    def test_hot_paths_results(self):
+        results = hot_paths.run(StringIO(), users=60, posts=300, repeat=3)
+        self.assertEqual(
+            set(results["cases"]),
+            {"timeline", "search", "submit_post", "rate_post", "bullshitters", "similar_users", "fame"},
+        )
+        for case in results["cases"].values():
+            self.assertLessEqual(case["min"], case["median"])
+            self.assertLessEqual(case["median"], case["p95"])
+            self.assertLessEqual(case["p95"], case["max"])
+            self.assertGreater(case["queries"], 0)
+        self.assertEqual(compare_to_baseline(results, results), [])
+
+    def test_compare_to_baseline(self):
+        baseline = {
+            "benchmark": "hot_paths", "database": "sqlite", "users": 10, "posts": 10,
+            "cases": {"timeline": {"median": 10.0, "queries": 2}, "fame": {"median": 0.5, "queries": 2}},
+        }
+        results = {
+            **baseline,
+            "cases": {
+                "timeline": {"median": 16.0, "queries": 3},
+                "fame": {"median": 1.0, "queries": 2},
+                "search": {"median": 5.0, "queries": 1},
+            },
+        }
+        self.assertEqual(
+            compare_to_baseline(results, baseline),
+            ["timeline: median 16.00 ms, baseline 10.00 ms (+60%)", "timeline: 3 queries, baseline 2"],
+        )
+        self.assertEqual(compare_to_baseline(results, baseline, tolerance=1.0), ["timeline: 3 queries, baseline 2"])
+        with self.assertRaises(ValueError):
+            compare_to_baseline({**results, "users": 20}, baseline)
+
+
+class SerializedWriteTests(SimpleTestCase):
+    def test_retries_while_locked(self):
+        attempts = []
+
+        @writes.serialized_write
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError("database is locked")
+            return "written"
+
+        with override_settings(SQLITE_WRITE_BACKOFF=0):
+            self.assertEqual(write(), "written")
+        self.assertEqual(len(attempts), 3)
+
+    def test_gives_up_and_does_not_retry_other_errors(self):
+        for error, expected_attempts in [("database is locked", 3), ("no such table: posts", 1)]:
+            attempts = []
+
+            @writes.serialized_write
+            def write():
+                attempts.append(1)
+                raise OperationalError(error)
+
+            with override_settings(SQLITE_WRITE_BACKOFF=0, SQLITE_WRITE_RETRIES=2):
+                with self.assertRaisesMessage(OperationalError, error):
+                    write()
+            self.assertEqual(len(attempts), expected_attempts)
+
+    def test_threads_take_turns(self):
+        running, overlaps = [], []
+
+        @writes.serialized_write
+        def write():
+            running.append(1)
+            overlaps.append(len(running) > 1)
+            time.sleep(0.01)
+            running.pop()
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [False] * 4)
+
+    def test_production_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profile = DatabaseWrapper(
+                {
+                    **connection.settings_dict,
+                    "NAME": os.path.join(directory, "db.sqlite3"),
+                    "OPTIONS": settings.SQLITE_PRODUCTION_OPTIONS,
+                },
+                alias="production",
+            )
+            try:
+                with profile.cursor() as cursor:
+                    pragmas = {
+                        pragma: cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+                        for pragma in ("journal_mode", "synchronous", "busy_timeout", "temp_store")
+                    }
+            finally:
+                profile.close()
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "temp_store": 2})
+
+
+def _shard_connection(alias, path):
+    return load_backend("famesocialnetwork.db.backends.sqlite3_shard").DatabaseWrapper(
+        {**connection.settings_dict, "ENGINE": "famesocialnetwork.db.backends.sqlite3_shard", "NAME": path},
+        alias=alias,
+    )
+
+
+@override_settings(SHARD_DATABASES=["shard0", "shard1"])
+class ShardingTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.directory.cleanup)
+        # the tables of the sharded models, migrated once and copied for every test:
+        cls.template = os.path.join(cls.directory.name, "template.sqlite3")
+        connections["shard0"] = _shard_connection("shard0", cls.template)
+        try:
+            call_command("migrate", database="shard0", verbosity=0)
+        finally:
+            connections["shard0"].close()
+            del connections["shard0"]
+
+    def setUp(self):
+        for alias in settings.SHARD_DATABASES:
+            path = os.path.join(self.directory.name, f"{alias}.sqlite3")
+            shutil.copyfile(self.template, path)
+            connections[alias] = _shard_connection(alias, path)
+            self.addCleanup(connections.__delitem__, alias)
+            self.addCleanup(connections[alias].close)
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+
+    def test_reshard_moves_posts_to_the_shard_of_their_author(self):
+        posts = dict(Posts.objects.values_list("id", "author_id"))
+        ratings = PostExpertiseAreasAndRatings.objects.count(), UserRatings.objects.count()
+        moved = sharding.reshard(batch_size=50)
+        self.assertEqual(sum(moved.values()), len(posts))
+        self.assertFalse(Posts.objects.exists())
+        on_shards = {}
+        for alias in settings.SHARD_DATABASES:
+            for post_id, author_id in Posts.objects.using(alias).values_list("id", "author_id"):
+                self.assertEqual(sharding.shard_for(author_id), alias)
+                on_shards[post_id] = author_id
+        self.assertEqual(on_shards, posts)
+        self.assertEqual(
+            tuple(
+                sum(model.objects.using(alias).count() for alias in settings.SHARD_DATABASES)
+                for model in (PostExpertiseAreasAndRatings, UserRatings)
+            ),
+            ratings,
+        )
+        self.assertEqual(sharding.reshard(), {})
+
+    def test_interrupted_reshard_can_be_repeated(self):
+        ratings = PostExpertiseAreasAndRatings.objects.count(), UserRatings.objects.count()
+        # interrupted after copying the first batch to its shard, before deleting it from the default database:
+        with mock.patch.object(
+            connections["default"], "constraint_checks_disabled", side_effect=OperationalError("interrupted")
+        ):
+            with self.assertRaises(OperationalError):
+                sharding.reshard(batch_size=50)
+        self.assertTrue(any(Posts.objects.using(alias).exists() for alias in settings.SHARD_DATABASES))
+        sharding.reshard(batch_size=50)
+        self.assertFalse(Posts.objects.exists())
+        self.assertEqual(
+            tuple(
+                sum(model.objects.using(alias).count() for alias in settings.SHARD_DATABASES)
+                for model in (PostExpertiseAreasAndRatings, UserRatings)
+            ),
+            ratings,
+        )
+
+    def test_timeline_and_search_merge_the_shards(self):
+        expected_timeline = list(
+            api._timeline_query(self.user).order_by("-submitted", "-id").values_list("id", flat=True)
+        )
+        expected_search = list(
+            IContainsSearchBackend().search("the").order_by("-submitted", "-id").values_list("id", flat=True)
+        )
+        sharding.reshard()
+        pages = (
+            (lambda cursor: api.timeline(self.user, cursor=cursor), expected_timeline),
+            (lambda cursor: api.search("the", cursor=cursor), expected_search),
+        )
+        for posts, expected in pages:
+            ids, cursor = [], None
+            while True:
+                page, cursor = api.paginate(posts(cursor), 7)
+                ids += [post.id for post in page]
+                if cursor is None:
+                    break
+            self.assertEqual(ids, expected)
+        self.assertEqual([post.id for post in api.timeline(self.user, start=3, end=9)], expected_timeline[3:10])
+        page = api.timeline(self.user, end=9)
+        # the serialization data is loaded with the page:
+        with self.assertNumQueries(0):
+            data = PostsSerializer(page, many=True).data
+        self.assertEqual(len(data), 10)
+        with self.assertRaises(ValueError):
+            api.timeline(self.user, community_mode=True)
+
+    def test_writes_go_to_the_shard_of_the_author(self):
+        max_id = Posts.objects.order_by("-id").first().id
+        sharding.reshard()
+        shard = sharding.shard_for(self.user.id)
+        ret, expertise_areas, _ = api.submit_post(self.user, "a sharded post")
+        post = Posts.objects.using(shard).get(id=ret["id"])
+        self.assertGreater(post.id, max_id)
+        self.assertEqual(post.postexpertiseareasandratings_set.count(), len(expertise_areas))
+        self.assertFalse(Posts.objects.filter(id=post.id).exists())
+
+        other = SocialNetworkUsers.objects.exclude(id=self.user.id).first()
+        api.rate_post(other, post, "L", 1)
+        self.assertEqual(Posts.objects.using(shard).get(id=post.id).like_score, 1)
+        self.assertTrue(UserRatings.objects.using(shard).filter(user=other, post=post).exists())
+
+        api.ban_user(self.user)
+        self.assertFalse(self.user.posts_set.filter(published=True).exists())
+        self.assertTrue(Posts.objects.using(shard).filter(author=self.user).exists())
+
+
+class QueryPlanTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_full_scans(self):
+        self.assertEqual(
+            query_plans.full_scans(connection, 'SELECT "id" FROM "posts" WHERE "content" = %s', ["hello"]),
+            [("posts", "SCAN posts")],
+        )
+        # a page of the newest posts stops early:
+        page = Posts.objects.filter(published=True).order_by("-submitted", "-id")[:10]
+        self.assertEqual(query_plans.full_scans(connection, *page.query.sql_with_params()), [])
+
+    def test_api_has_no_full_scans_of_large_tables(self):
+        checked, findings = query_plans.check_api_query_plans(max_rows=100)
+        self.assertGreater(checked, 20)
+        self.assertEqual(findings, [])
+        with self.assertRaises(CommandError):
+            call_command("check_query_plans", max_rows=0, stdout=StringIO())
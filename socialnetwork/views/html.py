@@ -1,13 +1,19 @@
 from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch, prefetch_related_objects
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 
+from fame.models import Fame
 from socialnetwork import api
 from socialnetwork.api import _get_social_network_user
 from socialnetwork.models import SocialNetworkUsers
 from socialnetwork.serializers import PostsSerializer
 
+TIMELINE_PAGE_SIZE = 50
+SIMILAR_USERS_LIMIT = 100
+BULLSHITTERS_PAGE_SIZE = 20
+
 
 @require_http_methods(["GET"])
 @login_required
@@ -24,32 +30,54 @@ def timeline(request):
     keyword = request.GET.get("search", "")
     published = request.GET.get("published", True)
     error = request.GET.get("error", None)
+    cursor = request.GET.get("cursor", None)
+    # ids of the followed users, read from the follows table only:
+    followers = api.followee_ids(_get_social_network_user(request.user))
 
     # if keyword is not empty, use search method of API:
     if keyword and keyword != "":
+        try:
+            posts, next_cursor = api.paginate(
+                api.search(keyword, published=published, cursor=cursor),
+                TIMELINE_PAGE_SIZE,
+            )
+        except ValueError as e:
+            posts, next_cursor, error = [], None, str(e)
         context = {
-            "posts": PostsSerializer(
-                api.search(keyword, published=published), many=True
-            ).data,
+            "posts": PostsSerializer(posts, many=True).data,
             "searchkeyword": keyword,
             "error": error,
-            "followers": list(api.follows(_get_social_network_user(request.user)).values_list('id', flat=True)),
+            "followers": followers,
+            "next_cursor": next_cursor,
         }
     else:  # otherwise, use timeline method of API:
-
-        context = {
-            "posts": PostsSerializer(
+        try:
+            posts, next_cursor = api.paginate(
                 api.timeline(
                     _get_social_network_user(request.user),
                     published=published,
+                    community_mode=request.session["community_mode"],
+                    cursor=cursor,
                 ),
-                many=True,
-            ).data,
+                TIMELINE_PAGE_SIZE,
+            )
+        except ValueError as e:
+            posts, next_cursor, error = [], None, str(e)
+        context = {
+            "posts": PostsSerializer(posts, many=True).data,
             "searchkeyword": "",
             "error": error,
-            "followers": list(api.follows(_get_social_network_user(request.user)).values_list('id', flat=True)),
+            "followers": followers,
+            "next_cursor": next_cursor,
         }
 
+    if next_cursor is not None:
+        # the next page keeps the parameters of this page (e.g. search, published):
+        next_page_parameters = request.GET.copy()
+        next_page_parameters.pop("error", None)
+        next_page_parameters["cursor"] = next_cursor
+        context["next_page_query"] = next_page_parameters.urlencode()
+
     return render(request, "timeline.html", context=context)
 
 
@@ -81,14 +109,19 @@ def unfollow(request):
 @require_http_methods(["GET"])
 @login_required
 def bullshitters(request):
-    # Call the API to get a dictionary mapping expertise areas to lists of users with negative fame
-    bs_data = api.bullshitters()
-    # Sort the expertise areas alphabetically for a consistent display order
-    sorted_expertise_areas = sorted(bs_data.keys(), key=lambda ea: str(ea))
-    # Prepare the context for the template, including the sorted areas and the mapping
-    bullshitters_by_area = [(area, bs_data[area]) for area in sorted_expertise_areas]
+    # one page of ranked bullshitters per expertise area, the area given by the "area" parameter continues at the
+    # "cursor" parameter:
+    error = None
+    try:
+        bullshitters_by_area = api.bullshitters_pages(
+            BULLSHITTERS_PAGE_SIZE, request.GET.get("area"), request.GET.get("cursor")
+        )
+    except ValueError as e:
+        error = str(e)
+        bullshitters_by_area = api.bullshitters_pages(BULLSHITTERS_PAGE_SIZE)
     context = {
-        "bullshitters_by_area": bullshitters_by_area,  # List of (expertise_area, entries) tuples
+        "bullshitters_by_area": bullshitters_by_area,  # List of (expertise_area, entries, next_cursor) tuples
+        "error": error,
     }
     # Render the bullshitters.html template with the context data
     return render(request, "bullshitters.html", context)
@@ -117,8 +150,12 @@ def similar_users(request):
     Display users that are similar to the current user based on expertise areas.
     """
     user = _get_social_network_user(request.user)
-    similar = api.similar_users(user)
-    
+    similar = api.similar_users(user, limit=SIMILAR_USERS_LIMIT)
+    # the template lists the fame entries of every user:
+    prefetch_related_objects(
+        similar, Prefetch("fame_set", queryset=Fame.objects.select_related("expertise_area", "fame_level"))
+    )
+
     context = {
         "similar_users": similar,
         "current_user": user,
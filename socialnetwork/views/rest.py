@@ -13,15 +13,35 @@ from socialnetwork.serializers import PostsSerializer
 class PostsListApiView(APIView):
     # check permission if user is authenticated
     permission_classes = [permissions.IsAuthenticated]
+    page_size = 50
+    max_page_size = 500
 
     # 1. List all social network posts through a GET call
     def get(self, request, *args, **kwargs):
         """
-        List all posts items
+        List the posts of the timeline page by page, pass the returned next_cursor as cursor to get the next page
         """
-        posts = timeline(_get_social_network_user(request.user))
+        try:
+            page_size = min(
+                int(request.query_params.get("page_size", self.page_size)),
+                self.max_page_size,
+            )
+            if page_size < 1:
+                raise ValueError("Invalid page size")
+            posts, next_cursor = api.paginate(
+                timeline(
+                    _get_social_network_user(request.user),
+                    cursor=request.query_params.get("cursor"),
+                ),
+                page_size,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = PostsSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(
+            {"results": serializer.data, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
+        )
 
     # 2. Create a post in the social network through a POST call
     def post(self, request, *args, **kwargs):
@@ -0,0 +1,152 @@
+"""Worker classifying posts submitted asynchronously (see api.submit_post).
+
+The queue is the classification_tasks table, so no broker is needed: a worker claims a pending task with a
+conditional UPDATE (only one worker can move a task from pending to running), classifies and publishes the post
+and marks the task done. Failed tasks are retried up to MAX_ATTEMPTS times.
+
+The (potentially slow) classifier runs concurrently, writing its results is serialized within the process on
+SQLite, where concurrent write transactions fail with "database is locked" instead of waiting for each other (see
+socialnetwork/writes.py).
+"""
+
+import threading
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from socialnetwork import api, magic_AI
+from socialnetwork.models import ClassificationTasks, TimelineEntries
+from socialnetwork.search import get_search_backend
+from socialnetwork.writes import write_lock
+
+MAX_ATTEMPTS = 3
+
+
+def claim_next_task():
+    """Claim the oldest pending task, returns None if there is none."""
+    while True:
+        task = (
+            ClassificationTasks.objects.filter(status=ClassificationTasks.PENDING)
+            .order_by("id")
+            .first()
+        )
+        if task is None:
+            return None
+        with write_lock():
+            claimed = ClassificationTasks.objects.filter(
+                id=task.id, status=ClassificationTasks.PENDING
+            ).update(
+                status=ClassificationTasks.RUNNING,
+                started=timezone.now(),
+                attempts=F("attempts") + 1,
+            )
+        if claimed:
+            task.refresh_from_db()
+            return task
+        # another worker claimed the task in the meantime, try the next one
+
+
+def process_task(task: ClassificationTasks):
+    """Classify and publish the post of a claimed task and propagate the result to timelines and search index."""
+    try:
+        post = task.post
+        _expertise_areas = magic_AI.classify_many([post.content])[0]
+        with write_lock(), transaction.atomic():
+            api.classify_and_publish(post, _expertise_areas)
+            TimelineEntries.objects.filter(post=post).update(published=post.published)
+            get_search_backend().index_posts([post])
+            task.status = ClassificationTasks.DONE
+            task.finished = timezone.now()
+            task.error = ""
+            task.save(update_fields=["status", "finished", "error"])
+    except Exception:
+        task.status = (
+            ClassificationTasks.PENDING
+            if task.attempts < MAX_ATTEMPTS
+            else ClassificationTasks.FAILED
+        )
+        task.error = traceback.format_exc()
+        with write_lock():
+            task.save(update_fields=["status", "error"])
+
+
+def process_next_task() -> bool:
+    """Claim and process one task. Returns False if there was no pending task."""
+    task = claim_next_task()
+    if task is None:
+        return False
+    process_task(task)
+    return True
+
+
+def requeue_stale_tasks(timeout: timedelta = timedelta(minutes=10)) -> int:
+    """Put tasks back into the queue that are running for longer than timeout, e.g. because their worker died."""
+    return ClassificationTasks.objects.filter(
+        status=ClassificationTasks.RUNNING, started__lt=timezone.now() - timeout
+    ).update(status=ClassificationTasks.PENDING)
+
+
+def backlog():
+    """Get the number of tasks per status and the age in seconds of the oldest pending task."""
+    counts = dict(
+        ClassificationTasks.objects.values_list("status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    oldest = ClassificationTasks.objects.filter(
+        status=ClassificationTasks.PENDING
+    ).aggregate(oldest=Min("created"))["oldest"]
+    return {
+        "pending": counts.get(ClassificationTasks.PENDING, 0),
+        "running": counts.get(ClassificationTasks.RUNNING, 0),
+        "done": counts.get(ClassificationTasks.DONE, 0),
+        "failed": counts.get(ClassificationTasks.FAILED, 0),
+        "oldest_pending_seconds": (
+            (timezone.now() - oldest).total_seconds() if oldest is not None else 0.0
+        ),
+    }
+
+
+def _work(stop: threading.Event, drain: bool, poll_interval: float, processed: list, in_thread: bool):
+    try:
+        while not stop.is_set():
+            if in_thread:
+                close_old_connections()
+            if process_next_task():
+                processed.append(1)
+            elif drain:
+                return
+            else:
+                stop.wait(poll_interval)
+    finally:
+        if in_thread:
+            connection.close()
+
+
+def run_worker(concurrency: int = 1, drain: bool = False, poll_interval: float = 1.0, stop=None):
+    """Process tasks with concurrency threads until stop is set or, if drain, until the queue is empty.
+    Returns the number of processed tasks. With concurrency 1 the tasks are processed in the calling thread."""
+    stop = stop or threading.Event()
+    processed = []
+    if concurrency == 1:
+        _work(stop, drain, poll_interval, processed, in_thread=False)
+        return len(processed)
+
+    threads = [
+        threading.Thread(target=_work, args=(stop, drain, poll_interval, processed, True), daemon=True)
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return len(processed)
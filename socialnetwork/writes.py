@@ -0,0 +1,59 @@
+"""Serialized writes for SQLite.
+
+SQLite allows a single writer at a time. Concurrent write transactions of a process's threads would only queue up
+in the database (and fail with "database is locked" once the busy timeout expires), so write functions decorated with
+serialized_write take turns on a process-wide lock instead. Writers of other processes (e.g. the classification
+worker) still compete for the database lock: a serialized write that finds the database locked is retried
+settings.SQLITE_WRITE_RETRIES times with exponential backoff.
+Other databases handle concurrent writers themselves, there the decorator does nothing. Without
+settings.SQLITE_SERIALIZE_WRITES writes are only retried.
+"""
+
+import random
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+_lock = threading.RLock()
+
+
+def _serialize() -> bool:
+    return connection.vendor == "sqlite" and getattr(settings, "SQLITE_SERIALIZE_WRITES", True)
+
+
+def write_lock():
+    """Context manager holding the process-wide write lock on SQLite, to serialize a block of writes that is not a
+    serialized_write function (the block is not retried)."""
+    return _lock if _serialize() else nullcontext()
+
+
+def _is_locked(error: OperationalError) -> bool:
+    return "database is locked" in str(error) or "database table is locked" in str(error)
+
+
+def serialized_write(function):
+    """Decorator running function under the write lock on SQLite and retrying it if the database is locked.
+    function must write in a transaction of its own, so that it can be repeated after a failed attempt. Called within
+    a transaction, function runs as part of the transaction, which the caller has to serialize (see write_lock)."""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if connection.vendor != "sqlite" or connection.in_atomic_block:
+            return function(*args, **kwargs)
+        retries = getattr(settings, "SQLITE_WRITE_RETRIES", 5)
+        backoff = getattr(settings, "SQLITE_WRITE_BACKOFF", 0.05)
+        for attempt in range(retries + 1):
+            try:
+                with write_lock():
+                    return function(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not _is_locked(e):
+                    raise
+            # the lock is released while waiting, the jitter keeps processes from retrying in lockstep:
+            time.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+    return wrapper